@@ -0,0 +1,192 @@
+"""
+A Python API to pgctl, for embedding it (in a test harness, say) without running the cli.
+
+    from pgctl.api import Playground
+
+    playground = Playground('/path/to/project')
+    result = playground.start('web', 'db')
+    print(result.service('web').status.pid)
+
+Configuration is found just as the cli finds it, starting from the given directory. Nothing is printed; failures
+come back as data (or as a CommandFailed exception, which carries that data).
+"""
+import functools
+import typing
+
+from .cli import PGCTL_DEFAULTS
+from .cli import PgctlApp
+from .config import Config
+from .config import merge
+from .configsearch import discover
+from .errors import PgctlUserMessage
+
+
+class ServiceStatus(typing.NamedTuple):
+    """A service's state, as `pgctl status --json` would report it."""
+    state: str
+    pid: typing.Optional[int]
+    exitcode: typing.Optional[int]
+    seconds: typing.Optional[int]
+    process: typing.Optional[str]
+
+
+class ServiceResult(typing.NamedTuple):
+    name: str
+    # the service's status, after the command
+    status: ServiceStatus
+    # how long the service took to change state; None if it needed no change
+    duration: typing.Optional[float]
+    # why the service failed to change state, if it did
+    failure: typing.Optional[str]
+    logfile: str
+
+    @property
+    def ok(self):
+        return self.failure is None
+
+
+class CommandResult(typing.NamedTuple):
+    command: str
+    services: typing.Tuple[ServiceResult, ...]
+
+    @property
+    def ok(self):
+        return all(service.ok for service in self.services)
+
+    @property
+    def failed(self):
+        return tuple(service for service in self.services if not service.ok)
+
+    def service(self, name):
+        """The result for the named service."""
+        for service in self.services:
+            if service.name == name:
+                return service
+        raise KeyError(name)
+
+
+class CommandFailed(PgctlUserMessage):
+    """Some services failed to change state. The whole CommandResult is at `.result`."""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+class Playground:
+    """The pgctl playground for the project at `path`.
+
+    Keyword arguments override configuration, as command-line arguments would; e.g. `Playground(pghome='/tmp/pg')`.
+    Errors that aren't about a particular service (no such service, or another pgctl holding the lock) are raised
+    as the PgctlUserMessage they would be reported as by the cli.
+    """
+
+    def __init__(self, path='.', **config):
+        pgctl_config = Config('pgctl')
+        self.config = merge((
+            PGCTL_DEFAULTS,
+            {'quiet': True},
+            pgctl_config.from_files(path),
+            pgctl_config.from_environ(),
+            config,
+        ))
+        self._discovery = discover(path, pgctl_config.projectname + '.')
+
+    @property
+    def pgdir(self):
+        """The playground directory."""
+        return self._app('status', ()).pgdir
+
+    def _app(self, command, services):
+        config = dict(self.config, command=command)
+        if services:
+            config['services'] = services
+        return PgctlApp(config, discovery=self._discovery)
+
+    def _status(self, app, service):
+        return ServiceStatus(**app._service_state(service))
+
+    def status(self, *services) -> typing.Dict[str, ServiceStatus]:
+        """The status of each of the named services (by default, the `default` alias)."""
+        app = self._app('status', services)
+        return {service.name: self._status(app, service) for service in app.services}
+
+    def _change(self, command, services, check):
+        app = self._app(command, services)
+        try:
+            getattr(app, command)()
+        except PgctlUserMessage as error:
+            if not any(change.failure for change in app.changes.values()):
+                raise
+            message = str(error)
+        else:
+            message = None
+
+        result = CommandResult(command, tuple(
+            ServiceResult(
+                name=service.name,
+                status=self._status(app, service),
+                duration=app.changes[service.name].duration if service.name in app.changes else None,
+                failure=app.changes[service.name].failure if service.name in app.changes else None,
+                logfile=service.logfile_path,
+            )
+            for service in app.services
+        ))
+        if check and message is not None:
+            raise CommandFailed(message, result)
+        return result
+
+    def start(self, *services, check=True) -> CommandResult:
+        """Start the named services; with `check`, raise CommandFailed if any fail to."""
+        return self._change('start', services, check)
+
+    def stop(self, *services, check=True) -> CommandResult:
+        """Stop the named services; with `check`, raise CommandFailed if any fail to."""
+        return self._change('stop', services, check)
+
+    def restart(self, *services, check=True) -> CommandResult:
+        """Restart the named services; with `check`, raise CommandFailed if any fail to."""
+        return self._change('restart', services, check)
+
+    def reload(self, *services, check=True) -> CommandResult:
+        """Reload the named services (restarting those with no reload-signal); with `check`, raise CommandFailed if any fail to."""
+        return self._change('reload', services, check)
+
+
+@functools.lru_cache(maxsize=None)
+def _executor():
+    # pgctl changes the working directory while it holds a service's lock, so commands can't overlap
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='pgctl')
+
+
+class AsyncPlayground:
+    """Playground, for asyncio: each method is a coroutine, run in a worker thread.
+
+    Commands from all AsyncPlaygrounds run one at a time.
+    """
+
+    def __init__(self, path='.', **config):
+        self.playground = Playground(path, **config)
+
+    async def _run(self, method, *args, **kwargs):
+        import asyncio
+        return await asyncio.get_event_loop().run_in_executor(
+            _executor(),
+            functools.partial(method, *args, **kwargs),
+        )
+
+    async def status(self, *services) -> typing.Dict[str, ServiceStatus]:
+        return await self._run(self.playground.status, *services)
+
+    async def start(self, *services, check=True) -> CommandResult:
+        return await self._run(self.playground.start, *services, check=check)
+
+    async def stop(self, *services, check=True) -> CommandResult:
+        return await self._run(self.playground.stop, *services, check=check)
+
+    async def restart(self, *services, check=True) -> CommandResult:
+        return await self._run(self.playground.restart, *services, check=check)
+
+    async def reload(self, *services, check=True) -> CommandResult:
+        return await self._run(self.playground.reload, *services, check=check)
@@ -1,7 +1,7 @@
 import argparse
 import contextlib
 import enum
-import json
+import functools
 import os
 import subprocess
 import sys
@@ -9,32 +9,30 @@ import time
 import typing
 from time import time as now
 
-import contextlib2
-from cached_property import cached_property
-from frozendict import frozendict
-from py._path.local import LocalPath as Path
-
 from .config import Config
-from .configsearch import search_parent_directories
+from .configsearch import discover
 from .debug import debug
 from .debug import trace
 from .errors import CircularAliases
 from .errors import LockHeld
 from .errors import NoPlayground
+from .errors import NotReady
 from .errors import PgctlUserMessage
 from .errors import reraise
 from .errors import Unsupervised
 from .functions import bestrelpath
+from .functions import cached_property
 from .functions import commafy
-from .functions import exec_
+from .functions import frozendict
 from .functions import JSONEncoder
 from .functions import ps
 from .functions import unique
 from .fuser import fuser
+from .service import LogRotation
 from .service import Service
+from .service import SharedLogger
+from .settings import FIELDS as SETTINGS_FIELDS
 from pgctl import __version__
-from pgctl import telemetry
-from pgctl.log_viewer import LogViewer
 
 
 XDG_RUNTIME_DIR = os.environ.get('XDG_RUNTIME_DIR') or '~/.run'
@@ -45,6 +43,8 @@ PGCTL_DEFAULTS = frozendict({
     'pgdir': 'playground',
     # where does pgdir live?
     'pghome': os.path.join(XDG_RUNTIME_DIR, 'pgctl'),
+    # where do lock files and logs live? (default: in each service directory)
+    'statedir': None,
     # which services are we acting on?
     'services': ('default',),
     # how long do we wait for them to come down/up?
@@ -60,6 +60,8 @@ PGCTL_DEFAULTS = frozendict({
     'no_force': False,
     # extra state change output?
     'verbose': False,
+    # no state change output at all? (for use as a library; see pgctl.api)
+    'quiet': False,
     # telemetry enabled?
     'telemetry': False,
     # path to clog config file (YAML format) for telemetry
@@ -68,8 +70,31 @@ PGCTL_DEFAULTS = frozendict({
     'environment_process_tracing': True,
     # enable embedded log viewer during start/stop?
     'embedded_log_viewer': True,
+    # how often may the log viewer redraw, per second?
+    'log_viewer_fps': '20',
+    # how many lines of each service's log does `pgctl log` show first?
+    'log_lines': '30',
+    # does `pgctl log` keep showing new lines? (default: if stdout is a terminal)
+    'log_follow': None,
+    # what does `pgctl log` search for, in all the logs (archives included)?
+    'log_since': None,
+    'log_until': None,
+    'log_grep': None,
+    # how do services' loggers rotate their logs, unless a service says otherwise? (see pgctl.service.LogRotation)
+    'log_archives': '5',
+    'log_archive_size': '10485760',
+    'log_total_size': None,
+    'log_compress': None,
+    # does `pgctl restart` go a few services at a time? (how many at once; each once the last is ready)
+    'rolling': None,
+    # do all of a playground's services log through one logger, rather than an s6-log each? (see pgctl.log_mux)
+    'shared_logger': False,
 })
 CHANNEL = '[pgctl]'
+# how much of their logs do we show, for services that failed to change state?
+FAILURE_LOG_LINES = 30
+# the commands pgctld can run on our behalf
+DAEMON_COMMANDS = ('status', 'start', 'stop', 'restart', 'reload')
 
 
 class StateChangeOutcome(enum.Enum):
@@ -81,6 +106,14 @@ class StateChangeOutcome(enum.Enum):
 class StateChangeResult(typing.NamedTuple):
     outcome: StateChangeOutcome
     output_message: typing.Optional[str]
+    error: typing.Optional[str] = None
+
+
+class ServiceChange(typing.NamedTuple):
+    """What became of one service's (user-facing) state change."""
+    change: str
+    duration: float
+    failure: typing.Optional[str]
 
 
 class TermStyle:
@@ -105,6 +138,21 @@ class StateChange:
     def __init__(self, service):
         self.service = service
         self.name = service.name
+        # when the change, and when its current stage, began
+        self.began = self.start_time = now()
+
+    @classmethod
+    def for_service(cls, service):
+        """The change to make to `service`."""
+        return cls(service)
+
+    def assert_complete(self):
+        """Assert that the whole change, every stage of it, has been made."""
+        return self.assert_()
+
+    def advance(self) -> bool:
+        """Once a stage of the change is made, move on to the next: False if there are no more."""
+        return False
 
 
 class Start(StateChange):
@@ -185,6 +233,221 @@ class StopLogs(StateChange):
         changed = 'stopped logger for'
 
 
+class StopWithLogs(Stop):
+    """Stop, then StopLogs: each service's logger is stopped as soon as that service is down."""
+
+    stopping_logs = False
+
+    def change(self) -> typing.Optional[str]:
+        if self.stopping_logs:
+            return self.service.stop_logs()
+        return super().change()
+
+    def assert_(self):
+        return self.service.assert_stopped(with_log_running=not self.stopping_logs)
+
+    def assert_complete(self):
+        return self.service.assert_stopped(with_log_running=False)
+
+    def fail(self):
+        if self.stopping_logs:
+            raise NotImplementedError
+        return super().fail()
+
+    def advance(self) -> bool:
+        if self.stopping_logs:
+            return False
+        self.stopping_logs = True
+        self.start_time = now()
+        # the logger is no concern of the user's
+        self.is_user_facing = False
+        self.strings = StopLogs.strings
+        return True
+
+
+class Restart(Start):
+    """Stop, then Start: each service is started again as soon as it's down, without waiting for the others."""
+
+    def __init__(self, service, was_up=True):
+        super().__init__(service)
+        if was_up:
+            # until the service is down
+            self.stop = Stop(service)
+            self.strings = Stop.strings
+        else:
+            # there's nothing to stop, nor to report stopped
+            self.stop = None
+            self.strings = Start.strings
+
+    def change(self) -> typing.Optional[str]:
+        if self.stop is not None:
+            return self.stop.change()
+        return super().change()
+
+    def assert_(self):
+        if self.stop is not None:
+            return self.stop.assert_()
+        return super().assert_()
+
+    @classmethod
+    def for_service(cls, service):
+        was_up = service.svstat().state in ('up', 'ready')
+        if was_up and service.settings.restart_mode == 'replace':
+            return Replace(service)
+        return cls(service, was_up)
+
+    def assert_complete(self):
+        raise NotReady('there is no short cut to a restart')
+
+    def get_timeout(self):
+        if self.stop is not None:
+            return self.stop.get_timeout()
+        return super().get_timeout()
+
+    def fail(self):
+        if self.stop is not None:
+            return self.stop.fail()
+        return super().fail()
+
+    def advance(self) -> bool:
+        if self.stop is None:
+            return False
+        self.stop = None
+        self.start_time = now()
+        self.strings = Start.strings
+        return True
+
+    class strings:
+        change = 'restart'
+        changing = 'Restarting:'
+        changed = 'restarted'
+
+
+class Replace(StateChange):
+    """Restart without a gap: start a second instance of the service, and stop the first once the second is ready.
+
+    This is `restart-mode: replace`, for services that can share their sockets with another instance (SO_REUSEPORT).
+    """
+
+    # the stages: the replacement starts, the original stops, and the replacement takes its place
+    STAGES = ('start', 'retire', 'adopt')
+
+    def __init__(self, service):
+        super().__init__(service)
+        self.stage = 'start'
+        self.replica = None
+        self.adopted = False
+
+    def change(self) -> typing.Optional[str]:
+        if self.stage == 'start':
+            if self.replica is None:
+                self.replica = self.service.start_replacement()
+        elif self.stage == 'retire':
+            self.service.stop()
+        elif not self.adopted:
+            self.service.adopt_replacement(self.replica)
+            self.adopted = True
+        return None
+
+    def assert_(self):
+        if self.stage == 'start':
+            return self.service.assert_replacement_ready(self.replica)
+        elif self.stage == 'retire':
+            return self.service.assert_replaced()
+        return self.service.assert_ready()
+
+    def assert_complete(self):
+        raise NotReady('there is no short cut to a restart')
+
+    def get_timeout(self):
+        if self.stage == 'retire':
+            return self.service.timeout_stop
+        return self.service.timeout_ready
+
+    def fail(self):
+        if self.stage == 'start':
+            # the original carries on, as if we'd never tried
+            self.service.abandon_replacement(self.replica)
+            raise NotReady('its replacement was not ready in time, so we stopped it: the original is still running')
+        elif self.stage == 'retire':
+            return self.service.force_cleanup_replaced()
+        else:  # adopt
+            raise NotReady('its replacement took its place, but is no longer ready')
+
+    def advance(self) -> bool:
+        stage = self.STAGES.index(self.stage) + 1
+        if stage == len(self.STAGES):
+            return False
+        self.stage = self.STAGES[stage]
+        self.start_time = now()
+        self.strings = self.stage_strings[self.stage]
+        return True
+
+    is_user_facing = True
+
+    class strings:
+        change = 'replace'
+        changing = 'Starting replacement:'
+        changed = 'started replacement'
+
+    class retire_strings:
+        change = 'stop'
+        changing = 'Stopping original:'
+        changed = 'stopped original'
+
+    class adopt_strings:
+        change = 'start'
+        changing = 'Replacing:'
+        changed = 'replaced'
+
+    stage_strings = {'start': strings, 'retire': retire_strings, 'adopt': adopt_strings}
+
+
+class Reload(StateChange):
+    """Signal the service to reload, in place, then wait for it to be ready."""
+
+    signalled_at = None
+    # where the service notifies us that it has reloaded, if it does
+    notification = None
+
+    def change(self) -> typing.Optional[str]:
+        if self.signalled_at is None:
+            if self.notification is None:
+                self.notification = self.service.listen_for_reload()
+            self.service.reload()
+            self.signalled_at = now()
+        return None
+
+    def assert_(self):
+        if self.signalled_at is None:
+            raise NotReady('it has not yet been signalled to reload')
+        self.service.assert_reloaded(self.signalled_at, self.notification)
+        self._stop_listening()
+
+    def _stop_listening(self):
+        if self.notification is not None:
+            self.service.stop_listening_for_reload(self.notification)
+            self.notification = None
+
+    def assert_complete(self):
+        raise NotReady('there is no short cut to a reload')
+
+    def get_timeout(self):
+        return self.service.timeout_ready
+
+    def fail(self):
+        self._stop_listening()
+        # it's still running, perhaps with its old configuration: that's better than nothing
+        raise NotImplementedError
+
+    is_user_facing = True
+
+    class strings:
+        change = 'reload'
+        changing = 'Reloading:'
+        changed = 'reloaded'
+
+
 def unbuf_print(*args, **kwargs):
     """Print unbuffered in utf8."""
     kwargs.setdefault('file', sys.stdout)
@@ -228,8 +491,12 @@ def error_message_on_timeout(service, error, action_name, actual_timeout_length,
 
 class PgctlApp:
 
-    def __init__(self, config=PGCTL_DEFAULTS):
+    def __init__(self, config=PGCTL_DEFAULTS, discovery=None):
         self.pgconf = frozendict(config)
+        # the result of configsearch.discover, if our caller already walked up the tree
+        self._discovery = discovery
+        # service name -> ServiceChange, for each service this app has changed
+        self.changes = {}
 
     def __call__(self):
         """Run the app."""
@@ -239,16 +506,18 @@ class PgctlApp:
         command = getattr(self, command)
 
         start = time.time()
-        telemetry.emit_event('command_run', {'command': self.pgconf['command'], 'config': dict(self.pgconf)})
+        self._emit_event('command_run', {'command': self.pgconf['command'], 'config': dict(self.pgconf)})
 
         try:
             result = command()
         except PgctlUserMessage as error:
             # we don't need or want a stack trace for user errors
             result = str(error)
+        finally:
+            self._save_index()
 
         if isinstance(result, str):
-            telemetry.emit_event(
+            self._emit_event(
                 'command_errored',
                 {
                     'command': self.pgconf['command'],
@@ -259,7 +528,7 @@ class PgctlApp:
             )
             return CHANNEL + ' ERROR: ' + result
         else:
-            telemetry.emit_event(
+            self._emit_event(
                 'command_succeeded',
                 {
                     'command': self.pgconf['command'],
@@ -270,6 +539,17 @@ class PgctlApp:
             )
             return result
 
+    def _save_index(self):
+        # once per command, rather than once per service whose settings it (re)parsed
+        if 'index' in vars(self):
+            self.index.save()
+
+    def _emit_event(self, event_name, attributes):
+        # telemetry is rarely enabled, and its imports are slow
+        if self.pgconf.get('telemetry'):
+            from pgctl import telemetry
+            telemetry.emit_event(event_name, attributes)
+
     @contextlib.contextmanager
     def playground_locked(self):
         """Lock the entire playground."""
@@ -279,14 +559,14 @@ class PgctlApp:
                 (bestrelpath(path), ps(fuser(path)))
             ))
 
-        with contextlib2.ExitStack() as context:
+        with contextlib.ExitStack() as context:
             for service in self.services:
                 service.ensure_exists()
 
                 # This lock represents a pgctl cli interacting with the service.
                 from .flock import flock
                 lock = context.enter_context(flock(
-                    service.path.join('.pgctl.lock').strpath,
+                    service.ensure_lock(),
                     on_fail=on_lock_held,
                 ))
                 from .flock import set_fd_inheritable
@@ -296,37 +576,47 @@ class PgctlApp:
 
     @property
     def log_viewer_enabled(self):
-        return (
+        return not self.pgconf.get('quiet') and (
             self.pgconf.get('force_enable_log_viewer') == '1' or
             (self.pgconf['embedded_log_viewer'] and sys.stdin.isatty() and not os.environ.get('CI'))
         )
 
-    def __change_state(self, state, services):
-        """Changes the state of a supervised service using the svc command"""
-        with self.playground_locked():
+    def _print(self, *args):
+        if not self.pgconf.get('quiet'):
+            pgctl_print(*args)
+
+    def __change_state(self, state, services, concurrency=None):
+        """Changes the state of a supervised service using the svc command
+
+        With a `concurrency`, only that many services change at once: each of the rest once another has changed,
+        and none after any fails.
+        """
+        run_post_stop_hook = False
+        with contextlib.ExitStack() as locked:
+            locked.enter_context(self.playground_locked())
             for service in services:
                 try:
-                    state(service).assert_()
+                    state.for_service(service).assert_complete()
                 except PgctlUserMessage:
                     break
             else:
                 # Short-circuit, everything is in the correct state.
                 if self._should_display_state(state):
-                    pgctl_print('Already {}: {}'.format(
+                    self._print('Already {}: {}'.format(
                         state.strings.changed,
                         commafy(_services_to_names(services))),
                     )
                 return []
 
-        # If we're starting a service, run the playground-wide "pre-start" hook (if it exists).
-        # This is intentionally done without holding a lock, since this might be very slow.
-        if state is Start:
-            self._run_playground_wide_hook('pre-start')
+            # If we're starting a service, run the playground-wide "pre-start" hook (if it exists).
+            # This is intentionally done without holding a lock, since this might be very slow.
+            if issubclass(state, Start):
+                locked.close()
+                self._run_playground_wide_hook('pre-start')
+                locked.enter_context(self.playground_locked())
 
-        run_post_stop_hook = False
-        with self.playground_locked():
-            failures = self.__locked_change_state(state, services)
-            if state is Stop:
+            failures = self.__locked_change_state(state, services, concurrency)
+            if issubclass(state, Stop):
                 run_post_stop_hook = all(
                     service.state['state'] == 'down'
                     for service in self.all_services
@@ -339,21 +629,29 @@ class PgctlApp:
 
         return failures
 
-    def __locked_change_state(self, state, services):
+    def __locked_change_state(self, state, services, concurrency=None):
         """the critical section of __change_state"""
         log_viewer = None
         if self._should_display_state(state):
-            pgctl_print(
+            self._print(
                 state.strings.changing,
                 commafy(_services_to_names(services)),
             )
             if self.log_viewer_enabled:
-                log_viewer = LogViewer(20, {service.name: service.logfile_path for service in services})
+                from .log_viewer import LogViewer
+                log_viewer = LogViewer(
+                    20,
+                    {service.name: service.logfile_path for service in services},
+                    max_fps=float(self.pgconf['log_viewer_fps']),
+                )
 
         try:
-            services = [state(service) for service in services]
+            services = [state.for_service(service) for service in services]
+            # services waiting their turn, if only so many may change at once
+            queue = []
+            if concurrency is not None:
+                services, queue = services[:concurrency], services[concurrency:]
             failed = []
-            start_time = now()
             while services:
                 for service in services:
                     try:
@@ -362,43 +660,67 @@ class PgctlApp:
                         pass  # handled in state assertion, below
                     else:
                         if message:
-                            pgctl_print(message)
+                            self._print(message)
 
                 changes_to_print = []
 
                 services_to_change = tuple(services)
                 for service in services_to_change:
-                    state_change_result = self.__locked_handle_service_change_state(
-                        state,
-                        service,
-                        start_time,
-                    )
+                    state_change_result = self.__locked_handle_service_change_state(service)
 
                     if state_change_result.outcome is StateChangeOutcome.RECHECK_NEEDED:
                         # This service should be rechecked by the next iteration
                         # of the outer loop
                         pass
                     elif state_change_result.outcome is StateChangeOutcome.SUCCESS:
-                        services.remove(service)
-                        if log_viewer is not None:
+                        self._record_change(service, None)
+                        was_user_facing = service.is_user_facing
+                        if self._should_display_state(service):
+                            changes_to_print.append(f'[pgctl] {service.strings.changed.capitalize()}: {service.name}')
+                            if service.is_user_facing:
+                                state_change_message = (service.service.message(service) or '').strip()
+                                if state_change_message:
+                                    changes_to_print.append(state_change_message)
+                        if service.advance():
+                            # straight on to its next stage, without waiting for the other services
+                            if self._should_display_state(service):
+                                changes_to_print.append(f'[pgctl] {service.strings.changing} {service.name}')
+                        else:
+                            services.remove(service)
+                        if log_viewer is not None and was_user_facing and not (
+                                service in services and service.is_user_facing
+                        ):
                             log_viewer.stop_tailing(service.name)
-                        if self._should_display_state(state):
-                            changes_to_print.append(f'[pgctl] {state.strings.changed.capitalize()}: {service.name}')
-                            state_change_message = (service.service.message(state) or '').strip()
-                            if state_change_message:
-                                changes_to_print.append(state_change_message)
                     else:
                         # StateChangeOutcome.FAILURE
+                        self._record_change(service, state_change_result.error)
                         failed.append(service.name)
                         services.remove(service)
-                        if log_viewer is not None:
+                        if log_viewer is not None and service.is_user_facing:
                             log_viewer.stop_tailing(service.name)
 
                     if state_change_result.output_message:
                         changes_to_print.append(state_change_result.output_message)
 
+                if queue and failed:
+                    changes_to_print.append('[pgctl] Not {} {}, after a failure'.format(
+                        state.strings.changing.lower().rstrip(':'),
+                        commafy(service.name for service in queue),
+                    ))
+                    queue = []
+                while queue and len(services) < concurrency:
+                    service = queue.pop(0)
+                    service.began = service.start_time = now()
+                    services.append(service)
+
                 if log_viewer is not None:
-                    if len(changes_to_print) > 0 or log_viewer.redraw_needed():
+                    # the rest (if any) are on to later stages, which we don't show
+                    waiting = [service for service in services if service.is_user_facing]
+                    title = 'Still {} {}'.format(
+                        state.strings.changing.lower(),
+                        ', '.join(sorted(service.name for service in waiting)),
+                    )
+                    if changes_to_print:
                         # It's a bit awkward to build up strings like this but printing just a single
                         # time greatly improves the user experience by reducing flashing when the
                         # screen is cleared.
@@ -408,19 +730,19 @@ class PgctlApp:
                         for change in changes_to_print:
                             to_print += change + '\n'
 
-                        if services:
-                            to_print += log_viewer.draw_logs(
-                                'Still {} {}'.format(
-                                    state.strings.changing.lower(),
-                                    ', '.join(sorted(service.name for service in services)),
-                                ),
-                            )
+                        if waiting:
+                            to_print += log_viewer.draw_logs(title)
 
                         print(to_print, flush=True, end='', file=sys.stderr)
+                    elif waiting and log_viewer.redraw_needed():
+                        # only new log lines: rewrite just the rows that changed
+                        print(log_viewer.update_logs(title), flush=True, end='', file=sys.stderr)
 
-                    if not services:
+                    if not waiting:
                         pgctl_print(f'All services have {state.strings.changed}')
-                else:
+                        log_viewer.cleanup()
+                        log_viewer = None
+                elif not self.pgconf.get('quiet'):
                     for change in changes_to_print:
                         unbuf_print(change, file=sys.stderr)
 
@@ -431,12 +753,7 @@ class PgctlApp:
 
         return failed
 
-    def __locked_handle_service_change_state(
-        self,
-        state,
-        service,
-        start_time,
-    ):
+    def __locked_handle_service_change_state(self, service):
         """Handles a state change for a service and returns whether
         the state change was successful,
         """
@@ -445,10 +762,8 @@ class PgctlApp:
             service.assert_()
         except PgctlUserMessage as error:
             state_change_result = self.__locked_handle_state_change_exception(
-                state,
                 service,
                 error,
-                start_time,
                 check_time,
             )
             return state_change_result
@@ -459,17 +774,15 @@ class PgctlApp:
 
     def __locked_handle_state_change_exception(
         self,
-        state,
         service,
         error,
-        start_time,
         check_time,
     ) -> StateChangeResult:
         """Handles a state change timeout for a service and returns whether
         the service unrecoverably failed its state change.
         """
         curr_time = now()
-        if timeout(service, start_time, check_time, curr_time):
+        if timeout(service, service.start_time, check_time, curr_time):
             if not self.pgconf['no_force']:
                 try:
                     message = service.fail()
@@ -478,31 +791,39 @@ class PgctlApp:
                     return StateChangeResult(StateChangeOutcome.RECHECK_NEEDED, message)
                 except NotImplementedError:
                     pass
+                except PgctlUserMessage as failure:  # it's given up, and says why
+                    error = failure
 
             return StateChangeResult(
                 StateChangeOutcome.FAILURE,
                 error_message_on_timeout(
                     service,
                     error,
-                    state.strings.change,
-                    actual_timeout_length=curr_time - start_time,
+                    service.strings.change,
+                    actual_timeout_length=curr_time - service.start_time,
                     check_length=curr_time - check_time,
                 ),
+                error=str(error),
             )
 
         return StateChangeResult(StateChangeOutcome.RECHECK_NEEDED, None)
 
     def _should_display_state(self, state):
-        return state.is_user_facing or self.pgconf['verbose']
+        return not self.pgconf.get('quiet') and (state.is_user_facing or self.pgconf['verbose'])
+
+    def _record_change(self, service, failure):
+        if service.is_user_facing:
+            # the whole change, not just its latest stage
+            self.changes[service.name] = ServiceChange(service.strings.change, now() - service.began, failure)
 
     def _run_playground_wide_hook(self, hook_name):
         """Runs the given playground-wide hook, if it exists."""
         try:
-            path = self.pgdir.join(hook_name)
-            if path.exists():
+            path = os.path.join(self.pgdir, hook_name)
+            if os.path.exists(path):
                 subprocess.check_call(
-                    (path.strpath,),
-                    cwd=self.pgdir.dirname,
+                    (path,),
+                    cwd=os.path.dirname(self.pgdir),
                 )
         except NoPlayground:
             # services can exist without a playground;
@@ -513,22 +834,30 @@ class PgctlApp:
         """return a similar PgctlApp, but with a different set of services"""
         newconf = dict(self.pgconf)
         newconf['services'] = services
-        return PgctlApp(newconf)
+        return PgctlApp(newconf, discovery=self._discovery)
 
     def __show_failure(self, state, failed):
         if not failed:
             return
 
         failapp = self.with_services(failed)
-        subprocess.call(failapp._log_command(), stdout=sys.stderr)
-        if state == 'start':
-            # we don't want services that failed to start to be 'up'
-            failapp.stop()
+        if not self.pgconf.get('quiet'):
+            from .logs import show_tails
+            sys.stderr.flush()
+            show_tails(
+                [bestrelpath(service.logfile_path) for service in failapp.services],
+                FAILURE_LOG_LINES,
+                sys.stderr.buffer,
+            )
+        # we don't want services that failed to start (or to restart) to be 'up'
+        failed_to_start = [name for name in failed if name in self.changes and self.changes[name].change == 'start']
+        if failed_to_start:
+            self.with_services(failed_to_start).stop()
 
-        pgctl_print()
-        pgctl_print('There might be useful information further up in the log; you can view it by running:')
+        self._print()
+        self._print('There might be useful information further up in the log; you can view it by running:')
         for service in failapp.services:
-            pgctl_print('    less +G {}'.format(bestrelpath(service.path.join('logs', 'current').strpath)))
+            self._print('    less +G {}'.format(bestrelpath(service.logfile_path)))
 
         raise PgctlUserMessage(f'Some services failed to {state}: {commafy(failed)}')
 
@@ -545,17 +874,9 @@ class PgctlApp:
         want to leave the logger running (since poll-ready may still be writing
         log messages).
         """
-        failed = self.__change_state(Stop, self.services)
-
-        if not with_log_running:
-            failed_set = set(failed)
-            services_to_stop_logs_on = [
-                service for service in self.services
-                if service.name not in failed_set
-            ]
-            failed.extend(
-                self.__change_state(StopLogs, services_to_stop_logs_on),
-            )
+        failed = self.__change_state(Stop if with_log_running else StopWithLogs, self.services)
+        if not with_log_running and self.shared_logger is not None:
+            self.shared_logger.stop_if_idle(float(self.pgconf['timeout']))
 
         return self.__show_failure('stop', failed)
 
@@ -563,9 +884,14 @@ class PgctlApp:
         """Retrieve the PID and state of a service or group of services"""
         status = {}
         for service in self.services:
-            status[service.name] = service.state
+            status[service.name] = self._service_state(service)
 
         if self.pgconf['json']:
+            for service in self.services:
+                usage = service.log_pipe_usage()
+                status[service.name]['log_pipe'] = None if usage is None else usage._asdict()
+
+            import json
             print(json.dumps(
                 status,
                 sort_keys=True,
@@ -599,41 +925,100 @@ class PgctlApp:
                 if components:
                     unbuf_print('   └─ {}'.format(', '.join(components)))
 
+    def _service_state(self, service):
+        return service.state
+
     def restart(self):
-        """Starts and stops a service"""
-        self.stop(with_log_running=True)
-        self.start()
+        """Stops and starts a service or group of services: each is started as soon as it's down"""
+        up = self._restart_stops_the_playground()
+        if up:
+            # the post-stop hook runs only once everything is down, and before anything starts again
+            failed = self.__change_state(Stop, up)
+            if not failed:
+                failed = self.__change_state(Start, self.services)
+        else:
+            failed = self.__change_state(Restart, self.services, self.rolling)
+        return self.__show_failure('restart', failed)
 
-    def reload(self):
-        """Reloads the configuration for a service"""
-        pgctl_print('reload:', commafy(self.service_names))
-        raise PgctlUserMessage('reloading is not yet implemented.')
-
-    def _log_command(self, interactive: bool = False) -> typing.Tuple[str]:
-        # TODO(p3): -n: send the value to tail -n
-        # TODO(p3): -f: force iteractive behavior
-        # TODO(p3): -F: force iteractive behavior off
-        tail = ('tail', '-n', '30', '--verbose')  # show file headers
-
-        if interactive:
-            # we're interactive; give a continuous log
-            # TODO-TEST: pgctl log | pb should be non-interactive
-            tail += ('--follow=name', '--retry')
-
-        logfiles = []
-        for service in self.services:
-            service.ensure_logs()
-            logfile = service.path.join('logs', 'current')
-            logfile = bestrelpath(str(logfile))
-            logfiles.append(logfile)
+    def _restart_stops_the_playground(self):
+        """The services that are up, if restarting would take them all down and the playground has a post-stop hook.
+
+        A restart normally starts each service as soon as it's down, so the playground is never fully stopped.
+        """
+        try:
+            if not os.path.exists(os.path.join(self.pgdir, 'post-stop')):
+                return []
+        except NoPlayground:
+            return []
+        if self.rolling is not None:
+            return []
+        restarting = {service.name for service in self.services}
+        up = [service for service in self.all_services if service.svstat().state in ('up', 'ready')]
+        if all(service.name in restarting and service.settings.restart_mode != 'replace' for service in up):
+            return up
+        return []
+
+    @cached_property
+    def rolling(self):
+        """How many services `restart` changes at once; None for all of them."""
+        value = self.pgconf['rolling']
+        if value is None:
+            return None
+        try:
+            rolling = int(value)
+        except ValueError:
+            rolling = 0
+        if rolling < 1:
+            raise PgctlUserMessage(f'Bad value for rolling: {value!r} (it should be a number of services, at least 1)')
+        return rolling
 
-        return tail + tuple(logfiles)
+    def reload(self):
+        """Reloads the configuration for a service: by its reload signal, if it has one; otherwise by restarting it"""
+        reloadable = [
+            service for service in self.services
+            if service.settings.reload_signal is not None and service.svstat().state in ('up', 'ready')
+        ]
+        failed = []
+        if reloadable:
+            failed += self.__change_state(Reload, reloadable)
+        others = [service for service in self.services if service not in reloadable]
+        if others:
+            failed += self.__change_state(Restart, others, self.rolling)
+        return self.__show_failure('reload', failed)
 
     def log(self, interactive=None):
         """Displays the stdout and stderr for a service or group of services"""
+        if interactive is None:
+            interactive = self.pgconf['log_follow']
         if interactive is None:
             interactive = sys.stdout.isatty()
-        exec_(self._log_command(interactive))  # never returns
+
+        name_to_path = {}
+        for service in self.services:
+            service.ensure_logs()
+            name_to_path[service.name] = service.logfile_path
+
+        from . import logs
+        since, until, grep = self.pgconf['log_since'], self.pgconf['log_until'], self.pgconf['log_grep']
+        if since is not None or until is not None or grep is not None:
+            show = functools.partial(
+                logs.search,
+                since=None if since is None else logs.parse_time(since),
+                until=None if until is None else logs.parse_time(until),
+                grep=None if grep is None else _compile_grep(grep),
+            )
+        elif interactive:
+            show = functools.partial(logs.follow, count=int(self.pgconf['log_lines']))
+        else:
+            show = functools.partial(logs.show, count=int(self.pgconf['log_lines']))
+
+        try:
+            show(name_to_path, out=sys.stdout.buffer)
+        except KeyboardInterrupt:
+            pass
+        except BrokenPipeError:
+            # e.g. `pgctl log | head`; don't complain as we exit, either
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
     def debug(self):
         """Allow a service to run in the foreground"""
@@ -658,28 +1043,84 @@ class PgctlApp:
     def service_by_name(self, service_name):
         """Return an instantiated Service, by name."""
         if os.path.isabs(service_name):
-            path = Path(service_name)
+            path = os.path.normpath(service_name)
+            index = None
         else:
-            path = self.pgdir.join(service_name, abs=1)
+            path = os.path.normpath(os.path.join(self.pgdir, service_name))
+            index = self.index if os.path.dirname(path) == self.pgdir else None
+        # only the playground's own services share its logger
+        shared_logger = self.shared_logger if index is not None else None
         return Service(
             path=path,
-            scratch_dir=self.pghome.join(path.relto('/'), abs=1),
+            scratch_dir=_rebase(self.pghome, path),
             default_timeout=self.pgconf['timeout'],
             environment_tracing_enabled=self.pgconf['environment_process_tracing'],
+            state_dir=(
+                None if self.statedir is None
+                else _rebase(self.statedir, path)
+            ),
+            playground_index=index,
+            default_log_rotation=self.log_rotation,
+            shared_logger=shared_logger,
         )
 
+    @cached_property
+    def log_rotation(self):
+        rotation = {}
+        for field in LogRotation._fields:
+            value = self.pgconf['log_' + field]
+            if value is None:
+                continue
+            _, parse = SETTINGS_FIELDS['log_' + field]
+            try:
+                rotation[field] = parse(value)
+            except ValueError:
+                raise PgctlUserMessage(f'Bad value for log_{field}: {value!r}')
+        return LogRotation(**rotation)
+
+    @cached_property
+    def shared_logger(self):
+        """The playground's one logger, if its services share one."""
+        if self.pgconf['shared_logger'] in (False, None, 'false', '0', ''):
+            return None
+        try:
+            return SharedLogger(os.path.join(self.playground_home, 'logger'))
+        except NoPlayground:
+            return None
+
     @cached_property
     def services(self):
         """Return a tuple of the services for a command
 
         :return: tuple of Service objects
         """
-        services = [
-            self.service_by_name(service_name)
-            for alias in self.pgconf['services']
+        names = list(self.pgconf['services'])
+        try:
+            index = self.index
+        except NoPlayground:
+            # services can be given by absolute path, without a playground
+            service_names = self._expand_all_aliases(names)
+        else:
+            aliases = self.pgconf['aliases']
+            encoded_aliases = JSONEncoder().encode(aliases)
+            service_names = [
+                service_name
+                for name in names
+                for service_name in (
+                    index.expand_alias(encoded_aliases, name, self._expand_aliases)
+                    if name in aliases or name == ALL_SERVICES else
+                    (name,)
+                )
+            ]
+
+        return unique(self.service_by_name(service_name) for service_name in service_names)
+
+    def _expand_all_aliases(self, names):
+        return [
+            service_name
+            for alias in names
             for service_name in self._expand_aliases(alias)
         ]
-        return unique(services)
 
     def _expand_aliases(self, name):
         aliases = self.pgconf['aliases']
@@ -690,7 +1131,7 @@ class PgctlApp:
         while stack:
             name = stack.pop()
             if name == ALL_SERVICES:
-                result.extend([service.name for service in self.all_services])
+                result.extend(self.index.service_names)
             elif name in visited:
                 raise CircularAliases("Circular aliases! Visited twice during alias expansion: '%s'" % name)
             else:
@@ -709,14 +1150,30 @@ class PgctlApp:
         :return: list of Service objects
         :rtype: list
         """
-        pgdir = self.pgdir.listdir(sort=True)
-
         return tuple(
-            self.service_by_name(service_path.basename)
-            for service_path in pgdir
-            if service_path.check(dir=True)
+            self.service_by_name(service_name)
+            for service_name in self.index.service_names
         )
 
+    @cached_property
+    def index(self):
+        """The compiled index of the playground, cached in pghome."""
+        from .playground_index import PlaygroundIndex
+        return PlaygroundIndex(
+            self.pgdir,
+            os.path.join(self.playground_home, '.pgctl-index.json'),
+        )
+
+    @cached_property
+    def playground_home(self):
+        """Where we keep state about the playground as a whole: its mirror under pghome."""
+        return _rebase(self.pghome, self.pgdir)
+
+    @cached_property
+    def daemon_socket(self):
+        """Where pgctld listens, if it's running for this playground."""
+        return os.path.join(self.playground_home, 'pgctld.sock')
+
     @cached_property
     def service_names(self):
         return _services_to_names(self.services)
@@ -724,10 +1181,18 @@ class PgctlApp:
     @cached_property
     def pgdir(self):
         """Retrieve the set playground directory"""
-        for parent in search_parent_directories():
-            pgdir = Path(parent).join(self.pgconf['pgdir'], abs=1)
-            if pgdir.check(dir=True):
-                return pgdir
+        if self._discovery is None:
+            self._discovery = discover()
+
+        name = self.pgconf['pgdir']
+        for level in self._discovery:
+            if os.sep in name:
+                # a nested or absolute path: we need to look
+                pgdir = os.path.normpath(os.path.join(level.path, name))
+                if os.path.isdir(pgdir):
+                    return pgdir
+            elif name in level.directories:
+                return os.path.join(level.path, name)
         raise NoPlayground(
             "could not find any directory named '%s'" % self.pgconf['pgdir']
         )
@@ -738,7 +1203,19 @@ class PgctlApp:
 
         By default, this is "$XDG_RUNTIME_DIR/pgctl".
         """
-        return Path(self.pgconf['pghome'], expanduser=True)
+        return os.path.abspath(os.path.expanduser(self.pgconf['pghome']))
+
+    @cached_property
+    def statedir(self):
+        """Retrieve the directory for lock files and logs, if configured.
+
+        Setting this to a local disk (e.g. the same as pghome) avoids network filesystem
+        round-trips on every flock, stat and log write.
+        """
+        if self.pgconf.get('statedir') is None:
+            return None
+        else:
+            return os.path.abspath(os.path.expanduser(self.pgconf['statedir']))
 
     commands = (start, stop, status, restart, reload, log, debug, config)
 
@@ -755,6 +1232,7 @@ def parser():
     )
     parser.add_argument('--pgdir', help='name the playground directory', default=argparse.SUPPRESS)
     parser.add_argument('--pghome', help='directory to keep user-level playground state', default=argparse.SUPPRESS)
+    parser.add_argument('--statedir', help='directory to keep service lock files and logs', default=argparse.SUPPRESS)
     parser.add_argument(
         '--json', action='store_true', default=False,
         help='output in JSON (only supported by some commands)',
@@ -772,6 +1250,35 @@ def parser():
         '--config',
         help='specify a config file path to load',
     )
+    parser.add_argument(
+        '-n', '--lines', dest='log_lines', type=int, metavar='N',
+        help='log: show the last N lines of each log (default: 30)', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '-f', '--follow', dest='log_follow', action='store_const', const=True,
+        help='log: keep showing lines as they are logged (default, on a terminal)', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '-F', '--no-follow', dest='log_follow', action='store_const', const=False,
+        help='log: just show the last lines', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '--since', dest='log_since', metavar='TIME',
+        help='log: search all the logs, from TIME (e.g. 2015-10-16T17:05, 17:05, or 5m ago)', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '--until', dest='log_until', metavar='TIME',
+        help='log: search all the logs, until TIME', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '--grep', dest='log_grep', metavar='REGEX',
+        help='log: search all the logs, for lines matching REGEX', default=argparse.SUPPRESS,
+    )
+    parser.add_argument(
+        '--rolling', nargs='?', const=1, type=int, metavar='N',
+        help='restart: restart N services at a time (default: 1), each once the last is ready, and stop at a failure',
+        default=argparse.SUPPRESS,
+    )
     parser.add_argument('command', help='specify what action to take', choices=commands, default=argparse.SUPPRESS)
 
     group = parser.add_mutually_exclusive_group()
@@ -791,6 +1298,19 @@ def _services_to_names(services):
     return tuple(service.name for service in services)
 
 
+def _rebase(root, path):
+    """The mirror of absolute `path` under `root`; e.g. a service's scratch directory under pghome."""
+    return os.path.join(root, path.lstrip(os.sep))
+
+
+def _compile_grep(pattern):
+    import re
+    try:
+        return re.compile(pattern.encode('UTF-8'))
+    except re.error as error:
+        raise PgctlUserMessage(f'Invalid --grep pattern: {error}')
+
+
 def _humanize_seconds(seconds):
     for period_name, period_length in (
             ('days', 24 * 60 * 60),
@@ -806,16 +1326,52 @@ def _humanize_seconds(seconds):
         return f'{seconds} seconds'
 
 
+def _config_cache_path(args):
+    """The file-based configuration is cached in pghome.
+
+    Since pghome may itself be configured by those files, we only look at the cli and environment here.
+    """
+    pghome = getattr(args, 'pghome', None) or os.environ.get('PGCTL_PGHOME') or PGCTL_DEFAULTS['pghome']
+    return os.path.join(os.path.expanduser(pghome), 'config-cache.json')
+
+
+_NO_DAEMON = object()
+
+
+def _via_daemon(app):
+    """Run the command in this playground's pgctld, if there is one."""
+    try:
+        socket_path = app.daemon_socket
+    except NoPlayground:
+        return _NO_DAEMON
+    if not os.path.exists(socket_path):
+        return _NO_DAEMON
+
+    from .daemon import call
+    from .daemon import Unavailable
+    try:
+        return call(socket_path, app.pgconf)
+    except Unavailable as error:
+        trace('DAEMON: unavailable: %s', error)
+        return _NO_DAEMON
+
+
 def main(argv=None):
     p = parser()
     args = p.parse_args(argv)
-    config = Config('pgctl')
-    config = config.combined(PGCTL_DEFAULTS, args)
+    pgctl_config = Config('pgctl')
+    config = pgctl_config.combined(PGCTL_DEFAULTS, args, cache_path=_config_cache_path(args))
 
     if config['telemetry']:
+        from pgctl import telemetry
         telemetry.setup_clog(config['telemetry_clog_config_path'])
 
-    app = PgctlApp(config)
+    app = PgctlApp(config, discovery=pgctl_config.discovery)
+
+    if config['command'] in DAEMON_COMMANDS and not config['telemetry']:
+        result = _via_daemon(app)
+        if result is not _NO_DAEMON:
+            return result
 
     return app()
 
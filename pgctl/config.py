@@ -7,17 +7,13 @@ configuration: (decreasing scope, increasing priority)
   4) app level:     ..., $PWD/../.mything.conf, $PWD/.mything.conf
   5) cli:           --x
 """
-import configparser
 import json
-import logging
 from os import environ
 from os.path import join
 
-import yaml
-
+from pgctl.configsearch import discover
 from pgctl.configsearch import search_parent_directories
-
-log = logging.getLogger(__name__)
+from pgctl.debug import trace
 
 
 class UnrecognizedConfig(ValueError):
@@ -38,11 +34,13 @@ class Config:
     def __init__(self, projectname, defaults=None):
         self.projectname = projectname
         self.defaults = defaults
+        self._discovery = None
 
     def from_file(self, filename):
         # TODO P3: refactor this spaghetti
         # TODO(ckuehl|2019-08-08): why do we support .ini files??
         if filename.endswith(('.conf', '.ini')):
+            import configparser
             parser = configparser.ConfigParser()
             parser.read(filename)
             result = dict(parser.items(self.projectname))
@@ -53,6 +51,7 @@ class Config:
                     result[key] = value
             return result
         elif filename.endswith(('.yaml', '.yml')):
+            import yaml
             return yaml.load(
                 open(filename),
                 Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader),
@@ -64,8 +63,11 @@ class Config:
 
     def from_glob(self, pattern):
         from pgctl.configsearch import glob
+        return self._from_fnames(glob(pattern), pattern)
+
+    def _from_fnames(self, fnames, pattern):
         results = []
-        for fname in glob(pattern):
+        for fname in fnames:
             try:
                 config = self.from_file(fname)
             except UnrecognizedConfig:
@@ -82,17 +84,21 @@ class Config:
         pattern = ''.join((pattern_prefix, self.projectname, '.*'))
         return self.from_glob(pattern)
 
+    def _system_prefix(self):
+        return join(environ.get('PREFIX', '/'), 'etc', '')
+
+    def _homedir_prefix(self):
+        return environ.get('HOME', '$HOME') + '/.'
+
     def from_system(self):
         if environ.get('PGCTL_NO_GLOBAL_CONFIG') == 'true':
             return {}
-        etc = join(environ.get('PREFIX', '/'), 'etc', '')
-        return self.from_path_prefix(etc)
+        return self.from_path_prefix(self._system_prefix())
 
     def from_homedir(self):
         if environ.get('PGCTL_NO_GLOBAL_CONFIG') == 'true':
             return {}
-        home = environ.get('HOME', '$HOME')
-        return self.from_path_prefix(home + '/.')
+        return self.from_path_prefix(self._homedir_prefix())
 
     def from_environ(self, env=None):
         if env is None:
@@ -123,17 +129,139 @@ class Config:
         configs.append(vars(args))
         return merge(configs)
 
-    def combined(self, defaults=(), args=Dummy()):
+    @property
+    def discovery(self):
+        """The directories searched for app-level config files (see configsearch.discover).
+
+        This is shared with playground discovery, so we only walk up the tree once.
+        """
+        if self._discovery is None:
+            self._discovery = discover('.', self.projectname + '.')
+        return self._discovery
+
+    def _global_prefixes(self):
+        if environ.get('PGCTL_NO_GLOBAL_CONFIG') == 'true':
+            return ()
+        else:
+            return (self._system_prefix(), self._homedir_prefix())
+
+    def from_files(self, path='.'):
+        """The merged system, user and app level configs."""
         return merge((
-            defaults,
             self.from_system(),
             self.from_homedir(),
-            self.from_app(),
+            self.from_app(path),
+        ))
+
+    def from_files_cached(self, cache_path, path='.'):
+        """Like from_files, but cached in `cache_path`.
+
+        The cache is keyed on the inode and mtime of every directory we would search (so added or removed files are
+        noticed without listing directories) and of every config file found (so edits are noticed without parsing).
+        """
+        from os.path import abspath
+        from os.path import dirname
+        from pgctl.configsearch import glob
+        from pgctl.configsearch import Level
+
+        cache = _read_json(cache_path)
+        key = abspath(path)
+        entry = cache.get(key)
+        try:
+            previous = tuple(Level.from_json(level) for level in entry['levels'])
+        except (KeyError, TypeError, ValueError):
+            entry = None
+            previous = ()
+
+        discovery = discover(path, self.projectname + '.', previous)
+        if path == '.':
+            self._discovery = discovery
+
+        global_prefixes = self._global_prefixes()
+        directories = [_stamp(dirname(prefix)) for prefix in global_prefixes]
+        if (
+                entry is not None and
+                discovery == previous and
+                entry['directories'] == directories and
+                entry['files'] == [_stamp(fname) for fname, _, _ in entry['files']]
+        ):
+            if tuple(cache)[-1] != key:  # usually, it's already the most recently used
+                _remember(cache_path, cache, key, entry)
+            return entry['config']
+
+        # (fnames, pattern) for each config location, in increasing priority
+        locations = []
+        for prefix in global_prefixes:
+            pattern = ''.join((prefix, self.projectname, '.*'))
+            locations.append((tuple(glob(pattern)), pattern))
+        for level in reversed(discovery):
+            locations.append((
+                tuple(join(level.path, fname) for fname in level.files),
+                join(level.path, self.projectname + '.*'),
+            ))
+
+        files = [_stamp(fname) for fnames, _ in locations for fname in fnames]
+        config = merge(self._from_fnames(fnames, pattern) for fnames, pattern in locations)
+
+        _remember(cache_path, cache, key, {
+            'levels': [level.to_json() for level in discovery],
+            'directories': directories,
+            'files': files,
+            'config': config,
+        })
+        return config
+
+    def combined(self, defaults=(), args=Dummy(), cache_path=None):
+        if cache_path is None:
+            files = self.from_files()
+        else:
+            files = self.from_files_cached(cache_path)
+
+        return merge((
+            defaults,
+            files,
             self.from_environ(),
             self.from_cli(args),
         ))
 
 
+CONFIG_CACHE_SIZE = 32
+
+
+def _stamp(path):
+    """(path, inode, mtime) -- a cheap way to notice that a path has changed"""
+    from os import stat
+    try:
+        st = stat(path)
+    except OSError:
+        return [path, None, None]
+    else:
+        return [path, st.st_ino, st.st_mtime_ns]
+
+
+def _remember(cache_path, cache, key, entry):
+    """Store `entry` as the most recently used in `cache`, keeping only the most recently used few."""
+    cache.pop(key, None)
+    cache[key] = entry
+    _write_json(cache_path, dict(tuple(cache.items())[-CONFIG_CACHE_SIZE:]))
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, value):
+    from pgctl.scaffold import write_json
+    try:
+        write_json(path, value)
+    except (OSError, TypeError, ValueError) as error:  # the cache is only an optimization
+        trace('could not write %s: %s', path, error)
+
+
 def merge(values):
     from collections import deque
     result = {}
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 """stolen from aactivator"""
 # TODO: package and share
-import logging
 import os
+import typing
 
-log = logging.getLogger(__name__)
+from .debug import trace
 
 
 def get_filesystem_id(path):
@@ -24,6 +24,78 @@ def search_parent_directories(path='.'):
         fs_id = get_filesystem_id(path)
 
 
+class Level(typing.NamedTuple):
+    """One directory visited by discover()."""
+    path: str
+    # (device, inode, mtime): if this is unchanged, so is the directory listing
+    stamp: typing.Tuple[int, int, int]
+    # names of files that start with the requested prefix
+    files: typing.Tuple[str, ...]
+    # names of all subdirectories
+    directories: typing.FrozenSet[str]
+
+    def to_json(self):
+        return [self.path, list(self.stamp), list(self.files), sorted(self.directories)]
+
+    @classmethod
+    def from_json(cls, value):
+        path, stamp, files, directories = value
+        return cls(path, tuple(stamp), tuple(files), frozenset(directories))
+
+
+def _scan_level(path, stamp, file_prefix):
+    files = []
+    directories = set()
+    try:
+        entries = os.scandir(path)
+    except PermissionError as error:
+        trace('skipping unreadable directory: %s', error)
+    else:
+        with entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:  # e.g. a dangling symlink
+                    continue
+                if is_dir:
+                    directories.add(entry.name)
+                elif entry.name.startswith(file_prefix):
+                    files.append(entry.name)
+    return Level(path, stamp, tuple(sorted(files)), frozenset(directories))
+
+
+def discover(path='.', file_prefix='', previous=()):
+    """Walk up from `path` once, listing each directory with a single scandir.
+
+    This serves both config discovery (`files`) and playground discovery (`directories`).
+    Levels from a `previous` discovery are reused without listing when their stamp is unchanged,
+    so a cached discovery costs one stat per level, like search_parent_directories.
+    """
+    from os.path import abspath, dirname
+    previous = {level.path: level for level in previous}
+    path = abspath(path)
+    levels = []
+    original_fs_id = None
+    previous_path = None
+
+    while path != previous_path:
+        st = os.stat(path)
+        if original_fs_id is None:
+            original_fs_id = st.st_dev
+        elif st.st_dev != original_fs_id:
+            break
+
+        stamp = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        level = previous.get(path)
+        if level is None or level.stamp != stamp:
+            level = _scan_level(path, stamp, file_prefix)
+        levels.append(level)
+
+        previous_path = path
+        path = dirname(path)
+    return tuple(levels)
+
+
 def glob(pattern):
     from glob import glob
     yield from sorted(glob(pattern))
@@ -0,0 +1,399 @@
+"""
+pgctld: an optional, per-playground server for pgctl commands.
+
+Each pgctl command otherwise pays for interpreter startup, playground indexing and (for `status`) two s6
+subprocesses per service. pgctld keeps the playground index in memory, and remembers each service's status
+until s6-supervise announces a change: like s6-svwait, it subscribes to the service's `event/` fifodir.
+
+The protocol is a single line of json each way, over a unix socket in the playground's directory under pghome.
+The client passes its stdin, stdout and stderr along with the request, so output (including that of hooks and
+the embedded log viewer) goes straight to the client's terminal. The reply is the command's result.
+"""
+import array
+import json
+import os
+import socket
+import struct
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+
+from .cli import CHANNEL
+from .cli import DAEMON_COMMANDS
+from .cli import PgctlApp
+from .cli import pgctl_print
+from .daemontools import event_fifo_name
+from .debug import trace
+from .errors import PgctlUserMessage
+from .functions import chdir
+from .functions import JSONEncoder
+from pgctl import __version__
+
+
+STDIO = (0, 1, 2)
+# enough for any environment we've seen; there's no limit on its size in the protocol itself
+MAX_REQUEST = 1 << 20
+# how long (in seconds) a client may take to send its request; we serve one at a time, so a stalled client stalls all
+REQUEST_TIMEOUT = 2.0
+
+
+class Unavailable(Exception):
+    """There's no (compatible) daemon to talk to; run the command directly."""
+
+
+def _fds_buffer_size():
+    return socket.CMSG_SPACE(len(STDIO) * array.array('i').itemsize)
+
+
+def _peer_uid(connection):
+    """The uid of the process at the other end of a unix socket connection."""
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', credentials)
+    return uid
+
+
+def _connect(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # unix socket paths are limited to ~100 bytes; pghome paths can be longer
+        with chdir(os.path.dirname(socket_path)):
+            client.connect(os.path.basename(socket_path))
+    except OSError as error:
+        client.close()
+        raise Unavailable(error)
+    return client
+
+
+def call(socket_path, config):
+    """Run a pgctl command (given by its complete `config`) in the daemon at `socket_path`.
+
+    The daemon acts with our working directory, environment and stdio. Returns the command's result.
+    """
+    with _connect(socket_path) as client:
+        request = JSONEncoder().encode({
+            'version': __version__,
+            'config': config,
+            'cwd': os.getcwd(),
+            'environ': dict(os.environ),
+        }).encode('UTF-8') + b'\n'
+        sent = client.sendmsg(
+            (request,),
+            ((socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', STDIO)),),
+        )
+        if sent < len(request):
+            # (having read it all, the daemon may already have replied and hung up)
+            client.sendall(request[sent:])
+
+        with client.makefile('rb') as replies:
+            reply = replies.readline()
+
+    if not reply:
+        return CHANNEL + ' ERROR: pgctld exited before the command completed'
+    reply = json.loads(reply.decode('UTF-8'))
+    if 'unavailable' in reply:
+        raise Unavailable(reply['unavailable'])
+    return reply['result']
+
+
+def _supervised(service):
+    """An in-process s6-svok: s6-supervise holds its control fifo open for reading."""
+    try:
+        fd = os.open(os.path.join(service.path, 'supervise', 'control'), os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    else:
+        os.close(fd)
+        return True
+
+
+class EventListener:
+    """A subscription to a service's s6 events.
+
+    s6-supervise writes a byte to each (properly named) `ftrig1*` fifo in the service's `event/` directory whenever
+    the service's state changes. Fifos nobody reads from are cleaned up by s6 itself.
+    """
+
+    def __init__(self, service_path):
+        self.path = os.path.join(service_path, 'event', event_fifo_name('pgctld-{}'.format(os.getpid())))
+        try:
+            os.mkfifo(self.path, 0o622)
+        except FileExistsError:
+            pass
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def changed(self):
+        """Has there been any event since we last asked?"""
+        changed = False
+        while True:
+            try:
+                events = os.read(self.fd, 4096)
+            except BlockingIOError:  # a writer, but nothing written
+                break
+            if not events:
+                break
+            trace('EVENTS: %s %r', self.path, events)
+            changed = True
+        return changed
+
+    def subscribed(self):
+        """Our fifo is removed along with the service (or by hand); then we hear nothing."""
+        return os.path.exists(self.path)
+
+    def close(self):
+        os.close(self.fd)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class StatusCache:
+    """Service status, remembered until s6 tells us it has changed."""
+
+    def __init__(self):
+        self._listeners = {}
+        # service path -> (status, supervised, time of the status)
+        self._statuses = {}
+
+    def get(self, service):
+        listener = self._listeners.get(service.path)
+        if listener is not None and not listener.subscribed():
+            listener.close()
+            del self._listeners[service.path]
+            listener = None
+
+        if listener is None:
+            try:
+                listener = self._listeners[service.path] = EventListener(service.path)
+            except OSError:  # s6-supervise creates `event/` when it first starts
+                return service.state
+            # we may have missed events while unsubscribed
+            self._statuses.pop(service.path, None)
+        elif listener.changed():
+            self._statuses.pop(service.path, None)
+
+        # s6-supervise announces its exit, but not if it's killed
+        supervised = _supervised(service)
+        cached = self._statuses.get(service.path)
+        if cached is not None and cached[1] == supervised:
+            status, _, then = cached
+            if status['seconds'] is not None:
+                return dict(status, seconds=status['seconds'] + int(time.time() - then))
+            return dict(status)
+
+        status = service.state
+        self._statuses[service.path] = (status, supervised, time.time())
+        return dict(status)
+
+    def close(self):
+        for listener in self._listeners.values():
+            listener.close()
+        self._listeners.clear()
+        self._statuses.clear()
+
+
+class DaemonApp(PgctlApp):
+    """A PgctlApp for one request, sharing the daemon's knowledge of the playground."""
+
+    def __init__(self, config, daemon):
+        super().__init__(config)
+        self._daemon = daemon
+        self.pgdir = daemon.pgdir
+        self.index = daemon.index
+
+    def _service_state(self, service):
+        return self._daemon.statuses.get(service)
+
+
+class Daemon:
+
+    def __init__(self, app):
+        """Serve commands for the playground of `app`, a PgctlApp."""
+        self.pgdir = app.pgdir
+        self.index = app.index
+        self.socket_path = app.daemon_socket
+        self.statuses = StatusCache()
+        self.server = None
+
+    def listen(self):
+        try:
+            _connect(self.socket_path).close()
+        except Unavailable:
+            pass
+        else:
+            raise PgctlUserMessage('pgctld is already running: ' + self.socket_path)
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        try:
+            os.remove(self.socket_path)  # left behind by an unclean exit
+        except FileNotFoundError:
+            pass
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with chdir(os.path.dirname(self.socket_path)):
+            self.server.bind(os.path.basename(self.socket_path))
+            # connecting takes write permission: only for our own user, before anyone can
+            os.chmod(os.path.basename(self.socket_path), 0o600)
+        self.server.listen()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        self.statuses.close()
+
+    def serve_forever(self):
+        while True:
+            self.handle_one()
+
+    def handle_one(self):
+        connection, _ = self.server.accept()
+        connection.settimeout(REQUEST_TIMEOUT)
+        with connection:
+            try:
+                request, fds = self._receive(connection)
+            except (OSError, ValueError) as error:
+                trace('DAEMON: bad request: %s', error)
+                return
+
+            try:
+                uid = _peer_uid(connection)
+                if uid != os.getuid():
+                    # commands run as us, in the client's environment: only our own user may ask
+                    trace('DAEMON: refused uid %i', uid)
+                    reply = {'unavailable': 'pgctld serves only its own user'}
+                else:
+                    reply = self._handle(request, fds)
+            finally:
+                for fd in fds:
+                    os.close(fd)
+                self._reap()
+
+            try:
+                connection.sendall(json.dumps(reply).encode('UTF-8') + b'\n')
+            except OSError as error:  # the client went away
+                trace('DAEMON: could not reply: %s', error)
+
+    def _receive(self, connection):
+        data, ancdata, _, _ = connection.recvmsg(MAX_REQUEST, _fds_buffer_size())
+        fds = array.array('i')
+        for level, kind, payload in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+        fds = list(fds)
+
+        while not data.endswith(b'\n'):
+            more = connection.recv(MAX_REQUEST)
+            if not more or len(data) > MAX_REQUEST:
+                for fd in fds:
+                    os.close(fd)
+                raise ValueError('incomplete request')
+            data += more
+        return json.loads(data.decode('UTF-8')), fds
+
+    def _handle(self, request, fds):
+        if request.get('version') != __version__:
+            return {'unavailable': 'pgctld is version {}, not {}'.format(__version__, request.get('version'))}
+        config = request['config']
+        if config.get('command') not in DAEMON_COMMANDS or len(fds) != len(STDIO):
+            return {'unavailable': 'pgctld cannot run: {}'.format(config.get('command'))}
+
+        self.index.refresh()
+        with _client_context(request['cwd'], request['environ'], fds):
+            try:
+                result = DaemonApp(config, self)()
+            except Exception:
+                traceback.print_exc()
+                result = CHANNEL + ' ERROR: pgctld failed unexpectedly'
+        return {'result': result}
+
+    def _reap(self):
+        """s6-supervise processes we've started are our children; don't leave them as zombies."""
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+
+@contextmanager
+def _client_context(cwd, environ, fds):
+    """Temporarily take on the client's working directory, environment and stdio."""
+    saved_cwd = os.getcwd()
+    saved_environ = dict(os.environ)
+    saved_fds = [os.dup(fd) for fd in STDIO]
+
+    _flush()
+    for fd, client_fd in zip(STDIO, fds):
+        os.dup2(client_fd, fd)
+    os.environ.clear()
+    os.environ.update(environ)
+    try:
+        os.chdir(cwd)
+        yield
+    finally:
+        _flush()
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        for fd, saved_fd in zip(STDIO, saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def _flush():
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):  # the client's terminal may be gone
+            pass
+
+
+def parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Serve pgctl commands for a playground, to make them faster.',
+    )
+    parser.add_argument('--version', action='version', version=__version__)
+    parser.add_argument('--pgdir', help='name the playground directory', default=argparse.SUPPRESS)
+    parser.add_argument('--pghome', help='directory to keep user-level playground state', default=argparse.SUPPRESS)
+    parser.add_argument('--config', help='specify a config file path to load')
+    return parser
+
+
+def main(argv=None):
+    from .cli import _config_cache_path
+    from .cli import PGCTL_DEFAULTS
+    from .config import Config
+
+    args = parser().parse_args(argv)
+    pgctl_config = Config('pgctl')
+    config = pgctl_config.combined(PGCTL_DEFAULTS, args, cache_path=_config_cache_path(args))
+    app = PgctlApp(config, discovery=pgctl_config.discovery)
+
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        daemon = Daemon(app)
+        daemon.listen()
+    except PgctlUserMessage as error:
+        return CHANNEL + ' ERROR: ' + str(error)
+
+    pgctl_print('pgctld: serving', app.pgdir, 'at', daemon.socket_path)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == '__main__':
+    exit(main())
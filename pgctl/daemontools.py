@@ -23,6 +23,16 @@ def svc(args):
         raise CalledProcessError(process.returncode, cmd)
 
 
+def event_fifo_name(tag):
+    """The name for a fifo, in a service's `event/` fifodir, that s6-supervise will write its events to.
+
+    s6 only notifies fifos named `ftrig1` and exactly 43 more characters. See the link below for more information.
+    https://github.com/skarnet/s6/blob/v2.2.2.0/src/libs6/ftrigw_notifyb_nosig.c#L29,L30
+    """
+    assert len(tag) <= 43, tag
+    return 'ftrig1' + tag.ljust(43, '_')
+
+
 class SvStat(
         namedtuple('SvStat', ['state', 'pid', 'exitcode', 'seconds', 'process'])
 ):
@@ -34,5 +34,9 @@ class LockHeld(PgctlUserMessage):
     """The pgctl supervision lock is held. This generally indicates subprocesses escaping supervision."""
 
 
+class InTheWay(PgctlUserMessage):
+    """Something the user made is where pgctl needs to put one of its own files, and pgctl won't clobber it."""
+
+
 class NotReady(PgctlUserMessage):
     """The service is still performing its previous state change."""
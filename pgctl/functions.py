@@ -1,14 +1,21 @@
 """miscellany pgctl functions"""
+import array
 import json
 import os
 import signal
 import sys
 import typing
-
-from frozendict import frozendict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from types import MappingProxyType
 
 from .errors import LockHeld
 
+try:
+    from functools import cached_property
+except ImportError:  # python < 3.8
+    from cached_property import cached_property  # noqa: F401
+
 
 class StreamFileDescriptor:
     """For some reason, Python neglected to put this in the standard lib."""
@@ -46,17 +53,36 @@ def _unique(iterable):
             seen.add(i)
 
 
+def frozendict(*args, **kwargs):
+    """A read-only dict.
+
+    This is much cheaper to import than the frozendict package, which matters for cli startup time.
+    """
+    return MappingProxyType(dict(*args, **kwargs))
+
+
 class JSONEncoder(json.JSONEncoder):
-    """knows that frozendict is like dict"""
+    """knows that frozendict (and any other mapping) is like dict"""
 
     def default(self, o):
-        if isinstance(o, frozendict):
+        if isinstance(o, Mapping):
             return dict(o)
         else:
             # Let the base class default method raise the TypeError
             return json.JSONEncoder.default(self, o)
 
 
+@contextmanager
+def chdir(path):
+    """Temporarily change the working directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
 def bestrelpath(path, relto=None):
     """Return a relative path only if it's under $PWD (or `relto`)"""
     if relto is None:
@@ -132,32 +158,58 @@ def commafy(items):
     return ', '.join(str(x) for x in items)
 
 
-def symlink_if_necessary(path, destination):
-    """forcefully create a symlink with a given value, but only if it doesn't already exist"""
-    # TODO-TEST
-    from py._error import error as pylib_error
-    try:
-        supervise_link = destination.readlink()
-    except (pylib_error.ENOENT, pylib_error.EINVAL):
-        supervise_link = None
-
-    if supervise_link != path.strpath:
-        # TODO-TEST: a test that fails without -n
-        from .subprocess import check_call
-        check_call((
-            'ln', '-sfn', '--',
-            path.strpath,
-            destination.strpath,
-        ))
-
-
 def print_stderr(s):
     # Sadness: https://bugs.python.org/issue13601
     print(s, file=sys.stderr)
     sys.stderr.flush()
 
 
-def logger_preexec(log_path):
+# fcntl(2): linux-only, and not named by python's fcntl module before 3.10
+F_SETPIPE_SZ = 1031
+F_GETPIPE_SZ = 1032
+
+
+def set_pipe_size(fd, size):
+    """Ask for a pipe's buffer to hold `size` bytes; the kernel rounds up (to a power of two pages).
+
+    This may fail: unprivileged users can't go beyond /proc/sys/fs/pipe-max-size. The pipe still works, as it was.
+    """
+    import fcntl
+    if size >= 1 << 31:  # fcntl takes a C int; it mustn't wrap around
+        return
+    try:
+        fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+    except OSError:
+        pass
+
+
+class PipeUsage(typing.NamedTuple):
+    # bytes written to the pipe, but not yet read
+    buffered: int
+    # bytes the pipe can hold before writers block
+    capacity: int
+
+
+def pipe_usage(path) -> typing.Optional[PipeUsage]:
+    """How full is the fifo at `path`? None if there's no such fifo (or we can't tell)."""
+    import fcntl
+    import termios
+    try:
+        # as a (non-blocking) reader, we don't disturb the writers
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buffered = array.array('i', [0])
+        fcntl.ioctl(fd, termios.FIONREAD, buffered)
+        return PipeUsage(buffered[0], fcntl.fcntl(fd, F_GETPIPE_SZ))
+    except OSError:  # not a fifo, or not linux
+        return None
+    finally:
+        os.close(fd)
+
+
+def logger_preexec(log_path, pipe_size=None):
     """Pre exec func. for starting the logger process for a service.
 
     Before execing the logger service (s6-log), connect stdin to the logging
@@ -166,12 +218,15 @@ def logger_preexec(log_path):
     (The logger writes actual log output to files in $SERVICE_DIR/logs.)
 
     :param log_path: path to the logging FIFO
+    :param pipe_size: if given, the capacity (in bytes) to ask for the FIFO
     """
     # Even though this is technically RDONLY, we open
     # it as RDWR to avoid blocking
     #
     # http://bugs.python.org/issue10635
     log_fifo_reader = os.open(log_path, os.O_RDWR)
+    if pipe_size is not None:
+        set_pipe_size(log_fifo_reader, pipe_size)
     devnull = os.open(os.devnull, os.O_WRONLY)
 
     os.dup2(log_fifo_reader, StreamFileDescriptor.STDIN)
@@ -182,7 +237,7 @@ def logger_preexec(log_path):
     os.close(devnull)
 
 
-def supervisor_preexec(log_path):
+def supervisor_preexec(log_path, pipe_size=None):
     """Pre exec func. for starting a service.
 
     Before execing the service, attach the output streams of the supervised
@@ -192,9 +247,13 @@ def supervisor_preexec(log_path):
     going to stdin).
 
     :param log_path: path to the logging pipe
+    :param pipe_size: if given, the capacity (in bytes) to ask for the pipe
     """
     # Should be WRONLY, but we can't block (see logger_preexec)
     log_fifo_writer = os.open(log_path, os.O_RDWR)
+    if pipe_size is not None:
+        # the logger may not have been (re)started, to do this itself
+        set_pipe_size(log_fifo_writer, pipe_size)
 
     devnull = os.open(os.devnull, os.O_RDONLY)
     os.dup2(devnull, StreamFileDescriptor.STDIN)
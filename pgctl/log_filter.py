@@ -0,0 +1,191 @@
+"""
+usage: pgctl-log-filter [--lines N] [--bytes N] [--sample N [--match REGEX]] -- s6-log ...
+
+Sits between a service's log_pipe and its logger, to keep a chatty service from flooding its logs (and the disk).
+Lines over the rate limits (each a token bucket, allowing bursts of up to a second's worth) are dropped; with
+--sample, only one in N lines (of those matching --match) is kept. Every so often we log how many lines were dropped.
+
+pgctl generates `.log/run` scripts that use this for services with a log policy in their manifest.
+"""
+import argparse
+import os
+import re
+import select
+import signal
+import subprocess
+import sys
+import time
+import typing
+
+
+READ_SIZE = 1 << 16
+# how often (in seconds) to log how much we've dropped
+REPORT_INTERVAL = 10.0
+
+
+class TokenBucket:
+    """Allows `rate` units per second, in bursts of up to a second's worth."""
+
+    def __init__(self, rate: float, now: float) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self.time = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.rate, self.tokens + (now - self.time) * self.rate)
+        self.time = now
+
+    def take(self, amount: int) -> bool:
+        # a full bucket lets anything through (going into debt), so a line can't be too long to ever pass
+        if amount <= self.tokens or self.tokens >= self.rate:
+            self.tokens -= amount
+            return True
+        return False
+
+
+class LogFilter:
+
+    def __init__(
+            self,
+            now: float,
+            lines_per_second: typing.Optional[int] = None,
+            bytes_per_second: typing.Optional[int] = None,
+            sample: typing.Optional[int] = None,
+            match: typing.Optional[typing.Pattern[bytes]] = None,
+    ) -> None:
+        self._buckets = tuple(
+            (TokenBucket(rate, now), cost)
+            for rate, cost in ((lines_per_second, lambda line: 1), (bytes_per_second, len))
+            if rate
+        )
+        self._sample = sample if sample and sample > 1 else None
+        self._match = match
+        self._matched = 0
+        self.dropped_lines = self.dropped_bytes = self.sampled_out = 0
+
+    def filter(self, lines: typing.Iterable[bytes], now: float) -> typing.List[bytes]:
+        """The lines to keep, of those just read."""
+        for bucket, _ in self._buckets:
+            bucket.refill(now)
+
+        kept = []
+        for line in lines:
+            if self._sample is not None and (self._match is None or self._match.search(line)):
+                self._matched += 1
+                if self._matched % self._sample != 1:
+                    self.sampled_out += 1
+                    continue
+            if not all(bucket.take(cost(line)) for bucket, cost in self._buckets):
+                self.dropped_lines += 1
+                self.dropped_bytes += len(line)
+                continue
+            kept.append(line)
+        return kept
+
+    def report(self, seconds: float) -> typing.Optional[bytes]:
+        """A line to log about what we've dropped, over the last `seconds`; None if nothing."""
+        news = []
+        if self.dropped_lines:
+            news.append(f'dropped {self.dropped_lines} lines ({self.dropped_bytes} bytes) over the rate limit')
+        if self.sampled_out:
+            news.append(f'sampled out {self.sampled_out} lines')
+        self.dropped_lines = self.dropped_bytes = self.sampled_out = 0
+        if news:
+            return 'pgctl-log-filter: {}, in the last {:.0f} seconds\n'.format(' and '.join(news), seconds).encode()
+        return None
+
+
+def split_lines(data: bytes) -> typing.Tuple[typing.List[bytes], bytes]:
+    """The complete lines in `data`, and what's left of it (the start of a line still being written)."""
+    end = data.rfind(b'\n') + 1
+    if end == 0 and len(data) >= READ_SIZE:  # a huge line: let it through in pieces
+        return [data], b''
+    # only newlines end lines: a carriage return (e.g. from a progress bar) doesn't
+    return [line + b'\n' for line in data[:end].split(b'\n')[:-1]], data[end:]
+
+
+def _write(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def run(
+        log_filter: LogFilter,
+        source: int,
+        sink: int,
+        report_interval: float = REPORT_INTERVAL,
+        clock: typing.Callable[[], float] = time.monotonic,
+) -> None:
+    """Filter lines from `source` into `sink`, until `source` ends."""
+    poll = select.poll()
+    poll.register(source, select.POLLIN)
+    partial = b''
+    last_report = clock()
+
+    while True:
+        timeout = max(0.0, last_report + report_interval - clock())
+        if poll.poll(timeout * 1000):
+            data = os.read(source, READ_SIZE)
+            if not data:
+                break
+            lines, partial = split_lines(partial + data)
+            kept = log_filter.filter(lines, clock())
+            if kept:
+                _write(sink, b''.join(kept))
+
+        now = clock()
+        if now - last_report >= report_interval:
+            report = log_filter.report(now - last_report)
+            if report is not None:
+                _write(sink, report)
+            last_report = now
+
+    kept = log_filter.filter((partial,), clock()) if partial else ()
+    report = log_filter.report(clock() - last_report)
+    _write(sink, b''.join(kept) + (report or b''))
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog='pgctl-log-filter',
+        description='Rate-limit and sample log lines on their way to a logger.',
+    )
+    parser.add_argument('--lines', type=int, help='keep at most this many lines per second')
+    parser.add_argument('--bytes', type=int, help='keep at most this many bytes per second')
+    parser.add_argument('--sample', type=int, help='keep only one in this many lines')
+    parser.add_argument('--match', help='sample only the lines matching this regex')
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help=argparse.SUPPRESS)
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='the logger, which reads the lines we keep')
+    return parser
+
+
+def from_args(args: argparse.Namespace, now: float) -> LogFilter:
+    return LogFilter(
+        now,
+        lines_per_second=args.lines,
+        bytes_per_second=args.bytes,
+        sample=args.sample,
+        match=None if args.match is None else re.compile(args.match.encode('UTF-8')),
+    )
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        return 'pgctl-log-filter: no logger command given'
+
+    log_filter = from_args(args, time.monotonic())
+    logger = subprocess.Popen(command, stdin=subprocess.PIPE)
+    # on `s6-svc -d`, let the logger have what we've kept, and wait for it to finish with it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        run(log_filter, sys.stdin.fileno(), logger.stdin.fileno(), args.report_interval)
+    finally:
+        logger.stdin.close()
+        logger.wait()
+
+
+if __name__ == '__main__':
+    exit(main())
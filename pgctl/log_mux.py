@@ -0,0 +1,267 @@
+"""
+usage: pgctl-log-mux LOGGER_DIR
+
+One logger for all of a playground's services (pgctl's `shared_logger` mode), in place of an s6-log and an
+s6-supervise per service. We read every service's log_pipe, and write each line into that service's logs/current,
+timestamped and rotated as its own s6-log would have (see Service.log_run_script), policy filters included.
+
+pgctl adds and removes the services to log as LOGGER_DIR/sources/<service>.json, and sends us SIGHUP to look again.
+We keep the names of the services whose pipes we have open in LOGGER_DIR/active, so pgctl knows when we're done
+with a service it has removed.
+"""
+import json
+import os
+import select
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import typing
+
+from . import log_filter
+from . import scaffold
+from .logs import archives
+from .logs import TAI64_EPOCH
+from .service import LOG_PROCESSORS
+from .service import LogRotation
+
+
+def timestamp(now: float) -> bytes:
+    """s6-log's `T` timestamp, and the two spaces after it."""
+    seconds = int(now)
+    return '{}.{:09d}  '.format(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds)),
+        int((now - seconds) * 1e9),
+    ).encode('ascii')
+
+
+def tai64n(now: float) -> str:
+    seconds = int(now)
+    return '{:016x}{:08x}'.format(TAI64_EPOCH + seconds, int((now - seconds) * 1e9))
+
+
+def _processor_files(archive: str) -> typing.Tuple[str, str]:
+    """Where `archive` is, before and after its processor has run: not archives, as far as logs.archives() can tell."""
+    return archive + '.previous', archive + '.processed'
+
+
+class LogDir:
+    """A service's logs directory, as its s6-log would keep it: `current`, and the archives it's rotated into."""
+
+    def __init__(self, path: str, rotation: LogRotation) -> None:
+        self.path = path
+        self.current_path = path + '/current'
+        self.rotation = rotation
+        os.makedirs(path, exist_ok=True)
+        self._current = self._open()
+        self._size = os.fstat(self._current).st_size
+        # the processors compressing the newest archives, and the name each archive will have
+        self._processing: typing.List[typing.Tuple[subprocess.Popen, str]] = []
+
+    def _open(self) -> int:
+        return os.open(self.current_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, lines: typing.List[bytes], now: float) -> None:
+        stamp = timestamp(now)
+        data = b''.join(stamp + (line if line.endswith(b'\n') else line + b'\n') for line in lines)
+        log_filter._write(self._current, data)
+        self._size += len(data)
+        if self._size >= self.rotation.archive_size:
+            self.rotate(now)
+
+    def rotate(self, now: float) -> None:
+        os.close(self._current)
+        archive = '{}/@{}.s'.format(self.path, tai64n(now))
+        processor = LOG_PROCESSORS.get(self.rotation.compress)
+        if processor is None:
+            os.rename(self.current_path, archive)
+        else:
+            # as s6-log does: the processor reads `previous` into `processed`, which then becomes the archive.
+            # We don't wait for an earlier one to finish, which would hold up every service's logs: each has its own files.
+            previous, processed = _processor_files(archive)
+            os.rename(self.current_path, previous)
+            with open(previous, 'rb') as stdin, open(processed, 'wb') as stdout:
+                process = subprocess.Popen(shlex.split(processor), stdin=stdin, stdout=stdout, close_fds=True)
+            self._processing.append((process, archive))
+        self._current = self._open()
+        self._size = 0
+        self._prune()
+
+    def finish_processing(self, wait: bool = False) -> None:
+        """Put each newly compressed archive in place, once it's done."""
+        for process, archive in tuple(self._processing):
+            if (process.wait() if wait else process.poll()) is None:
+                continue
+            self._processing.remove((process, archive))
+            previous, processed = _processor_files(archive)
+            if process.returncode == 0:
+                os.rename(processed, archive)
+                os.remove(previous)
+            else:  # better uncompressed than lost
+                os.rename(previous, archive)
+                os.remove(processed)
+            self._prune()
+
+    def _prune(self) -> None:
+        rotated = [path for _, path in archives(self.current_path)]
+        sizes = [os.path.getsize(path) for path in rotated]
+        while rotated and (
+                len(rotated) > self.rotation.archives or
+                (self.rotation.total_size and sum(sizes) > self.rotation.total_size)
+        ):
+            os.remove(rotated.pop(0))
+            sizes.pop(0)
+
+    def close(self) -> None:
+        self.finish_processing(wait=True)
+        os.close(self._current)
+
+
+class Source:
+    """One service's log_pipe, and where its lines go."""
+
+    def __init__(self, name: str, spec: dict, now: float) -> None:
+        self.name = name
+        self.spec = spec
+        options = log_filter.parser().parse_args(spec['filter'])
+        self.filter = log_filter.from_args(options, now) if spec['filter'] else None
+        # read-write, so we never see the end of the pipe as its writers come and go (see logger_preexec)
+        self.fd = os.open(spec['fifo'], os.O_RDWR | os.O_NONBLOCK)
+        self.log = LogDir(spec['logs'], LogRotation(**spec['rotation']))
+        self._partial = b''
+
+    def read(self, now: float) -> None:
+        """Log whatever's in the pipe."""
+        while True:
+            try:
+                data = os.read(self.fd, log_filter.READ_SIZE)
+            except BlockingIOError:
+                return
+            lines, self._partial = log_filter.split_lines(self._partial + data)
+            self._log(lines, now)
+            if len(data) < log_filter.READ_SIZE:
+                return
+
+    def _log(self, lines: typing.List[bytes], now: float) -> None:
+        if self.filter is not None:
+            lines = self.filter.filter(lines, now)
+        if lines:
+            self.log.write(lines, time.time())
+
+    def report(self, seconds: float) -> None:
+        if self.filter is not None:
+            report = self.filter.report(seconds)
+            if report is not None:
+                self.log.write([report], time.time())
+
+    def close(self, now: float, seconds: float) -> None:
+        """Log the rest of what's in the pipe, and let it go."""
+        self.read(now)
+        if self._partial:
+            self._log([self._partial], now)
+        self.report(seconds)
+        os.close(self.fd)
+        self.log.close()
+
+
+class LogMux:
+
+    def __init__(self, path: str) -> None:
+        self.sources_path = path + '/sources'
+        self.active_path = path + '/active'
+        self.sources: typing.Dict[str, Source] = {}
+        self._by_fd: typing.Dict[int, Source] = {}
+        self._poll = select.poll()
+        self._last_report = time.monotonic()
+
+    def _specs(self) -> typing.Dict[str, dict]:
+        specs = {}
+        try:
+            filenames = os.listdir(self.sources_path)
+        except FileNotFoundError:
+            filenames = ()
+        for filename in filenames:
+            name, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            try:
+                with open(os.path.join(self.sources_path, filename)) as f:
+                    specs[name] = json.load(f)
+            except (OSError, ValueError):  # e.g. removed, since we listed it
+                continue
+        return specs
+
+    def rescan(self) -> None:
+        """Start and stop logging services, to match the sources pgctl has given us."""
+        now = time.monotonic()
+        specs = self._specs()
+        for name, source in tuple(self.sources.items()):
+            if specs.get(name) != source.spec:
+                self._remove(source, now)
+        for name, spec in specs.items():
+            if name not in self.sources:
+                try:
+                    source = Source(name, spec, now)
+                except (OSError, TypeError, KeyError) as error:
+                    print(f'pgctl-log-mux: cannot log {name}: {error}', file=sys.stderr)
+                    continue
+                self.sources[name] = self._by_fd[source.fd] = source
+                self._poll.register(source.fd, select.POLLIN)
+                source.read(now)
+        self._write_active()
+
+    def _remove(self, source: Source, now: float) -> None:
+        self._poll.unregister(source.fd)
+        del self.sources[source.name], self._by_fd[source.fd]
+        source.close(now, now - self._last_report)
+
+    def _write_active(self) -> None:
+        scaffold.write_json(self.active_path, sorted(self.sources))
+
+    def run(self) -> None:
+        """Log until SIGTERM (as from `s6-svc -d`), rescanning our sources on each SIGHUP."""
+        wakeup_read, wakeup_write = os.pipe()
+        for fd in (wakeup_read, wakeup_write):
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(wakeup_write)
+        for signum in (signal.SIGHUP, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: None)
+        self._poll.register(wakeup_read, select.POLLIN)
+
+        self.rescan()
+        while True:
+            timeout = max(0.0, self._last_report + log_filter.REPORT_INTERVAL - time.monotonic())
+            signums = b''
+            for fd, _ in self._poll.poll(timeout * 1000):
+                if fd == wakeup_read:
+                    signums += os.read(wakeup_read, 64)
+                else:
+                    self._by_fd[fd].read(time.monotonic())
+            # only once we're done with this batch of events: a rescan closes sources, whose fds may then be reused
+            if signal.SIGTERM in signums:
+                for source in tuple(self.sources.values()):
+                    self._remove(source, time.monotonic())
+                self._write_active()
+                return
+            if signal.SIGHUP in signums:
+                self.rescan()
+
+            now = time.monotonic()
+            if now - self._last_report >= log_filter.REPORT_INTERVAL:
+                for source in self.sources.values():
+                    source.report(now - self._last_report)
+                self._last_report = now
+            for source in self.sources.values():
+                source.log.finish_processing()
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 1:
+        return __doc__.strip().splitlines()[0]
+    LogMux(args[0]).run()
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,10 +1,12 @@
-import fcntl
 import os
 import re
 import select
 import shutil
-import subprocess
+import signal
+import struct
+import time
 import typing
+from collections import deque
 
 
 # https://stackoverflow.com/a/14693789
@@ -27,70 +29,302 @@ class TailEvent(typing.NamedTuple):
     log_lines: typing.Tuple[str]
 
 
+# like `tail`, we start by showing the last few lines of each file
+INITIAL_LINES = 10
+INITIAL_BYTES = 1 << 16
+READ_SIZE = 1 << 16
+
+# redraw the log viewer at most this often (per second)
+DEFAULT_MAX_FPS = 20
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_MODIFY | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """The bits of inotify(7) we need, by way of ctypes."""
+
+    def __init__(self) -> None:
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.fd = self._check(self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+
+    def _check(self, result: int) -> int:
+        if result < 0:
+            errno = self._get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return result
+
+    def add_watch(self, path: str, mask: int) -> int:
+        return self._check(self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask))
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> typing.Iterator[typing.Tuple[int, int, str]]:
+        """(watch descriptor, mask, name) of each pending event"""
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                yield wd, mask, os.fsdecode(name)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Follower:
+    """Follows a log file by name, as `tail -F` does: across s6-log's rotations of `current`, and truncation."""
+
+    def __init__(
+            self,
+            path: str,
+            buffer: memoryview,
+            initial_lines: int = INITIAL_LINES,
+            initial_bytes: typing.Optional[int] = INITIAL_BYTES,
+    ) -> None:
+        self.path = path
+        self._buffer = buffer
+        self._partial = bytearray()
+        self._file = None
+        self._inode = None
+        self.stat = None
+        self._initial_lines = initial_lines
+        self._initial_bytes = initial_bytes
+        self._open(initial=True)
+
+    def _open(self, initial: bool) -> None:
+        try:
+            self._file = open(self.path, 'rb', buffering=0)
+        except FileNotFoundError:
+            return
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        if initial:
+            self._file.seek(_last_lines_offset(self._file, self._initial_lines, self._initial_bytes))
+
+    def has_unread(self) -> bool:
+        """Does the file (still) have content we haven't read?"""
+        return self._file is not None and self._file.tell() < os.fstat(self._file.fileno()).st_size
+
+    def changed(self) -> bool:
+        """For polling: has the file changed since we last asked?"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        else:
+            stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        changed, self.stat = stat != self.stat, stat
+        return changed
+
+    def read_lines(self) -> typing.List[bytes]:
+        lines = []
+        if self._file is None:
+            self._open(initial=False)
+            if self._file is None:
+                return lines
+        self._read(lines)
+
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            # rotated: we've read the old file to its end; on to the new one
+            if self._partial:
+                lines.append(bytes(self._partial))
+                del self._partial[:]
+            self._file.close()
+            self._file = None
+            if inode is not None:
+                self._open(initial=False)
+                if self._file is not None:
+                    self._read(lines)
+        return lines
+
+    def _read(self, lines: typing.List[bytes]) -> None:
+        if os.fstat(self._file.fileno()).st_size < self._file.tell():
+            # truncated
+            self._file.seek(0)
+            del self._partial[:]
+
+        while True:
+            size = self._file.readinto(self._buffer)
+            if not size:
+                break
+            self._partial += self._buffer[:size]
+
+        end = self._partial.rfind(b'\n')
+        if end >= 0:
+            lines.extend(bytes(self._partial[:end]).split(b'\n'))
+            del self._partial[:end + 1]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _last_lines_offset(f: typing.BinaryIO, count: int, limit: typing.Optional[int] = INITIAL_BYTES) -> int:
+    """The offset of the last `count` lines of `f` (within its last `limit` bytes, if there's a limit).
+
+    We read backwards, a block at a time, so that a big file costs no more than its last few lines.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if count <= 0:
+        return size
+    floor = 0 if limit is None else max(0, size - limit)
+
+    end = size
+    if size > floor:
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            # that newline ends the last line; it doesn't start another
+            end = size - 1
+    # the start of the earliest line we've seen the beginning of
+    earliest = end + 1 if end < size else None
+
+    while end > floor:
+        start = max(floor, end - READ_SIZE)
+        f.seek(start)
+        block = f.read(end - start)
+        position = len(block)
+        while True:
+            position = block.rfind(b'\n', 0, position)
+            if position < 0:
+                break
+            earliest = start + position + 1
+            count -= 1
+            if count == 0:
+                return earliest
+        end = start
+
+    if floor == 0:
+        return 0
+    elif earliest is None:
+        return floor
+    else:  # don't start in the middle of a line
+        return earliest
+
+
 class Tailer:
+    """Tails many files at once, in-process.
+
+    We're told of changes by inotify, where that's available, and otherwise look at each file whenever asked.
+    """
+
+    def __init__(
+            self,
+            paths: typing.Iterable[str],
+            initial_lines: int = INITIAL_LINES,
+            initial_bytes: typing.Optional[int] = INITIAL_BYTES,
+    ) -> None:
+        # one buffer serves all files: we only ever read one at a time
+        buffer = memoryview(bytearray(READ_SIZE))
+        self._followers = {path: Follower(path, buffer, initial_lines, initial_bytes) for path in paths}
+        # paths with (probably) new content
+        self._dirty = {path for path, follower in self._followers.items() if follower.has_unread()}
+        for follower in self._followers.values():
+            follower.changed()
+
+        # watched directory: watch descriptor and the paths we follow within it
+        self._watches = {}
+        self._wd_to_directory = {}
+        self._unwatched = set(self._followers)
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError):  # not linux
+            self._inotify = None
+            self._poll = None
+            return
 
-    def __init__(self, paths: typing.Iterable[str]) -> None:
         self._poll = select.poll()
-        self._path_to_tail = {}
-        self._fdno_to_path = {}
-
-        for path in paths:
-            self._path_to_tail[path] = proc = subprocess.Popen(
-                ('tail', '-F', path),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-            )
-            self._fdno_to_path[proc.stdout.fileno()] = path
-            self._poll.register(proc.stdout, select.POLLIN)
-
-            # Put stdout in non-blocking mode so we can read from it without blocking.
-            flags = fcntl.fcntl(proc.stdout.fileno(), fcntl.F_GETFL) | os.O_NONBLOCK
-            fcntl.fcntl(proc.stdout.fileno(), fcntl.F_SETFL, flags)
+        self._poll.register(self._inotify.fd, select.POLLIN)
+        for path in self._followers:
+            directory = os.path.dirname(path)
+            if directory not in self._watches:
+                try:
+                    wd = self._inotify.add_watch(directory, WATCH_MASK)
+                except OSError:
+                    continue
+                self._watches[directory] = (wd, set())
+                self._wd_to_directory[wd] = directory
+            self._watches[directory][1].add(path)
+            self._unwatched.discard(path)
+
+    def _collect_events(self, timeout: typing.Optional[float] = 0) -> None:
+        if self._dirty:  # no need to wait for news
+            timeout = 0
+        if self._inotify is not None and self._poll.poll(timeout):
+            for wd, mask, name in self._inotify.read_events():
+                if mask & IN_Q_OVERFLOW:
+                    self._dirty.update(self._followers)
+                elif wd in self._wd_to_directory:
+                    path = os.path.join(self._wd_to_directory[wd], name)
+                    if path in self._followers:
+                        self._dirty.add(path)
+        for path in self._unwatched:
+            if self._followers[path].changed():
+                self._dirty.add(path)
 
     def get_logs(self, timeout: typing.Optional[float] = 0) -> typing.List[TailEvent]:
-        fd_events = self._poll.poll(timeout)
+        self._collect_events(timeout)
         ret = []
-        for fd, event in fd_events:
-            content = b''
-            while True:
-                try:
-                    content += os.read(fd, 10000)
-                except BlockingIOError:
-                    break
-            ret.append(TailEvent(self._fdno_to_path[fd], content.splitlines()))
+        for path in sorted(self._dirty):
+            lines = self._followers[path].read_lines()
+            if lines:
+                ret.append(TailEvent(path, lines))
+        self._dirty.clear()
         return ret
 
     def new_lines_available(self) -> bool:
-        return len(self._poll.poll(0)) > 0
+        self._collect_events()
+        return bool(self._dirty)
 
     def stop_tailing(self, path: str) -> None:
-        proc = self._path_to_tail[path]
-        self._poll.unregister(proc.stdout)
-        del self._fdno_to_path[proc.stdout.fileno()]
-        del self._path_to_tail[path]
-        proc.terminate()
-        proc.communicate()
+        self._followers.pop(path).close()
+        self._dirty.discard(path)
+        self._unwatched.discard(path)
+
+        directory = os.path.dirname(path)
+        if directory in self._watches:
+            wd, paths = self._watches[directory]
+            paths.discard(path)
+            if not paths:
+                self._inotify.rm_watch(wd)
+                del self._watches[directory]
+                del self._wd_to_directory[wd]
 
     def cleanup(self) -> None:
-        for path in tuple(self._path_to_tail):
+        for path in tuple(self._followers):
             self.stop_tailing(path)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
 
 
-def _drawn_box(width: int, height: int, content_lines: typing.Sequence[str]):
+def _box_rows(width: int, height: int, content_lines: typing.Sequence[str]) -> typing.List[str]:
     inner_width = width - 2
     inner_height = height - 2
     assert inner_width >= 0, inner_width
     assert inner_height >= 0, inner_height
     assert len(content_lines) <= inner_height, (len(content_lines), inner_height)
 
-    ret = (
-        # Disable screen wrap.
-        '\x1b[?7l'
-        # Hide the cursor.
-        '\x1b[?25l'
-        # Top border.
-        '\x1b[1m╔' + '═' * inner_width + '╗\x1b[0K\x1b[0m\n'
-    )
+    # Top border.
+    rows = ['\x1b[1m╔' + '═' * inner_width + '╗\x1b[0K\x1b[0m']
 
     # Inside box and log lines.
     for i in range(inner_height):
@@ -99,30 +333,70 @@ def _drawn_box(width: int, height: int, content_lines: typing.Sequence[str]):
         except IndexError:
             line = ''
         line = line[:inner_width].ljust(inner_width)
-        ret += '\x1b[1m║\x1b[0m' + line + f'\x1b[{width}G\x1b[1m║\x1b[0K\x1b[0m\n'
+        rows.append('\x1b[1m║\x1b[0m' + line + f'\x1b[{width}G\x1b[1m║\x1b[0K\x1b[0m')
 
-    ret += (
-        # Bottom border.
-        '\x1b[1m╚' + '═' * inner_width + '╝\x1b[0K\x1b[0m\n'
+    # Bottom border.
+    rows.append('\x1b[1m╚' + '═' * inner_width + '╝\x1b[0K\x1b[0m')
+    return rows
+
+
+def _drawn_box(width: int, height: int, content_lines: typing.Sequence[str]):
+    return (
+        # Disable screen wrap.
+        '\x1b[?7l'
+        # Hide the cursor.
+        '\x1b[?25l' +
+        ''.join(row + '\n' for row in _box_rows(width, height, content_lines)) +
         # Re-enable screen wrap.
         '\x1b[?7h'
         # Show the cursor.
         '\x1b[?25h'
     )
 
-    return ret
-
 
 class LogViewer:
 
-    def __init__(self, height: int, name_to_path: typing.Dict[str, str]):
+    def __init__(
+            self,
+            height: int,
+            name_to_path: typing.Dict[str, str],
+            max_fps: float = DEFAULT_MAX_FPS,
+    ) -> None:
         self._tailer = Tailer(name_to_path.values())
         self._prev_width = None
-        self._visible_lines = []
+        self._visible_lines = deque(maxlen=max(height - 2, 0))
         self._name_to_path = name_to_path
         self._path_to_name = {path: name for name, path in name_to_path.items()}
         self.height = height
 
+        # coalesce updates: at most one frame per interval
+        self._frame_interval = 1 / max_fps if max_fps > 0 else 0
+        self._frame_time = None
+        # the rows (title, then box) as last drawn
+        self._rows = None
+
+        # rather than asking the terminal its size every frame, we're told when it changes
+        self._width = self._terminal_width()
+        self._resized = False
+        try:
+            self._previous_sigwinch = signal.signal(signal.SIGWINCH, self._on_sigwinch)
+        except ValueError:  # not the main thread: we'll have to ask
+            self._previous_sigwinch = None
+            self._handles_sigwinch = False
+        else:
+            self._handles_sigwinch = True
+
+    def _on_sigwinch(self, signum, frame):
+        self._resized = True
+        if callable(self._previous_sigwinch):
+            self._previous_sigwinch(signum, frame)
+
+    def _current_width(self) -> int:
+        if self._resized or not self._handles_sigwinch:
+            self._resized = False
+            self._width = self._terminal_width()
+        return self._width
+
     def move_cursor_to_top(self) -> str:
         if self._prev_width is not None:
             return f'\x1b[{self.height + 1}F'
@@ -139,37 +413,68 @@ class LogViewer:
             return columns
 
     def redraw_needed(self) -> bool:
-        return self._tailer.new_lines_available() or self._prev_width != self._terminal_width()
+        if self._frame_time is not None and time.monotonic() - self._frame_time < self._frame_interval:
+            return False
+        return self._prev_width != self._current_width() or self._tailer.new_lines_available()
 
     def clear_below(self) -> str:
         return '\x1b[0J'
 
-    def draw_logs(self, title: str) -> str:
-        width = self._terminal_width()
-
-        log_events = self._tailer.get_logs(0)
-        for event in log_events:
+    def _frame(self, title: str, width: int) -> typing.List[str]:
+        for event in self._tailer.get_logs(0):
+            service = self._path_to_name[event.path]
             for line in event.log_lines:
-                service = self._path_to_name[event.path]
                 line = ANSI_ESCAPES.sub('', line.decode('utf8', errors='replace'))
                 self._visible_lines.append(f'[{service}] {line}')
-        self._visible_lines = self._visible_lines[-(self.height - 2):]
 
-        content = (
+        self._prev_width = width
+        self._frame_time = time.monotonic()
+        self._rows = [title] + _box_rows(width - 1, self.height, self._visible_lines)
+        return self._rows
+
+    def draw_logs(self, title: str) -> str:
+        """The whole log viewer, with its title."""
+        rows = self._frame(title, self._current_width())
+        return (
             # Disable screen wrap.
             '\x1b[?7l' +
             # Title
-            title + '\n'
+            rows[0] + '\n'
             # Re-enable screen wrap.
             '\x1b[?7h'
-        ) + _drawn_box(width - 1, self.height, self._visible_lines)
-
-        self._prev_width = width
-
-        return content
+        ) + _drawn_box(self._prev_width - 1, self.height, self._visible_lines)
+
+    def update_logs(self, title: str) -> str:
+        """Redraw the log viewer (just below the cursor), by rewriting only the rows that have changed."""
+        width = self._current_width()
+        if self._rows is None or width != self._prev_width:
+            return self.move_cursor_to_top() + self.clear_below() + self.draw_logs(title)
+
+        previous = self._rows
+        rows = self._frame(title, width)
+        changed = ''
+        for i, (old, new) in enumerate(zip(previous, rows)):
+            if old != new:
+                if i == 0:  # the title isn't padded, like the box rows
+                    new += '\x1b[0K'
+                distance = len(rows) - i
+                # up to the row, rewrite it, and back down
+                changed += f'\x1b[{distance}F' + new + f'\x1b[{distance}E'
+        if not changed:
+            return ''
+        return (
+            # Disable screen wrap and hide the cursor.
+            '\x1b[?7l\x1b[?25l' +
+            changed +
+            # Re-enable screen wrap and show the cursor.
+            '\x1b[?7h\x1b[?25h'
+        )
 
     def stop_tailing(self, name: str) -> None:
         self._tailer.stop_tailing(self._name_to_path[name])
 
     def cleanup(self) -> None:
         self._tailer.cleanup()
+        if self._previous_sigwinch is not None:
+            signal.signal(signal.SIGWINCH, self._previous_sigwinch)
+            self._previous_sigwinch = None
@@ -0,0 +1,319 @@
+"""
+`pgctl log`: services' logs, merged into one, in the order they were logged.
+
+s6-log stamps each line (see Service.log_run_script), so we can merge lines from many logs by their timestamps.
+Each line is prefixed with the name of its service, as in the embedded log viewer.
+
+With --since, --until or --grep, we search the rotated archives too. s6-log names each archive for the time it was
+rotated, so those names tell us which archives can hold lines from a given time; within a log, lines are in time
+order, so we can binary-search for the first line of interest rather than read them all.
+"""
+import datetime
+import heapq
+import mmap
+import os
+import re
+import subprocess
+import typing
+from contextlib import contextmanager
+
+from .errors import PgctlUserMessage
+from .log_viewer import Tailer
+
+
+# s6-log's `T` (2015-10-16 17:05:56.635827500) or `t` (TAI64N: @400000005620ee4e25e0ba4c); both sort as text
+TIMESTAMP = re.compile(rb'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+|@[0-9a-f]{24}')
+
+# 2015-10-16 17:05:56, as in s6-log's `T` timestamps (to which we compare it as text)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+RELATIVE_TIME = re.compile(r'(\d+(?:\.\d*)?)([smhd])')
+UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+# s6-log's archives: @<TAI64N of their rotation>.s (or .u, if it didn't complete)
+ARCHIVE = re.compile(r'@([0-9a-f]{16})[0-9a-f]{8}\.[su]')
+TAI64_EPOCH = 2 ** 62 + 10
+# archives may be compressed, by the processors in pgctl.service.LOG_PROCESSORS
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# TAI64 counts leap seconds, which we don't; be generous when picking archives by their names
+ARCHIVE_SLACK = datetime.timedelta(minutes=1)
+# we search a log this much at a time
+SEARCH_BLOCK = 1 << 20
+
+# when following, how often (in milliseconds) to look at logs we can't watch
+POLL_INTERVAL = 250
+
+
+class LogLine(typing.NamedTuple):
+    timestamp: bytes
+    name: str
+    line: bytes
+
+
+def timestamped(name: str, lines: typing.Iterable[bytes], previous: bytes = b'') -> typing.List[LogLine]:
+    """Each of a service's lines, with its timestamp; a line without one is as old as the line before it."""
+    result = []
+    for line in lines:
+        match = TIMESTAMP.match(line)
+        if match is not None:
+            previous = match.group()
+        result.append(LogLine(previous, name, line))
+    return result
+
+
+def merged(logs: typing.Iterable[typing.List[LogLine]]) -> typing.Iterator[LogLine]:
+    """Merge services' lines by timestamp; those logged at the same time stay in order."""
+    return heapq.merge(*logs, key=lambda line: line.timestamp)
+
+
+class LogPrinter:
+    """Prints lines from many services' logs, each labelled with its service."""
+
+    def __init__(self, names: typing.Iterable[str], out: typing.BinaryIO) -> None:
+        labels = ['[{}]'.format(name) for name in names]
+        width = max((len(label) for label in labels), default=0)
+        self._prefixes = {
+            label[1:-1]: (label.ljust(width) + ' ').encode('UTF-8')
+            for label in labels
+        }
+        self._out = out
+
+    def print(self, lines: typing.Iterable[LogLine]) -> None:
+        self._out.write(b''.join(self._prefixes[line.name] + line.line + b'\n' for line in lines))
+        self._out.flush()
+
+
+@contextmanager
+def _content(path: str) -> typing.Iterator[typing.Optional[typing.Union[mmap.mmap, bytes]]]:
+    """A log's content: memory-mapped, or, for a compressed archive, decompressed into memory. None if it's empty."""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:  # e.g. rotated away, since we looked
+        yield None
+        return
+    with f:
+        magic = f.read(len(ZSTD_MAGIC))
+        if magic.startswith(GZIP_MAGIC):
+            import gzip
+            f.seek(0)
+            yield gzip.decompress(f.read())
+        elif magic == ZSTD_MAGIC:
+            try:
+                yield subprocess.check_output(('zstd', '-d', '-c', '-q', path))
+            except FileNotFoundError:
+                raise PgctlUserMessage(f'{path} is compressed with zstd, which is not installed')
+        else:
+            try:
+                log = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty
+                yield None
+            else:
+                with log:
+                    yield log
+
+
+def _last_lines(path: str, count: int) -> typing.List[bytes]:
+    with _content(path) as log:
+        if not log or count <= 0:
+            return []
+        end = len(log)
+        if log[end - 1] == ord('\n'):
+            end -= 1
+        # scan backwards for newlines; only the pages we pass over are ever read
+        start = end
+        for _ in range(count):
+            start = log.rfind(b'\n', 0, start)
+            if start < 0:
+                break
+        return log[start + 1:end].split(b'\n')
+
+
+def last_lines(current: str, count: int) -> typing.List[bytes]:
+    """The last `count` lines logged to `current`: if it was rotated recently, some may be in the newest archive."""
+    lines = _last_lines(current, count)
+    if len(lines) < count:
+        rotated = archives(current)
+        if rotated:
+            _, newest = rotated[-1]
+            lines = _last_lines(newest, count - len(lines)) + lines
+    return lines
+
+
+def show(name_to_path: typing.Dict[str, str], count: int, out: typing.BinaryIO) -> None:
+    """Print the last `count` lines of each service's log."""
+    logs = [timestamped(name, last_lines(path, count)) for name, path in name_to_path.items()]
+    LogPrinter(name_to_path, out).print(merged(logs))
+
+
+def show_tails(paths: typing.Iterable[str], count: int, out: typing.BinaryIO) -> None:
+    """Print the last `count` lines of each log in turn, under its name, as `tail --verbose` would."""
+    tails = []
+    for path in paths:
+        tails.append(b'==> %s <==\n' % os.fsencode(path) + b''.join(line + b'\n' for line in last_lines(path, count)))
+    out.write(b'\n'.join(tails))
+    out.flush()
+
+
+def follow(name_to_path: typing.Dict[str, str], count: int, out: typing.BinaryIO) -> None:
+    """Print the last `count` lines of each service's log, then each line as it's logged. Never returns."""
+    path_to_name = {path: name for name, path in name_to_path.items()}
+    printer = LogPrinter(name_to_path, out)
+    # the timestamp of the last line we saw from each service
+    latest = {}
+
+    tailer = Tailer(name_to_path.values(), initial_lines=count, initial_bytes=None)
+    try:
+        while True:
+            logs = []
+            for event in tailer.get_logs(POLL_INTERVAL):
+                name = path_to_name[event.path]
+                lines = timestamped(name, event.log_lines, latest.get(name, b''))
+                latest[name] = lines[-1].timestamp
+                logs.append(lines)
+            if logs:
+                printer.print(merged(logs))
+    finally:
+        tailer.cleanup()
+
+
+def parse_time(text: str, now: typing.Optional[datetime.datetime] = None) -> bytes:
+    """A --since or --until time, as a timestamp to compare with s6-log's.
+
+    Either an ISO 8601 date and/or time (a time alone is today), or a duration ago: 30s, 5m, 2h or 1d.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+
+    match = RELATIVE_TIME.fullmatch(text)
+    if match is not None:
+        time = now - datetime.timedelta(**{UNITS[match.group(2)]: float(match.group(1))})
+    else:
+        try:
+            time = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            try:
+                time = datetime.datetime.combine(now.date(), datetime.time.fromisoformat(text))
+            except ValueError:
+                raise PgctlUserMessage(
+                    'Unrecognized time: {!r} (try 2015-10-16T17:05, 17:05, or 5m for five minutes ago)'.format(text),
+                )
+    return time.strftime(TIME_FORMAT).encode('ascii')
+
+
+def _archive_time(name: str) -> typing.Optional[datetime.datetime]:
+    match = ARCHIVE.fullmatch(name)
+    if match is None:
+        return None
+    return datetime.datetime.fromtimestamp(int(match.group(1), 16) - TAI64_EPOCH)
+
+
+def archives(current: str) -> typing.List[typing.Tuple[datetime.datetime, str]]:
+    """The archives s6-log has rotated `current` into, oldest first, with the time each was rotated."""
+    directory = os.path.dirname(current)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        (time, os.path.join(directory, name))
+        for time, name in ((_archive_time(name), name) for name in names)
+        if time is not None
+    )
+
+
+def logs_between(current: str, since: typing.Optional[bytes], until: typing.Optional[bytes]) -> typing.List[str]:
+    """The archives (and/or `current`) that may hold lines logged from `since` until `until`, oldest first.
+
+    Each archive holds the lines logged since the one before it was rotated, until it was rotated in turn.
+    """
+    if not os.path.isdir(os.path.dirname(current)):
+        return []
+
+    result = []
+    began = None  # when the logs of the current archive began
+    for time, path in archives(current) + [(None, current)]:
+        if (
+                (since is None or time is None or (time + ARCHIVE_SLACK).strftime(TIME_FORMAT).encode() >= since) and
+                (until is None or began is None or (began - ARCHIVE_SLACK).strftime(TIME_FORMAT).encode() < until)
+        ):
+            result.append(path)
+        began = time
+    return result
+
+
+def _timestamp_at(log: mmap.mmap, start: int, end: int) -> bytes:
+    match = TIMESTAMP.match(log, start, end)
+    return b'' if match is None else match.group()
+
+
+def seek_time(log: mmap.mmap, time: bytes) -> int:
+    """The offset of the first line of `log` logged at or after `time`, by binary search."""
+    low, high = 0, len(log)
+    # lines starting before `low` are older; the line starting at `high` (if any) isn't
+    while low < high:
+        middle = (low + high) // 2
+        newline = log.rfind(b'\n', low, middle)
+        start = low if newline < 0 else newline + 1
+        end = log.find(b'\n', start)
+        if end < 0:
+            end = len(log)
+        if _timestamp_at(log, start, end) < time:
+            low = end + 1
+        else:
+            high = start
+    return min(low, len(log))
+
+
+def _search_log(
+        name: str,
+        path: str,
+        since: typing.Optional[bytes],
+        until: typing.Optional[bytes],
+        grep: typing.Optional[typing.Pattern[bytes]],
+) -> typing.Iterator[LogLine]:
+    with _content(path) as log:
+        if log:
+            start = 0 if since is None else seek_time(log, since)
+            end = len(log) if until is None else seek_time(log, until)
+            previous = b''
+            # a block at a time, ending at a line's end, so we never hold much of a log at once
+            while start < end:
+                stop = min(start + SEARCH_BLOCK, end)
+                if stop < end:
+                    newline = log.find(b'\n', stop, end)
+                    stop = end if newline < 0 else newline + 1
+                # s6-log ends lines only at '\n': a '\r' is part of the line, as splitlines() wouldn't have it
+                lines = log[start:stop].split(b'\n')
+                if not lines[-1]:
+                    lines.pop()
+                start = stop
+                if grep is not None:
+                    lines = [line for line in lines if grep.search(line)]
+                if lines:
+                    lines = timestamped(name, lines, previous)
+                    previous = lines[-1].timestamp
+                    yield from lines
+
+
+def search(
+        name_to_path: typing.Dict[str, str],
+        since: typing.Optional[bytes],
+        until: typing.Optional[bytes],
+        grep: typing.Optional[typing.Pattern[bytes]],
+        out: typing.BinaryIO,
+) -> None:
+    """Print the lines of each service's logs (archives included) logged from `since` until `until`, and matching `grep`.
+
+    Each service's logs are read lazily, as the merge calls for them, so matches stream out as they're found.
+    """
+    def service_lines(name, current):
+        for path in logs_between(current, since, until):
+            yield from _search_log(name, path, since, until, grep)
+
+    printer = LogPrinter(name_to_path, out)
+    found = merged(service_lines(name, path) for name, path in name_to_path.items())
+    while True:
+        # print in batches: one write per line would cost us a syscall each
+        batch = [line for _, line in zip(range(1000), found)]
+        if not batch:
+            break
+        printer.print(batch)
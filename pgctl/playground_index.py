@@ -0,0 +1,94 @@
+"""
+A compiled index of a playground, cached in pghome.
+
+The index records which services exist (valid as long as the playground directory's mtime is unchanged), the
+settings of each service (each validated by that service's own mtimes, only when it's used) and the expansion of
+each alias. Loading it is a single read, so e.g. `pgctl status web` doesn't need to visit every service.
+"""
+import json
+import os
+
+from .debug import trace
+from .scaffold import write_json
+from .settings import load_record
+
+
+def _dir_key(path):
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_mtime_ns]
+
+
+class PlaygroundIndex:
+    """Changes to the index are kept in memory until save(), which the app calls once at the end of each command."""
+
+    def __init__(self, pgdir, index_path):
+        self.pgdir = os.fspath(pgdir)
+        self.index_path = os.fspath(index_path)
+        self._dirty = False
+
+        try:
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the index if the playground has changed since it was built."""
+        key = _dir_key(self.pgdir)
+        if self._index.get('key') != key:
+            trace('INDEX: rebuilding %s', self.pgdir)
+            self._index = {
+                'key': key,
+                'services': self._scan(),
+                'settings': {},
+                'aliases': {},
+            }
+            self._dirty = True
+
+    def _scan(self):
+        with os.scandir(self.pgdir) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir())
+
+    def save(self):
+        """Write the index, if it has changed since it was loaded or last saved."""
+        if not self._dirty:
+            return
+        try:
+            write_json(self.index_path, self._index)
+        except OSError as error:  # the index is only an optimization
+            trace('INDEX: could not save: %s', error)
+        else:
+            self._dirty = False
+
+    @property
+    def service_names(self):
+        """The names of all services in the playground, sorted."""
+        return tuple(self._index['services'])
+
+    def settings(self, name):
+        """The settings of the named service (which must be in this playground)."""
+        settings, record = load_record(
+            os.path.join(self.pgdir, name),
+            self._index['settings'].get(name),
+        )
+        if record is not None:
+            self._index['settings'][name] = record
+            self._dirty = True
+        return settings
+
+    def expand_alias(self, aliases, name, expand):
+        """Memoize `expand(name)`, which depends only on `aliases` (json-encoded) and the list of services.
+
+        Only aliases are memoized: so the index doesn't grow with each new list of services named on the command line.
+        """
+        if self._index.get('aliases_of') != aliases:
+            self._index['aliases_of'] = aliases
+            self._index['aliases'] = {}
+            self._dirty = True
+        try:
+            return tuple(self._index['aliases'][name])
+        except KeyError:
+            result = self._index['aliases'][name] = expand(name)
+            self._dirty = True
+            return tuple(result)
@@ -9,9 +9,13 @@ import select
 import time
 from sys import argv
 
+from .daemontools import event_fifo_name
 from .functions import exec_
 from .functions import print_stderr
 
+# how often (in seconds) to run a service's ready script, unless it says otherwise
+DEFAULT_POLL_READY = 0.15
+
 
 def floatfile(filename):
     with open(filename) as f:
@@ -30,6 +34,13 @@ def getval(filename, envname, default):
     return float(os.environ.get(envname, default))
 
 
+def setting_or_env(value, envname, default):
+    if value is None:
+        return float(os.environ.get(envname, default))
+    else:
+        return value
+
+
 def check_ready():
     from .subprocess import call
     return call('./ready')
@@ -96,9 +107,15 @@ def main():
         print_stderr('pgctl-poll-ready: disabled during debug -- quitting')
         exec_(argv[1:])  # never returns
 
+    # we run in the service directory; PGCTL_SCRATCH lets us share pgctl's parsed settings
+    from .settings import load
+    settings = load('.', os.environ.get('PGCTL_SCRATCH'))
+
     # TODO-TEST: fail if notification-fd doesn't exist
     # TODO-TEST: echo 4 > notification-fd
-    notification_fd = int(floatfile('notification-fd'))
+    notification_fd = settings.notification_fd
+    if notification_fd is None:
+        raise SystemExit('pgctl-poll-ready: notification-fd is not configured')
 
     # Create a FIFO to listen for the s6 down event
     #
@@ -106,10 +123,12 @@ def main():
     # might die immediately (and the child wouldn't receive the "down" event).
     #
     # The name of the FIFO created in S6's FIFO dir must comply with certain
-    # naming conventions. See the link below for more information.
-    # https://github.com/skarnet/s6/blob/v2.2.2.0/src/libs6/ftrigw_notifyb_nosig.c#L29,L30
+    # naming conventions: see pgctl.daemontools.event_fifo_name.
+    #
+    # A replacement (see pgctl.service.Service.start_replacement) runs here, in the service directory, but is
+    # supervised from a replica of it: PGCTL_EVENT_DIR is its supervisor's fifodir.
     down_fifo_path = os.path.join(
-        'event', 'ftrig1' + f'poll_ready_{os.getpid()}'.ljust(43, '_'),
+        os.environ.get('PGCTL_EVENT_DIR', 'event'), event_fifo_name(f'poll_ready_{os.getpid()}'),
     )
 
     # Don't reuse an old FIFO
@@ -129,9 +148,9 @@ def main():
         # run the wrapped command in the main process
         exec_(argv[1:])  # never returns
     else:  # child
-        timeout = getval('timeout-ready', 'PGCTL_TIMEOUT', '2.0')
-        poll_ready = getval('poll-ready', 'PGCTL_POLL', '0.15')
-        poll_down = getval('poll-down', 'PGCTL_POLL', '10.0')
+        timeout = setting_or_env(settings.timeout_ready, 'PGCTL_TIMEOUT', '2.0')
+        poll_ready = setting_or_env(settings.poll_ready, 'PGCTL_POLL', DEFAULT_POLL_READY)
+        poll_down = setting_or_env(settings.poll_down, 'PGCTL_POLL', '10.0')
 
         try:
             pgctl_poll_ready(down_fifo, notification_fd, timeout, poll_ready, poll_down)
@@ -0,0 +1,152 @@
+"""
+A pytest plugin for testing against pgctl services.
+
+It isn't loaded unless asked for, so that other projects' test sessions aren't touched by merely installing pgctl.
+Starting services is slow, so rather than starting and stopping them for each test, make a fixture that starts them
+once, for the whole session (or module):
+
+    # conftest.py (at the top of your tests)
+    from pgctl.pytest_plugin import playground_fixture
+
+    pytest_plugins = ['pgctl.pytest_plugin']
+
+    web_and_db = playground_fixture('web', 'db')
+
+    # test_web.py
+    def test_web(web_and_db):
+        ...
+
+Before each test that uses it, the fixture checks that its services are still ready, and restarts any that aren't.
+Services that were already running when the session started are left running at the end.
+
+The playground is found from `pgctl_project` (an ini option; by default, pytest's rootdir). Under pytest-xdist, each
+worker runs its own copy of the playground, with its own pghome, since a service directory can only have one
+supervisor. Services can tell which worker they belong to by $PYTEST_XDIST_WORKER.
+"""
+import os
+
+import pytest
+
+
+# fixture name -> RunningServices, for those in use
+_RUNNING = {}
+
+# the files pgctl (and s6) create in a service directory, which a copy of the playground should not share
+GENERATED = ('supervise', 'event', 'logs', 'log_pipe', '.pgctl.lock')
+
+
+def pytest_addoption(parser):
+    parser.addini('pgctl_project', 'the directory containing the pgctl playground (default: rootdir)')
+
+
+class RunningServices:
+    """Some services, started by a fixture."""
+
+    def __init__(self, session, names):
+        self.session = session
+        self.names = names
+        self.restarts = 0
+        # just started: no need to check before the first test
+        self.fresh = True
+
+    def status(self):
+        return self.session.playground.status(*self.names)
+
+    def check(self):
+        """Restart any services that have crashed; return their names."""
+        if self.fresh:
+            self.fresh = False
+            return ()
+        crashed = tuple(name for name, status in self.status().items() if status.state != 'ready')
+        if crashed:
+            self.session.playground.restart(*crashed)
+            self.restarts += 1
+        return crashed
+
+
+class PlaygroundSession:
+    """Services started for this test session, and who's using them."""
+
+    def __init__(self, playground):
+        self.playground = playground
+        # services we started, as opposed to those already running
+        self.started = set()
+        self.users = {}
+
+    def acquire(self, services):
+        status = self.playground.status(*services)
+        names = tuple(status)
+        stopped = [name for name in names if status[name].state != 'ready']
+        if stopped:
+            self.started.update(stopped)
+            self.playground.start(*stopped)
+
+        for name in names:
+            self.users[name] = self.users.get(name, 0) + 1
+        return RunningServices(self, names)
+
+    def release(self, running):
+        unused = []
+        for name in running.names:
+            self.users[name] -= 1
+            if self.users[name] == 0 and name in self.started:
+                unused.append(name)
+        if unused:
+            self.started.difference_update(unused)
+            self.playground.stop(*unused, check=False)
+
+    def close(self):
+        if self.started:
+            self.playground.stop(*sorted(self.started), check=False)
+            self.started.clear()
+
+
+def copy_playground(pgdir, destination):
+    """Copy a playground's services, without the state pgctl keeps in them."""
+    import shutil
+    shutil.copytree(pgdir, destination, symlinks=True, ignore=shutil.ignore_patterns(*GENERATED))
+    return destination
+
+
+@pytest.fixture(scope='session')
+def pgctl_playground(request, tmp_path_factory):
+    """The PlaygroundSession for this test session (or xdist worker)."""
+    from pgctl.api import Playground
+
+    project = request.config.getini('pgctl_project') or str(request.config.rootdir)
+    if os.environ.get('PYTEST_XDIST_WORKER'):
+        playground = Playground(project)
+        pgdir = copy_playground(
+            playground.pgdir,
+            str(tmp_path_factory.mktemp('pgctl-project') / os.path.basename(playground.pgdir)),
+        )
+        playground = Playground(project, pgdir=pgdir, pghome=str(tmp_path_factory.mktemp('pgctl-home')))
+    else:
+        # share pghome with the pgctl command, so we can use services that are already running
+        playground = Playground(project)
+
+    session = PlaygroundSession(playground)
+    yield session
+    session.close()
+
+
+def playground_fixture(*services, scope='session'):
+    """Make a fixture that starts `services` (by default, the `default` alias) once per `scope`."""
+    @pytest.fixture(scope=scope)
+    def fixture(request, pgctl_playground):
+        running = pgctl_playground.acquire(services)
+        _RUNNING[request.fixturename] = running
+        yield running
+        del _RUNNING[request.fixturename]
+        pgctl_playground.release(running)
+
+    return fixture
+
+
+@pytest.fixture(autouse=True)
+def _pgctl_health_check(request):
+    for name in request.fixturenames:
+        running = _RUNNING.get(name)
+        if running is not None:
+            running.check()
+    yield
@@ -0,0 +1,150 @@
+"""
+Content-aware upkeep of the files and symlinks pgctl maintains in service directories.
+
+Everything here compares what we want against what's on disk, and only writes (atomically) when they differ.
+A fingerprint of the last scaffolding is kept in the scratch directory, so an unchanged service costs one read.
+"""
+import errno
+import json
+import os
+import stat
+
+from .debug import trace
+from .errors import InTheWay
+
+
+def _tmp_path(path):
+    return '{}.pgctl-tmp.{}'.format(path, os.getpid())
+
+
+def ensure_file(path, content, mode=0o644):
+    """Ensure `path` has exactly `content` (bytes) and permission bits `mode`.
+
+    Returns True if anything was written.
+    """
+    try:
+        with open(path, 'rb') as f:
+            current = f.read()
+            current_mode = stat.S_IMODE(os.fstat(f.fileno()).st_mode)
+    except FileNotFoundError:
+        current = current_mode = None
+
+    if current == content and current_mode == mode:
+        return False
+
+    trace('SCAFFOLD: write %s', path)
+    write_atomic(path, content, mode)
+    return True
+
+
+def write_atomic(path, content, mode=0o644):
+    """Replace `path` with `content` (bytes): readers see the old file or the new one, never a partial write."""
+    tmp = _tmp_path(path)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(content)
+            os.fchmod(f.fileno(), mode)
+        os.replace(tmp, path)
+    finally:
+        ensure_absent(tmp)
+
+
+def write_json(path, value):
+    """Atomically replace `path` with `value`, as json, making its directory if need be."""
+    content = json.dumps(value).encode('UTF-8')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, content)
+
+
+def ensure_symlink(target, link):
+    """Ensure `link` is a symlink pointing at `target`, replacing whatever was there.
+
+    An empty directory is replaced too, but a directory with anything in it is reported, not clobbered.
+    Returns True if the link was (re)created.
+    """
+    target, link = os.fspath(target), os.fspath(link)
+    try:
+        current = os.readlink(link)
+    except OSError:
+        current = None
+
+    if current == target:
+        return False
+
+    trace('SCAFFOLD: link %s -> %s', link, target)
+    if current is None and os.path.isdir(link):
+        # a directory can't be renamed over: make way for the link, if there's nothing to lose
+        try:
+            os.rmdir(link)
+        except OSError as error:
+            if error.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                raise InTheWay(
+                    'pgctl needs a symlink at {}, but there is a directory there: please move it aside'.format(link),
+                )
+            raise
+
+    tmp = _tmp_path(link)
+    ensure_absent(tmp)  # left by an earlier process with our pid
+    try:
+        os.symlink(target, tmp)
+        os.replace(tmp, link)
+    finally:
+        ensure_absent(tmp)
+    return True
+
+
+def touch(path):
+    """Ensure the file `path` exists, creating it empty if necessary; existing content is left alone."""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644))
+
+
+def ensure_absent(path):
+    """Ensure `path` does not exist. Returns True if anything was removed."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    else:
+        return True
+
+
+def _watch_state(watched):
+    """The cheapest on-disk signal that something may have changed: (inode, size, mtime) of each watched path.
+
+    Any entry created, removed or renamed within a watched directory changes its mtime; a watched file replaced or
+    rewritten changes its inode or size, even where the filesystem's mtimes are too coarse to tell.
+    """
+    result = []
+    for path in watched:
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            result.append(None)
+        else:
+            result.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return result
+
+
+class Fingerprint:
+    """Remembers, in `record_path`, that scaffolding `spec` was done while `watched` looked a certain way."""
+
+    def __init__(self, record_path, spec, watched):
+        self.record_path = os.fspath(record_path)
+        self.spec = spec
+        self.watched = tuple(os.fspath(path) for path in watched)
+
+    def _current(self):
+        return {'spec': self.spec, 'watched': _watch_state(self.watched)}
+
+    def matches(self):
+        try:
+            with open(self.record_path) as f:
+                recorded = json.load(f)
+        except (OSError, ValueError):
+            return False
+        # round-trip through json so tuples compare equal to lists
+        return recorded == json.loads(json.dumps(self._current()))
+
+    def record(self):
+        """Record the fingerprint; call this *after* scaffolding, since scaffolding itself touches mtimes."""
+        write_json(self.record_path, self._current())
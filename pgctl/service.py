@@ -1,16 +1,15 @@
 import errno
 import functools
+import json
 import os
-import stat
+import shlex
 import subprocess
+import time
 import typing
-from collections import namedtuple
 from contextlib import contextmanager
 
-from cached_property import cached_property
-from frozendict import frozendict
-
 from .daemontools import svc
+from .daemontools import svok
 from .daemontools import SvStat
 from .daemontools import svstat
 from .debug import debug
@@ -19,17 +18,23 @@ from .errors import Impossible
 from .errors import NoSuchService
 from .errors import NotReady
 from .errors import reraise
+from .errors import Unsupervised
 from .functions import bestrelpath
+from .functions import chdir
 from .functions import exec_
+from .functions import frozendict
 from .functions import logger_preexec
+from .functions import pipe_usage
 from .functions import ps
 from .functions import show_runaway_processes
 from .functions import supervisor_preexec
-from .functions import symlink_if_necessary
 from .functions import terminate_processes
+from .poll_ready import DEFAULT_POLL_READY
+from .settings import load as load_settings
 from .subprocess import Popen
 from pgctl import environment_tracing
 from pgctl import fuser
+from pgctl import scaffold
 
 
 LOG_RUN_HEADER = \
@@ -40,6 +45,59 @@ LOG_RUN_HEADER = \
 #####################################################################\n
 """
 
+# s6-log processors, which compress each archive as it's rotated (in the background: logging goes on meanwhile)
+LOG_PROCESSORS = frozendict({
+    'gzip': 'gzip -c',
+    'zstd': 'zstd -q -c',
+})
+
+# how the supervisor sends each of the settings.RELOAD_SIGNALS: see s6-svc
+SVC_SIGNALS = frozendict({
+    'HUP': '-h',
+    'USR1': '-1',
+    'USR2': '-2',
+    'INT': '-i',
+    'QUIT': '-q',
+    'ALRM': '-a',
+})
+
+# the files s6-supervise reads from a service directory, which a replica needs too (see Service.start_replacement)
+REPLICA_FILES = ('notification-fd', 'nosetsid', 'timeout-finish', 'max-death-tally', 'down-signal')
+
+
+class LogRotation(typing.NamedTuple):
+    """How s6-log rotates a service's log: see the n, s, S and !processor directives of s6-log."""
+    # how many archives to keep, besides `current`
+    archives: int = 5
+    # rotate `current` once it's this big
+    archive_size: int = 10485760
+    # if set, drop the oldest archives to keep them all within this many bytes
+    total_size: typing.Optional[int] = None
+    # one of LOG_PROCESSORS, to compress archives
+    compress: typing.Optional[str] = None
+
+    @property
+    def directives(self):
+        directives = ['n{}'.format(self.archives), 's{}'.format(self.archive_size)]
+        if self.total_size:
+            directives.append('S{}'.format(self.total_size))
+        if self.compress in LOG_PROCESSORS:
+            directives.append(shlex.quote('!' + LOG_PROCESSORS[self.compress]))
+        return directives
+
+
+def _notified(fd):
+    """Has a line been written to the (non-blocking) fifo at `fd`?"""
+    while True:
+        try:
+            written = os.read(fd, 4096)
+        except BlockingIOError:  # a writer, but nothing written yet
+            return False
+        if not written:  # no writer
+            return False
+        if b'\n' in written:
+            return True
+
 
 def flock(path):
     """attempt to show the user a better message on failure, and handle the race condition"""
@@ -55,10 +113,172 @@ def flock(path):
     return flock(path, on_fail=handle_race)
 
 
-class Service(namedtuple('Service', ['path', 'scratch_dir', 'default_timeout', 'environment_tracing_enabled'])):
+class SharedLogger:
+    """The one logger for all of a playground's services, in `shared_logger` mode: a pgctl-log-mux, supervised.
+
+    It lives in the playground's directory under pghome. Services are added to it (and removed) as files in its
+    `sources` directory; it lists the services it's logging in its `active` file.
+    """
+    __slots__ = ('path', 'sources_path', 'active_path')
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.sources_path = self.path + '/sources'
+        self.active_path = self.path + '/active'
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path!r})'
+
+    @contextmanager
+    def _locked(self):
+        # held briefly, so that the logger can't be stopped just as a service is added to it
+        from .flock import flock
+        with flock(self.path, on_fail=lambda path: time.sleep(.01)):
+            yield
+
+    def _source_path(self, service):
+        return f'{self.sources_path}/{service.name}.json'
+
+    def add(self, service):
+        """Log this service, starting the logger if need be."""
+        os.makedirs(self.sources_path, exist_ok=True)
+        source = json.dumps({
+            'fifo': service.path + '/log_pipe',
+            'logs': service.logs_path,
+            'rotation': service.log_rotation._asdict(),
+            'filter': service.log_filter,
+        }, sort_keys=True)
+        changed = scaffold.ensure_file(self._source_path(service), source.encode('UTF-8'))
+
+        with self._locked():
+            if not self.supervised():
+                self._supervise()  # it reads all its sources as it starts
+            elif changed:
+                self._reload()
+
+    def remove(self, service):
+        """Stop logging this service: it's done once the logger is no longer `logging` it."""
+        if scaffold.ensure_absent(self._source_path(service)):
+            self._reload()
+
+    def logging(self, service):
+        try:
+            with open(self.active_path) as f:
+                active = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return service.name in active and self.supervised()
+
+    def stop_if_idle(self, timeout):
+        """Stop the logger, if it has no services left to log: kill it, if it's not down within `timeout` seconds."""
+        if not os.path.isdir(self.path):
+            return
+        with self._locked():
+            try:
+                if os.listdir(self.sources_path):
+                    return
+            except FileNotFoundError:
+                pass
+            try:
+                svc(('-dx', self.path))
+            except Unsupervised:
+                return
+            # don't let anyone add a service to a logger that's on its way out; but don't keep them waiting forever
+            if self._wait_until_down(timeout):
+                return
+            try:
+                svc(('-kx', self.path))
+            except Unsupervised:
+                return
+            if not self._wait_until_down(timeout):
+                raise NotReady(f'the shared logger did not stop, even once killed: see {self.path}/errors')
+
+    def _wait_until_down(self, timeout):
+        limit = time.monotonic() + timeout
+        while self.supervised():
+            if time.monotonic() >= limit:
+                return False
+            time.sleep(.01)
+        return True
+
+    def supervised(self):
+        return svok(self.path)
 
-    # TODO-TEST: regression: these cached-properties are actually cached
-    __exists = False
+    def _reload(self):
+        try:
+            svc(('-h', self.path))
+        except Unsupervised:
+            pass  # it will read its sources when it starts
+
+    def _supervise(self):
+        scaffold.ensure_file(
+            self.path + '/run',
+            (LOG_RUN_HEADER + 'exec pgctl-log-mux {}\n'.format(shlex.quote(self.path))).encode('UTF-8'),
+            mode=0o755,
+        )
+        env = {key: value for key, value in os.environ.items() if not key.startswith('PGCTL_')}
+        with open(os.devnull, 'rb') as devnull, open(self.path + '/errors', 'ab') as errors:
+            Popen(('s6-supervise', self.path), env=env, stdin=devnull, stdout=errors, stderr=errors, close_fds=True)
+
+
+class Service:
+    """A supervised service: a directory in the playground.
+
+    Paths are plain strings. The ones we need on (nearly) every command are computed once, up front.
+    """
+    __slots__ = (
+        'path', 'scratch_dir', 'default_timeout', 'environment_tracing_enabled', 'state_dir', 'playground_index',
+        'default_log_rotation', 'shared_logger',
+        # derived paths
+        'name', 'logger_path', 'state_path', 'lock_path', 'logs_path', 'logfile_path', 'ready_script',
+        'notification_fd',
+        # lazily computed
+        '_settings', '_timeout_stop', '_timeout_ready', '_exists',
+    )
+
+    def __init__(
+            self,
+            path,
+            scratch_dir,
+            default_timeout,
+            environment_tracing_enabled,
+            state_dir=None,
+            playground_index=None,
+            default_log_rotation=LogRotation(),
+            shared_logger=None,
+    ):
+        self.path = os.fspath(path)
+        self.scratch_dir = os.fspath(scratch_dir)
+        self.default_timeout = default_timeout
+        self.environment_tracing_enabled = environment_tracing_enabled
+        self.state_dir = None if state_dir is None else os.fspath(state_dir)
+        self.playground_index = playground_index
+        self.default_log_rotation = default_log_rotation
+        # if set, this service logs through its playground's SharedLogger, rather than its own s6-log
+        self.shared_logger = shared_logger
+
+        # s6 is posix-only: plain concatenation is cheaper than os.path.join, and these are computed for every service
+        self.name = self.path.rpartition('/')[2]
+        self.logger_path = self.path + '/.log'
+        # Where lock files and logs live: the service directory itself, unless `statedir` is configured.
+        self.state_path = self.path if self.state_dir is None else self.state_dir
+        self.lock_path = self.state_path + '/.pgctl.lock'
+        self.logs_path = self.state_path + '/logs'
+        self.logfile_path = self.logs_path + '/current'
+        self.ready_script = self.path + '/ready'
+        self.notification_fd = self.path + '/notification-fd'
+
+        self._settings = self._timeout_stop = self._timeout_ready = None
+        self._exists = False
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path!r})'
 
     def __str__(self):
         return self.name
@@ -67,16 +287,16 @@ class Service(namedtuple('Service', ['path', 'scratch_dir', 'default_timeout', '
         # TODO-TEST: bring service up, clean symlink, run Service.supervised()
         self.ensure_exists()
         from .daemontools import svok
-        return svok(self.path.strpath)
+        return svok(self.path)
 
     def svstat(self):
         self.ensure_exists()
         return self._svstat_path(self.path)
 
     def _svstat_path(self, path):
-        with path.dirpath().as_cwd():
-            result = svstat(path.basename)
-        if not self.notification_fd.exists():
+        with chdir(os.path.dirname(path)):
+            result = svstat(os.path.basename(path))
+        if not self.settings.uses_notification:
             # services without notification need to be considered ready sometimes
             if (
                     # an 'up' service is always ready
@@ -101,45 +321,185 @@ class Service(namedtuple('Service', ['path', 'scratch_dir', 'default_timeout', '
         return state
 
     def message(self, state) -> typing.Optional[str]:
-        script = self.path.join(state.strings.change + '-msg')
-        if script.exists():
-            proc = subprocess.run((script.strpath,), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        script = os.path.join(self.path, state.strings.change + '-msg')
+        if os.path.exists(script):
+            proc = subprocess.run((script,), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             output = proc.stdout.decode('utf8', errors='replace')
             if proc.returncode != 0:
                 raise AssertionError(f'"{script}" exited with error code {proc.returncode} and output:\n{output}')
             return output
 
-    @cached_property
-    def ready_script(self):
-        return self.path.join('ready')
-
-    @cached_property
-    def notification_fd(self):
-        return self.path.join('notification-fd')
-
     def start(self):
         """Idempotent start of a service or group of services"""
         self.background()
-        svc(('-u', self.path.join('.log').strpath))
-        svc(('-u', self.path.strpath))
+        if self.shared_logger is None:
+            svc(('-u', self.logger_path))
+        svc(('-u', self.path))
 
     def stop(self):
         """Idempotent stop of a service or group of services"""
         self.ensure_exists()
-        svc(('-dx', self.path.strpath))
+        svc(('-dx', self.path))
+
+    def reload(self):
+        """Send the service its reload signal, through its supervisor"""
+        self.ensure_exists()
+        svc((SVC_SIGNALS[self.settings.reload_signal], self.path))
+
+    @property
+    def reload_notification_path(self):
+        """Where a service with `reload-ready` (but no ready script) writes a line once it has reloaded.
+
+        s6 reads a service's notification-fd only until its first line, so this is a second one, for reloads.
+        """
+        return self.scratch_dir + '/reload-notification'
+
+    def listen_for_reload(self):
+        """If the service is to notify us that it has reloaded, get ready to hear it: return the fd to listen on."""
+        if not (self.settings.reload_ready and not self.settings.has_ready_script):
+            return None
+        path = self.reload_notification_path
+        scaffold.ensure_absent(path)  # don't hear an earlier reload's notification
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        os.mkfifo(path, 0o600)
+        # without blocking until the service opens it for writing
+        return os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def stop_listening_for_reload(self, notification):
+        os.close(notification)
+        scaffold.ensure_absent(self.reload_notification_path)
+
+    @property
+    def replica_path(self):
+        """The replica of the service directory that the running service was started from, if it's a replacement.
+
+        Scratch's `supervise` is then a symlink to the replica's supervise directory.
+        """
+        try:
+            return os.path.dirname(os.readlink(self.scratch_dir + '/supervise'))
+        except OSError:  # a directory: the service runs from its own
+            return None
+
+    def start_replacement(self):
+        """Start a second instance of the service, alongside the first: see cli.Replace.
+
+        s6-supervise supervises one instance per service directory, so the second runs from a replica of it in
+        scratch, with its own supervise directory and its own lock. Returns the replica's path.
+        """
+        self.ensure_directory_structure()
+        # neither the replacement nor we may hold the lock of the instance it's replacing
+        self._release_parent_lock()
+        replica = self.scratch_dir + '/replica.0'
+        if replica == self.replica_path:
+            replica = self.scratch_dir + '/replica.1'
+        # whatever an earlier, failed, replacement left behind
+        self.abandon_replacement(replica)
+
+        os.makedirs(replica + '/supervise', exist_ok=True)
+        for name in ('run', 'finish'):
+            if os.path.exists(os.path.join(self.path, name)):
+                scaffold.ensure_file(
+                    os.path.join(replica, name),
+                    (LOG_RUN_HEADER + 'cd {} && exec ./{} "$@"\n'.format(shlex.quote(self.path), name)).encode('UTF-8'),
+                    mode=0o755,
+                )
+        for name in REPLICA_FILES:
+            try:
+                with open(os.path.join(self.path, name), 'rb') as f:
+                    scaffold.ensure_file(os.path.join(replica, name), f.read())
+            except FileNotFoundError:
+                pass
+
+        # s6-supervise starts the service straight away: there's no `down` file
+        with flock(replica) as lock:
+            Popen(
+                ('s6-supervise', replica),
+                # it runs in the service directory, but it's the replica's supervisor that says when it's down
+                env=self.supervise_env(lock, debug=False, event_dir=replica + '/event'),
+                preexec_fn=functools.partial(
+                    supervisor_preexec,
+                    self.path + '/log_pipe',
+                    self.settings.log_pipe_size,
+                ),
+            )
+        return replica
+
+    def _release_parent_lock(self):
+        """If we're one of the service's own processes (e.g. its pgctl-poll-ready, restarting it), let go of its lock."""
+        if os.environ.get('PGCTL_SERVICE') == self.path:
+            del os.environ['PGCTL_SERVICE']
+            lock = os.environ.pop('PGCTL_SERVICE_LOCK', None)
+            if lock:
+                from .flock import release
+                release(int(lock))
+
+    def assert_replacement_ready(self, replica):
+        status = self._svstat_path(replica)
+        if status.state != 'ready':
+            raise NotReady("its replacement's status is " + str(status))
+
+    def assert_replaced(self):
+        """Assert that the instance being replaced is down, and that nothing holds its lock."""
+        status = self.svstat()
+        if status.state != SvStat.UNSUPERVISED:
+            raise NotReady('its status is ' + str(status))
+        with flock(self.replica_path or self.state_path):
+            pass
+
+    def force_cleanup_replaced(self) -> typing.Optional[str]:
+        return terminate_processes(set(fuser.fuser(self.replica_path or self.state_path)) - {os.getpid()})
+
+    def adopt_replacement(self, replica):
+        """Make the replacement the service, once the instance it replaces is down."""
+        import shutil
+        replaced = self.replica_path
+        supervise = self.scratch_dir + '/supervise'
+        if replaced is None:
+            shutil.rmtree(supervise)
+        scaffold.ensure_symlink(replica + '/supervise', supervise)
+        if replaced is not None:
+            shutil.rmtree(replaced)
+
+    def abandon_replacement(self, replica):
+        """Kill a replacement that never took the service's place, and remove its replica."""
+        if not os.path.isdir(replica):
+            return
+        try:
+            svc(('-kx', replica))
+        except Unsupervised:
+            pass
+        terminate_processes(set(fuser.fuser(replica)) - {os.getpid()})
+        import shutil
+        shutil.rmtree(replica, ignore_errors=True)
+
+    def _forget_replica(self):
+        """Once a replacement is down, the service runs from its own directory again."""
+        replica = self.replica_path
+        if replica is not None:
+            import shutil
+            os.remove(self.scratch_dir + '/supervise')
+            os.makedirs(self.scratch_dir + '/supervise')
+            shutil.rmtree(replica, ignore_errors=True)
 
     def stop_logs(self):
         self.ensure_logs()
-        svc(('-kx', self.path.join('.log').strpath))
+        if self.shared_logger is None:
+            svc(('-kx', self.logger_path))
+        else:
+            self.shared_logger.remove(self)
 
     def _pids_running_from_fuser(self) -> typing.Set[int]:
-        return set(fuser.fuser(self.path)) - {os.getpid()}
+        pids = set(fuser.fuser(self.state_path))
+        replica = self.replica_path
+        if replica is not None:  # a replacement's processes hold its replica's lock instead
+            pids.update(fuser.fuser(replica))
+        return pids - {os.getpid()}
 
     def _pids_running_from_environment_tracing(self) -> typing.Set[int]:
         if self.environment_tracing_enabled:
             return environment_tracing.find_processes_with_environ(
                 {
-                    b'PGCTL_SERVICE': self.path.strpath.encode('utf8'),
+                    b'PGCTL_SERVICE': self.path.encode('utf8'),
                     b'PGCTL_SERVICE_PROCESS': b'true',
                 },
             ) - {os.getpid()}
@@ -153,22 +513,33 @@ class Service(namedtuple('Service', ['path', 'scratch_dir', 'default_timeout', '
         """Forcefully stop a service (i.e., `kill -9` all processes still running."""
         return terminate_processes(self.processes_currently_running(), is_stop=is_stop)
 
-    def __get_timeout(self, name, default):
-        timeout = self.path.join(name, abs=1)
-        if timeout.check():
-            debug('%s exists', name)
-            return float(timeout.read().strip())
-        else:
-            debug('%s doesn\'t exist', name)
+    @property
+    def settings(self):
+        """This service's settings, read (at most) once per command."""
+        if self._settings is None:
+            if self.playground_index is not None:
+                self._settings = self.playground_index.settings(self.name)
+            else:
+                self._settings = load_settings(self.path, self.scratch_dir)
+        return self._settings
+
+    def __get_timeout(self, value, default):
+        if value is None:
             return float(default)
+        else:
+            return value
 
-    @cached_property
+    @property
     def timeout_stop(self):
-        return self.__get_timeout('timeout-stop', self.default_timeout)
+        if self._timeout_stop is None:
+            self._timeout_stop = self.__get_timeout(self.settings.timeout_stop, self.default_timeout)
+        return self._timeout_stop
 
-    @cached_property
+    @property
     def timeout_ready(self):
-        return self.__get_timeout('timeout-ready', self.default_timeout)
+        if self._timeout_ready is None:
+            self._timeout_ready = self.__get_timeout(self.settings.timeout_ready, self.default_timeout)
+        return self._timeout_ready
 
     def assert_stopped(self, with_log_running=False):
         status = self.svstat()
@@ -201,46 +572,137 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
         if status.state != 'ready':
             raise NotReady('its status is ' + str(status))
 
+    def assert_reloaded(self, since, notification=None):
+        """Assert that the service is ready again, after being signalled to reload at `since` (a time.time()).
+
+        :param notification: the fd from `listen_for_reload`, if any
+        """
+        if notification is not None:
+            if not _notified(notification):
+                raise NotReady('it has not yet notified that it reloaded')
+        elif self.settings.reload_ready and self.settings.has_ready_script:
+            # s6 is told only once that a service is ready: its ready script is how we know it's ready again
+            env = dict(os.environ, PGCTL_RELOAD_TIME=repr(since))
+            with open(os.devnull, 'w') as devnull:
+                ready = subprocess.call(('./ready',), cwd=self.path, env=env, stdout=devnull, stderr=devnull)
+            if ready != 0:
+                raise NotReady('its ready script did not succeed, after reloading')
+        else:
+            # nothing can tell us that it's done reloading: just give it a poll-ready interval to get on with it
+            poll_ready = self.settings.poll_ready
+            if poll_ready is None:
+                poll_ready = DEFAULT_POLL_READY
+            if time.time() - since < poll_ready:
+                raise NotReady('it was only just signalled to reload')
+        self.assert_ready()
+
     def ensure_exists(self):
-        if self.__exists:
+        if self._exists:
             return
 
-        if not self.path.check(dir=True):
-            raise NoSuchService("No such service: '%s'" % bestrelpath(str(self.path)))
+        if not os.path.isdir(self.path):
+            raise NoSuchService("No such service: '%s'" % bestrelpath(self.path))
 
         self._ensure_supervise_is_scratch('supervise')
-        self.__exists = True
+        self._exists = True
 
     def ensure_logs(self):
         self.ensure_exists()
-        self.path.ensure_dir('logs')
-        self.path.join('logs').ensure('current')
-
-        self.path.ensure_dir('.log')
-        with open(self.path.join('.log', 'run').strpath, 'w') as log_run:
-            log_run.write(LOG_RUN_HEADER)
-            log_run.write(
-                'exec s6-log -b n5 s10485760 T {log_path}\n'.format(
-                    log_path=self.path.join('logs').strpath,
-                ),
-            )
-            log_run_stat = os.fstat(log_run.fileno())
-            os.fchmod(log_run.fileno(), log_run_stat.st_mode | stat.S_IXUSR)
+        fingerprint = scaffold.Fingerprint(
+            os.path.join(self.scratch_dir, 'scaffold-logs.json'),
+            spec=self.log_run_script,
+            watched=(
+                self.path, self.logger_path, self.logs_path,
+                # and the files and links we manage, in case they're replaced without touching their directory's mtime
+                os.path.join(self.path, 'logs'),
+                os.path.join(self.logger_path, 'run'),
+                os.path.join(self.logger_path, 'supervise'),
+            ),
+        )
+        if fingerprint.matches():
+            return
+
+        if self.state_dir is not None:
+            self._ensure_state_symlink('logs')
+        os.makedirs(self.logs_path, exist_ok=True)
+        scaffold.touch(self.logfile_path)
+
+        os.makedirs(self.logger_path, exist_ok=True)
+        scaffold.ensure_file(
+            os.path.join(self.logger_path, 'run'),
+            self.log_run_script.encode('UTF-8'),
+            mode=0o755,
+        )
 
         self._ensure_supervise_is_scratch('.log/supervise')
+        fingerprint.record()
+
+    @property
+    def log_rotation(self):
+        """The playground's log rotation, as overridden by this service's settings."""
+        settings = self.settings
+        overrides = {}
+        for field in LogRotation._fields:
+            value = getattr(settings, 'log_' + field)
+            if value is not None:
+                overrides[field] = value
+        return self.default_log_rotation._replace(**overrides)
 
     @property
-    def logfile_path(self):
-        return self.path.join('logs').join('current')
+    def log_filter(self):
+        """The pgctl-log-filter options for this service's log policy, if it has one."""
+        settings = self.settings
+        options = []
+        for option, value in (
+                ('--lines', settings.log_rate_lines),
+                ('--bytes', settings.log_rate_bytes),
+                ('--sample', settings.log_sample),
+        ):
+            if value:
+                options += [option, str(value)]
+        if settings.log_sample and settings.log_sample_match is not None:
+            options += ['--match', settings.log_sample_match]
+        return options
+
+    @property
+    def log_run_script(self):
+        command = 's6-log -b {directives} T {log_path}'.format(
+            directives=' '.join(self.log_rotation.directives),
+            log_path=self.logs_path,
+        )
+        log_filter = self.log_filter
+        if log_filter:
+            command = 'pgctl-log-filter {} -- {}'.format(' '.join(shlex.quote(arg) for arg in log_filter), command)
+        return LOG_RUN_HEADER + 'exec ' + command + '\n'
+
+    def ensure_lock(self):
+        """Ensure that the pgctl cli lock file exists, and return its path."""
+        if self.state_dir is not None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            scaffold.touch(self.lock_path)
+            self._ensure_state_symlink('.pgctl.lock')
+        return self.lock_path
+
+    def _ensure_state_symlink(self, state_rel_path):
+        # ensure symlink {service_dir}/state_rel_path -> {state_dir}/state_rel_path
+        # this keeps `less playground/foo/logs/current` and friends working when state lives elsewhere
+        in_service = os.path.join(self.path, state_rel_path)
+        in_state = os.path.join(self.state_dir, state_rel_path)
+        if os.path.isdir(in_service) and not os.path.islink(in_service) and not os.path.exists(in_state):
+            # migrate existing logs from before `statedir` was configured
+            os.makedirs(self.state_dir, exist_ok=True)
+            import shutil
+            shutil.move(in_service, in_state)
+        scaffold.ensure_symlink(in_state, in_service)
 
     def _ensure_supervise_is_scratch(self, supervise_rel_path):
         # ensure symlink {service_dir}/supervise_rel_path -> {scratch_dir}/supervise_rel_path
         # this will re-connect the service to its state descriptors if the symlinks have been deleted or moved
-        supervise_in_scratch = self.scratch_dir.join(supervise_rel_path)
-        supervise_in_scratch.ensure_dir()
-        symlink_if_necessary(
+        supervise_in_scratch = os.path.join(self.scratch_dir, supervise_rel_path)
+        os.makedirs(supervise_in_scratch, exist_ok=True)
+        scaffold.ensure_symlink(
             supervise_in_scratch,
-            self.path.join(supervise_rel_path),
+            os.path.join(self.path, supervise_rel_path),
         )
 
     def ensure_directory_structure(self):
@@ -255,16 +717,35 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
         # TODO: enforce that we have the supervise lock when this is called, somehow
         self.ensure_exists()
         self.ensure_logs()
-        self.path.ensure('nosetsid')  # see http://skarnet.org/software/s6/servicedir.html
-        from py._error import error as pylib_error
-        try:
-            self.path.join('down').remove()  # pgctl doesn't support the s6 down file
-        except pylib_error.ENOENT:
-            pass
+        # entries appearing or disappearing (e.g. `ready`) change the service directory's mtime
+        notification_fd = self.settings.notification_fd
+        fingerprint = scaffold.Fingerprint(
+            os.path.join(self.scratch_dir, 'scaffold-service.json'),
+            # a manifest edited in place doesn't change the service directory
+            spec=notification_fd,
+            watched=(self.path, os.path.join(self.path, 'nosetsid'), self.notification_fd, os.path.join(self.path, 'supervise')),
+        )
+        if fingerprint.matches():
+            return
+
+        scaffold.touch(os.path.join(self.path, 'nosetsid'))  # see http://skarnet.org/software/s6/servicedir.html
+        scaffold.ensure_absent(os.path.join(self.path, 'down'))  # pgctl doesn't support the s6 down file
 
-        if self.ready_script.exists():
-            with self.notification_fd.open('w') as f:
-                f.write('%i\n' % f.fileno())
+        if notification_fd is not None:
+            if self._written_notification_fd() != notification_fd:
+                # it's in the manifest, but s6-supervise reads only the file
+                scaffold.ensure_file(self.notification_fd, b'%i\n' % notification_fd)
+        elif os.path.exists(self.ready_script):
+            # the first descriptor after stdin, stdout and stderr
+            scaffold.ensure_file(self.notification_fd, b'3\n')
+        fingerprint.record()
+
+    def _written_notification_fd(self):
+        try:
+            with open(self.notification_fd) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
 
     @contextmanager
     def flock(self):
@@ -285,10 +766,12 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
                 from .flock import release
                 release(lock)
 
-        with flock(self.path.strpath) as lock:
+        if self.state_dir is not None:
+            os.makedirs(self.state_dir, exist_ok=True)
+        with flock(self.state_path) as lock:
             debug('LOCK: %i', lock)
             self.ensure_directory_structure()
-            with self.path.as_cwd():
+            with chdir(self.path):
                 yield lock
 
     def background(self):
@@ -297,7 +780,8 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
             return
 
         with self.flock() as lock:
-            log_fifo_path = self.path.join('log_pipe').strpath
+            self._forget_replica()
+            log_fifo_path = os.path.join(self.path, 'log_pipe')
 
             try:
                 os.mkfifo(log_fifo_path)
@@ -305,16 +789,19 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
                 if e.errno != errno.EEXIST:
                     raise
 
-            if not self.is_logger_running():
+            if self.shared_logger is not None:
+                self.shared_logger.add(self)
+            elif not self.is_logger_running():
                 Popen(
                     (
                         's6-supervise',
-                        self.path.join('.log').strpath,
+                        self.logger_path,
                     ),
                     env=self.supervise_env(lock, debug=False, logs=True),
                     preexec_fn=functools.partial(
                         logger_preexec,
                         log_fifo_path,
+                        self.settings.log_pipe_size,
                     ),
                     close_fds=True,
                 )
@@ -322,38 +809,45 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
             Popen(
                 (
                     's6-supervise',
-                    self.path.strpath,
+                    self.path,
                 ),
                 env=self.supervise_env(lock, debug=False),
                 preexec_fn=functools.partial(
                     supervisor_preexec,
                     log_fifo_path,
+                    self.settings.log_pipe_size,
                 ),
             )
 
     def foreground(self):
         with self.flock() as lock:
             exec_(
-                (str(self.path.join('run')),),
+                (os.path.join(self.path, 'run'),),
                 env=self.supervise_env(lock, debug=True),
             )  # never returns
 
+    def log_pipe_usage(self):
+        """A sample of how full the fifo to our logger is: if it's full, the service is waiting on its logger."""
+        return pipe_usage(self.path + '/log_pipe')
+
     def is_logger_running(self):
-        status = self._svstat_path(self.path.join('.log'))
+        if self.shared_logger is not None:
+            return self.shared_logger.logging(self)
+        status = self._svstat_path(self.logger_path)
         return status.state != SvStat.UNSUPERVISED
 
-    @cached_property
-    def name(self):
-        return self.path.basename
+    def supervise_env(self, lock, debug, logs=False, event_dir=None):
+        """Returns an environment dict to use for running supervise.
 
-    def supervise_env(self, lock, debug, logs=False):
-        """Returns an environment dict to use for running supervise."""
+        :param event_dir: s6-supervise's event fifodir, for pgctl-poll-ready, if it's not the service directory's
+        """
         env = dict(
             os.environ,
-            PGCTL_SCRATCH=str(self.scratch_dir),
+            PGCTL_SCRATCH=self.scratch_dir,
             # TODO-TEST: assert this env var is available and correct
-            PGCTL_SERVICE=str(self.path),
+            PGCTL_SERVICE=self.path,
             PGCTL_SERVICE_LOCK=str(lock),
+            PGCTL_RELOAD_NOTIFICATION=self.reload_notification_path,
         )
         if debug:
             env['PGCTL_DEBUG'] = 'true'
@@ -363,4 +857,8 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
             env.pop('PGCTL_SERVICE_PROCESS', None)
         else:
             env['PGCTL_SERVICE_PROCESS'] = 'true'
+        if event_dir is None:
+            env.pop('PGCTL_EVENT_DIR', None)
+        else:
+            env['PGCTL_EVENT_DIR'] = event_dir
         return frozendict(env)
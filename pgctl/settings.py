@@ -0,0 +1,273 @@
+"""
+Per-service settings.
+
+These come from an optional `service.yaml` manifest in the service directory, and from the single-value files
+pgctl has always supported (`timeout-ready`, `timeout-stop`, ...), which win when both are present.
+
+Parsing is cached in the scratch directory, keyed by the mtimes of the service directory and the files we read,
+so a command parses each service's settings at most once, and usually not at all.
+"""
+import json
+import os
+
+from .debug import trace
+from .errors import PgctlUserMessage
+from .scaffold import write_json
+
+
+MANIFEST = 'service.yaml'
+READY_SCRIPT = 'ready'
+
+
+def _number(value):
+    return float(str(value).strip())
+
+
+def _fd(value):
+    return int(_number(value))
+
+
+def _count(value):
+    count = int(str(value).strip())
+    if count < 0:
+        raise ValueError(value)
+    return count
+
+
+SIZE_SUFFIXES = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+
+def _size(value):
+    """A number of bytes, perhaps in KiB, MiB or GiB: 4096, 64k, 10M, 1G."""
+    value = str(value).strip()
+    suffix = value[-1:].lower() if value[-1:].isalpha() else ''
+    try:
+        multiplier = SIZE_SUFFIXES[suffix]
+    except KeyError:
+        raise ValueError(value)
+    return _count(value[:len(value) - len(suffix)]) * multiplier
+
+
+# how s6-log may compress a service's archived logs; 'none' overrides a playground-wide default
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+
+
+def _compression(value):
+    value = str(value).strip()
+    if value not in COMPRESSIONS:
+        raise ValueError(value)
+    return value
+
+
+def _regex(value):
+    import re
+    value = str(value)
+    try:
+        re.compile(value)
+    except re.error:
+        raise ValueError(value)
+    return value
+
+
+# the signals a service may ask to be reloaded with: those the supervisor can send (see pgctl.service.SVC_SIGNALS)
+RELOAD_SIGNALS = ('HUP', 'USR1', 'USR2', 'INT', 'QUIT', 'ALRM')
+
+
+def _signal(value):
+    """A signal's name, with or without its SIG: hup, SIGHUP, USR1."""
+    value = str(value).strip().upper()
+    if value.startswith('SIG'):
+        value = value[3:]
+    if value not in RELOAD_SIGNALS:
+        raise ValueError(value)
+    return value
+
+
+# how `pgctl restart` restarts a service: stop then start, or start a replacement then stop the original
+RESTART_MODES = ('stop-start', 'replace')
+
+
+def _restart_mode(value):
+    value = str(value).strip()
+    if value not in RESTART_MODES:
+        raise ValueError(value)
+    return value
+
+
+def _flag(value):
+    value = str(value).strip().lower()
+    if value in ('true', 'yes', 'on', '1'):
+        return True
+    elif value in ('false', 'no', 'off', '0'):
+        return False
+    else:
+        raise ValueError(value)
+
+
+# setting -> (manifest key / legacy file name, parser)
+FIELDS = {
+    'timeout_ready': ('timeout-ready', _number),
+    'timeout_stop': ('timeout-stop', _number),
+    'poll_ready': ('poll-ready', _number),
+    'poll_down': ('poll-down', _number),
+    'notification_fd': ('notification-fd', _fd),
+    # s6-log's rotation of the service's logs: see pgctl.service.LogRotation
+    'log_archives': ('log-archives', _count),
+    'log_archive_size': ('log-archive-size', _size),
+    'log_total_size': ('log-total-size', _size),
+    'log_compress': ('log-compress', _compression),
+    # the capacity of the fifo between the service and its logger
+    'log_pipe_size': ('log-pipe-size', _size),
+    # the service's log policy, applied by pgctl-log-filter: see pgctl.log_filter
+    'log_rate_lines': ('log-rate-lines', _count),
+    'log_rate_bytes': ('log-rate-bytes', _size),
+    'log_sample': ('log-sample', _count),
+    'log_sample_match': ('log-sample-match', _regex),
+    # how `pgctl reload` tells the service to reload; services without one are restarted instead
+    'reload_signal': ('reload-signal', _signal),
+    # should `pgctl reload` wait for the service's ready script to succeed again?
+    'reload_ready': ('reload-ready', _flag),
+    # see pgctl.cli.Replace: for services that can share their sockets with a second instance of themselves
+    'restart_mode': ('restart-mode', _restart_mode),
+}
+# settings whose file pgctl writes from the manifest, for s6: there, the manifest wins
+GENERATED = frozenset(('notification_fd',))
+# every directory entry whose content or presence affects the settings
+INPUTS = frozenset((MANIFEST, READY_SCRIPT) + tuple(filename for filename, _ in FIELDS.values()))
+
+
+class InvalidManifest(PgctlUserMessage):
+    """A service's settings could not be understood."""
+
+
+class ServiceSettings:
+    """The parsed settings of a single service; unset values are None."""
+    __slots__ = tuple(FIELDS) + ('has_ready_script',)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError('unexpected settings: %s' % ', '.join(sorted(values)))
+
+    @property
+    def uses_notification(self):
+        """Does s6 get told when this service is ready? (pgctl writes `notification-fd` for `ready` scripts.)"""
+        return self.notification_fd is not None or bool(self.has_ready_script)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join('{}={!r}'.format(name, value) for name, value in self.to_dict().items()),
+        )
+
+
+def _parse_manifest(path):
+    import yaml
+    with open(path) as f:
+        try:
+            manifest = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        except yaml.YAMLError as error:
+            raise InvalidManifest(f'{path}: {error}')
+    if manifest is None:
+        return {}
+    elif not isinstance(manifest, dict):
+        raise InvalidManifest(f'{path}: expected a mapping, got: {manifest!r}')
+
+    by_key = {key: (name, parser) for name, (key, parser) in FIELDS.items()}
+    values = {}
+    for key, value in manifest.items():
+        try:
+            name, parser = by_key[key]
+        except KeyError:
+            raise InvalidManifest(
+                '{}: unknown setting: {!r} (expected one of: {})'.format(path, key, ', '.join(sorted(by_key))),
+            )
+        try:
+            values[name] = parser(value)
+        except ValueError:
+            raise InvalidManifest(f'{path}: bad value for {key}: {value!r}')
+    return values
+
+
+def _present_inputs(service_dir):
+    with os.scandir(service_dir) as entries:
+        return sorted(entry.name for entry in entries if entry.name in INPUTS)
+
+
+def parse(service_dir, present=None):
+    """Read the settings of the service at `service_dir`."""
+    if present is None:
+        present = _present_inputs(service_dir)
+
+    values = {'has_ready_script': READY_SCRIPT in present}
+    manifest = {}
+    if MANIFEST in present:
+        manifest = _parse_manifest(os.path.join(service_dir, MANIFEST))
+        values.update(manifest)
+    for name, (filename, parser) in FIELDS.items():
+        if name in GENERATED and name in manifest:
+            continue
+        if filename in present:
+            with open(os.path.join(service_dir, filename)) as f:
+                values[name] = parser(f.read())
+    return ServiceSettings(**values)
+
+
+def _validation_key(service_dir, present):
+    """(inode, mtime) of the service directory and of each input; None if any input has since disappeared."""
+    def stamp(path):
+        stat = os.stat(path)
+        return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+    try:
+        return [stamp(service_dir)] + [stamp(os.path.join(service_dir, name)) for name in present]
+    except FileNotFoundError:
+        return None
+
+
+def load_record(service_dir, record=None):
+    """Load a service's settings from a cache `record`, if it's still valid.
+
+    Returns the settings, and the record to cache if it has changed (otherwise None).
+    """
+    service_dir = os.fspath(service_dir)
+    try:
+        if record['key'] == _validation_key(service_dir, record['present']):
+            return ServiceSettings(**record['settings']), None
+    except (KeyError, TypeError):
+        pass
+
+    trace('SETTINGS: parsing %s', service_dir)
+    present = _present_inputs(service_dir)
+    # take the key first: a change racing with our parse will invalidate the cache next time
+    key = _validation_key(service_dir, present)
+    settings = parse(service_dir, present)
+    return settings, {'key': key, 'present': present, 'settings': settings.to_dict()}
+
+
+def load(service_dir, scratch_dir=None):
+    """Load a service's settings, from the cache in `scratch_dir` if it's still valid."""
+    if scratch_dir is None:
+        return parse(os.fspath(service_dir))
+
+    cache_path = os.path.join(os.fspath(scratch_dir), 'settings.json')
+    try:
+        with open(cache_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = None
+
+    settings, record = load_record(service_dir, record)
+    if record is not None:
+        try:
+            write_json(cache_path, record)
+        except OSError as error:  # the cache is only an optimization
+            trace('SETTINGS: could not cache: %s', error)
+    return settings
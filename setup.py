@@ -21,11 +21,7 @@ def main():
         python_requires='>=3.6',
         packages=find_packages(exclude=('tests*',)),
         install_requires=[
-            'frozendict',
-            'cached-property',
-            'contextlib2',
-            # 1.4.32 adds PathLike compatibility to py.path
-            'py>=1.4.32',
+            'cached-property; python_version < "3.8"',
             'pyyaml',
             's6',
         ],
@@ -38,6 +34,9 @@ def main():
                 'pgctl = pgctl.cli:main',
                 'pgctl-poll-ready = pgctl.poll_ready:main',
                 'pgctl-fuser = pgctl.fuser:main',
+                'pgctl-log-filter = pgctl.log_filter:main',
+                'pgctl-log-mux = pgctl.log_mux:main',
+                'pgctld = pgctl.daemon:main',
             ],
         },
 
@@ -78,12 +78,9 @@ class DescribeOrphanSubprocess(DirtyTest):
         assert_command(
             ('pgctl', 'log'),
             '''\
-==> playground/slow-startup/logs/current <==
-{TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
-
-==> playground/sweet/logs/current <==
-{TIMESTAMP} sweet
-{TIMESTAMP} sweet_error
+[sweet]        {TIMESTAMP} sweet
+[sweet]        {TIMESTAMP} sweet_error
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
 ''',
             '',
             0,
@@ -96,7 +93,7 @@ class DescribeOrphanSubprocess(DirtyTest):
             ('pgctl', 'restart', 'sweet'),
             '',
             '''\
-[pgctl] Stopping: sweet
+[pgctl] Restarting: sweet
 [pgctl] WARNING: Killing these runaway processes which did not stop:
 {PS-HEADER}
 {PS-STATS} sleep infinity
@@ -118,7 +115,7 @@ Learn more: https://pgctl.readthedocs.org/en/latest/user/quickstart.html#writing
             ('pgctl', 'restart', 'slow-startup'),
             '',
             '''\
-[pgctl] Stopping: slow-startup
+[pgctl] Restarting: slow-startup
 [pgctl] WARNING: Killing these runaway processes which did not stop:
 {PS-HEADER}
 {PS-STATS} sleep 987654
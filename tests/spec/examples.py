@@ -1,6 +1,7 @@
 import json
 import os
 import subprocess
+import time
 from unittest import mock
 
 import pytest
@@ -13,6 +14,7 @@ from testing.subprocess import ctrl_c
 from testing.subprocess import run
 
 from pgctl.daemontools import SvStat
+from pgctl.daemontools import svstat
 from pgctl.subprocess import check_call
 from pgctl.subprocess import PIPE
 from pgctl.subprocess import Popen
@@ -33,11 +35,7 @@ class DescribePgctlLog:
     def it_is_empty_before_anything_starts(self, in_example_dir):
         assert_command(
             ('pgctl', 'log'),
-            '''\
-==> playground/ohhi/logs/current <==
-
-==> playground/sweet/logs/current <==
-''',
+            '',
             '',
             0,
         )
@@ -48,11 +46,8 @@ class DescribePgctlLog:
         assert_command(
             ('pgctl', 'log'),
             '''\
-==> playground/ohhi/logs/current <==
-
-==> playground/sweet/logs/current <==
-{TIMESTAMP} sweet
-{TIMESTAMP} sweet_error
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
 ''',
             '',
             0,
@@ -64,13 +59,10 @@ class DescribePgctlLog:
         assert_command(
             ('pgctl', 'log'),
             '''\
-==> playground/ohhi/logs/current <==
-
-==> playground/sweet/logs/current <==
-{TIMESTAMP} sweet
-{TIMESTAMP} sweet_error
-{TIMESTAMP} sweet
-{TIMESTAMP} sweet_error
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
 ''',
             '',
             0,
@@ -92,8 +84,6 @@ class DescribePgctlLog:
 
         assert p.poll() is None  # it's still running
 
-        # needs to loop for several seconds because the default event loop
-        # in tail-f is one second.
         # TODO: buf is a list, use wait_for() to append to it
         limit = 3.0
         wait = .1
@@ -120,15 +110,11 @@ class DescribePgctlLog:
         buf = norm.pgctl(buf.decode('UTF-8'))
         print('NORMED:')
         print(buf)
+        # ohhi logs continuously, so its lines are interleaved with sweet's
         assert buf == S('''(?s)\
-==> playground/ohhi/logs/current <==
-{TIMESTAMP} [oe].*
-==> playground/sweet/logs/current <==
-{TIMESTAMP} sweet
-{TIMESTAMP} sweet_error
-
-==> playground/ohhi/logs/current <==
-.*{TIMESTAMP} .*$''')
+.*\\[sweet\\] {TIMESTAMP} sweet
+.*\\[sweet\\] {TIMESTAMP} sweet_error
+.*\\[ohhi\\]  {TIMESTAMP} .*$''')
         assert p.poll() is None  # it's still running
 
         p.terminate()
@@ -175,6 +161,58 @@ class DescribePgctlLog:
         """When printing to a file, don't produce color, by default. V3"""
 
 
+class DescribeSharedLogger:
+
+    @pytest.fixture
+    def service_name(self):
+        yield 'output'
+
+    @pytest.fixture(autouse=True)
+    def shared_logger(self):
+        with mock.patch.dict(os.environ, {'PGCTL_SHARED_LOGGER': 'true'}):
+            yield
+
+    def it_logs_all_services_through_one_logger(self, in_example_dir):
+        check_call(('pgctl', 'start', 'sweet', 'sleep'))
+        # no service has an s6-log of its own
+        assert_svstat('playground/sweet/.log', state=SvStat.UNSUPERVISED)
+        assert_svstat('playground/sleep/.log', state=SvStat.UNSUPERVISED)
+
+        wait_for(lambda: assert_command(
+            ('pgctl', 'log', 'sweet'),
+            '''\
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
+''',
+            '',
+            0,
+            norm=norm.pgctl,
+        ))
+
+        check_call(('pgctl', 'stop', 'sweet'))
+        check_call(('pgctl', 'restart', 'sweet'))
+        wait_for(lambda: assert_command(
+            ('pgctl', 'log', 'sweet'),
+            '''\
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
+[sweet] {TIMESTAMP} sweet
+[sweet] {TIMESTAMP} sweet_error
+''',
+            '',
+            0,
+            norm=norm.pgctl,
+        ))
+
+    def it_stops_the_logger_with_the_last_service(self, in_example_dir):
+        check_call(('pgctl', 'start', 'sweet', 'sleep'))
+        check_call(('pgctl', 'stop', 'sweet'))
+        assert 'pgctl-log-mux' in subprocess.check_output(('ps', '-o', 'args=', '-u', str(os.getuid()))).decode()
+
+        check_call(('pgctl', 'stop', 'sleep'))
+        assert 'pgctl-log-mux' not in subprocess.check_output(('ps', '-o', 'args=', '-u', str(os.getuid()))).decode()
+
+
 class DescribeDateExample:
 
     @pytest.fixture
@@ -235,6 +273,21 @@ class DescribeStart:
         check_call(('pgctl', 'start', 'sleep'))
         check_call(('pgctl', 'start', 'sleep'))
 
+    def it_waits_for_a_notification_fd_from_the_manifest(self, in_example_dir):
+        service = in_example_dir.join('playground', 'sleep')
+        service.join('run').write('#!/bin/bash\necho ready >&5\nexec sleep infinity\n')
+        service.join('service.yaml').write('notification-fd: 5\n')
+        assert_command(
+            ('pgctl', 'start', 'sleep'),
+            '',
+            '''\
+[pgctl] Starting: sleep
+[pgctl] Started: sleep
+''',
+            0,
+        )
+        assert_svstat('playground/sleep', state='ready')
+
     def it_should_work_in_a_subdirectory(self, in_example_dir):
         os.chdir(in_example_dir.join('playground').strpath)
         assert_command(
@@ -319,13 +372,13 @@ class DescribeStop:
 
 class DescribeRestart:
 
-    def it_is_just_stop_then_start(self, in_example_dir):
+    def it_is_stop_then_start(self, in_example_dir):
+        # there's nothing to stop
         assert_command(
             ('pgctl', 'restart', 'sleep'),
             '',
             '''\
-[pgctl] Already stopped: sleep
-[pgctl] Starting: sleep
+[pgctl] Restarting: sleep
 [pgctl] Started: sleep
 ''',
             0,
@@ -340,7 +393,7 @@ class DescribeRestart:
             ('pgctl', 'restart', 'sleep'),
             '',
             '''\
-[pgctl] Stopping: sleep
+[pgctl] Restarting: sleep
 [pgctl] Stopped: sleep
 [pgctl] Starting: sleep
 [pgctl] Started: sleep
@@ -349,6 +402,53 @@ class DescribeRestart:
         )
         assert_svstat('playground/sleep', state='up')
 
+    def it_can_start_the_replacement_first(self, in_example_dir):
+        in_example_dir.join('playground', 'sleep', 'service.yaml').write('restart-mode: replace\n')
+        check_call(('pgctl', 'start', 'sleep'))
+        original = svstat('playground/sleep').pid
+
+        assert_command(
+            ('pgctl', 'restart', 'sleep'),
+            '',
+            '''\
+[pgctl] Restarting: sleep
+[pgctl] Started replacement: sleep
+[pgctl] Stopping original: sleep
+[pgctl] Stopped original: sleep
+[pgctl] Replacing: sleep
+[pgctl] Replaced: sleep
+''',
+            0,
+        )
+        assert_svstat('playground/sleep', state='up')
+        assert svstat('playground/sleep').pid != original
+
+        check_call(('pgctl', 'stop', 'sleep'))
+        assert_svstat('playground/sleep', state=SvStat.UNSUPERVISED)
+
+    def it_keeps_polling_the_replacement(self, in_example_dir):
+        service = in_example_dir.join('playground', 'sleep')
+        service.join('run').write('#!/bin/bash\nexec pgctl-poll-ready sleep infinity\n')
+        service.join('ready').write('#!/bin/bash\n! [ -e broken ]\n')
+        service.join('ready').chmod(0o755)
+        service.join('service.yaml').write('restart-mode: replace\ntimeout-ready: 1\npoll-ready: 0.05\npoll-down: 0.05\n')
+        check_call(('pgctl', 'start', 'sleep'))
+        check_call(('pgctl', 'restart', 'sleep'))
+        replacement = svstat('playground/sleep').pid
+
+        # stopping the original stopped its pgctl-poll-ready, but not the replacement's
+        wait_for(lambda: 'service is stopping -- quitting the poll' in service.join('logs', 'current').read())
+        time.sleep(0.5)
+        assert service.join('logs', 'current').read().count('quitting the poll') == 1
+        assert_svstat('playground/sleep', state='ready', pid=replacement)
+
+        # ...which restarts it, once it fails its ready check for long enough
+        service.join('broken').ensure()
+        wait_for(lambda: 'we are restarting this service for you' in service.join('logs', 'current').read())
+        service.join('broken').remove()
+        wait_for(lambda: svstat('playground/sleep').pid not in (None, replacement))
+        wait_for(lambda: assert_svstat('playground/sleep', state='ready'))
+
 
 class DescribeStartMultipleServices:
 
@@ -412,6 +512,7 @@ class DescribeStatus:
         assert json.loads(stdout) == {
             'sleep': {
                 'exitcode': None,
+                'log_pipe': {'buffered': 0, 'capacity': ANY_INTEGER()},
                 'pid': None,
                 'process': None,
                 'seconds': None,
@@ -440,6 +541,7 @@ class DescribeStatus:
         assert json.loads(stdout) == {
             'sleep': {
                 'exitcode': None,
+                'log_pipe': {'buffered': ANY_INTEGER(), 'capacity': ANY_INTEGER()},
                 'pid': ANY_INTEGER(),
                 'process': None,
                 'seconds': ANY_INTEGER(),
@@ -473,6 +575,7 @@ class DescribeStatus:
         assert json.loads(stdout) == {
             'sleep': {
                 'exitcode': None,
+                'log_pipe': {'buffered': ANY_INTEGER(), 'capacity': ANY_INTEGER()},
                 'pid': ANY_INTEGER(),
                 'process': None,
                 'seconds': ANY_INTEGER(),
@@ -480,6 +583,7 @@ class DescribeStatus:
             },
             'tail': {
                 'exitcode': None,
+                'log_pipe': None,
                 'pid': None,
                 'process': None,
                 'seconds': None,
@@ -542,16 +646,98 @@ class DescribeStatus:
 
 class DescribeReload:
 
-    def it_is_unimplemented(self, in_example_dir):
+    def it_restarts_services_that_cannot_reload(self, in_example_dir):
         assert_command(
             ('pgctl', 'reload'),
             '',
             '''\
-[pgctl] reload: sleep
-[pgctl] ERROR: reloading is not yet implemented.
+[pgctl] Restarting: sleep
+[pgctl] Started: sleep
 ''',
-            1,
+            0,
+        )
+        assert_svstat('playground/sleep', state='up')
+
+    def it_signals_services_that_can(self, in_example_dir):
+        service = in_example_dir.join('playground', 'sleep')
+        service.join('run').write('''\
+#!/bin/bash
+trap 'echo reloading' HUP
+while true; do sleep 1 & wait; done
+''')
+        service.join('service.yaml').write('reload-signal: HUP\n')
+        check_call(('pgctl', 'start', 'sleep'))
+        pid = svstat('playground/sleep').pid
+
+        assert_command(
+            ('pgctl', 'reload'),
+            '',
+            '''\
+[pgctl] Reloading: sleep
+[pgctl] Reloaded: sleep
+''',
+            0,
         )
+        # the same process, reloaded in place
+        assert_svstat('playground/sleep', state='up', pid=pid)
+        wait_for(lambda: 'reloading' in service.join('logs', 'current').read())
+
+    def it_waits_for_a_service_to_notify_that_it_reloaded(self, in_example_dir):
+        service = in_example_dir.join('playground', 'sleep')
+        service.join('run').write('''\
+#!/bin/bash
+trap 'sleep 1; echo reloaded > "$PGCTL_RELOAD_NOTIFICATION"' HUP
+while true; do sleep 1 & wait; done
+''')
+        service.join('service.yaml').write('reload-signal: HUP\nreload-ready: true\n')
+        check_call(('pgctl', 'start', 'sleep'))
+
+        start = time.time()
+        assert_command(
+            ('pgctl', 'reload'),
+            '',
+            '''\
+[pgctl] Reloading: sleep
+[pgctl] Reloaded: sleep
+''',
+            0,
+        )
+        assert time.time() - start >= 1
+
+    def it_waits_for_a_service_that_is_slow_to_reload(self, in_example_dir):
+        service = in_example_dir.join('playground', 'sleep')
+        service.join('run').write('''\
+#!/bin/bash
+exec pgctl-poll-ready ./serve
+''')
+        service.join('serve').write('''\
+#!/bin/bash
+date +%s.%N > loaded-at
+trap 'sleep 1; date +%s.%N > loaded-at' HUP
+while true; do sleep 1 & wait; done
+''')
+        service.join('serve').chmod(0o755)
+        service.join('ready').write('''\
+#!/bin/bash
+[ "$(cat loaded-at)" \\> "${PGCTL_RELOAD_TIME:-0}" ]
+''')
+        service.join('ready').chmod(0o755)
+        service.join('service.yaml').write('reload-signal: HUP\nreload-ready: true\n')
+        check_call(('pgctl', 'start', 'sleep'))
+
+        start = time.time()
+        assert_command(
+            ('pgctl', 'reload'),
+            '',
+            '''\
+[pgctl] Reloading: sleep
+[pgctl] Reloaded: sleep
+''',
+            0,
+        )
+        # the old configuration was ready all along: we waited for the new one
+        assert time.time() - start >= 1
+        assert float(service.join('loaded-at').read()) >= start
 
 
 class DescribeAliases:
@@ -628,8 +814,7 @@ class DescribeEnvironment:
         assert_command(
             ('pgctl', 'log'),
             '''\
-==> playground/environment/logs/current <==
-{TIMESTAMP} ohhi
+[environment] {TIMESTAMP} ohhi
 ''',
             '',
             0,
@@ -641,9 +826,8 @@ class DescribeEnvironment:
         assert_command(
             ('pgctl', 'log'),
             '''\
-==> playground/environment/logs/current <==
-{TIMESTAMP} ohhi
-{TIMESTAMP} bye
+[environment] {TIMESTAMP} ohhi
+[environment] {TIMESTAMP} bye
 ''',
             '',
             0,
@@ -706,14 +890,13 @@ class DescribeDependentServices:
         wait_for(lambda: assert_command(
             ('pgctl', 'log', 'A'),
             '''\
-==> playground/A/logs/current <==
-{TIMESTAMP} [pgctl] Starting: B
-{TIMESTAMP} [pgctl] DEBUG: parentlock: '%s/playground/A'
-{TIMESTAMP} [pgctl] DEBUG: LOCK: ${LOCK}
-{TIMESTAMP} [pgctl] DEBUG: loop: check_time $TIME
-{TIMESTAMP} [pgctl] Started: B
-{TIMESTAMP} this is stdout
-{TIMESTAMP} this is stderr
+[A] {TIMESTAMP} [pgctl] Starting: B
+[A] {TIMESTAMP} [pgctl] DEBUG: parentlock: '%s/playground/A'
+[A] {TIMESTAMP} [pgctl] DEBUG: LOCK: ${LOCK}
+[A] {TIMESTAMP} [pgctl] DEBUG: loop: check_time $TIME
+[A] {TIMESTAMP} [pgctl] Started: B
+[A] {TIMESTAMP} this is stdout
+[A] {TIMESTAMP} this is stderr
 ''' % in_example_dir,
             '',
             0,
@@ -856,3 +1039,21 @@ hello, i am a post-stop script
             0,
             norm=norm.pgctl,
         )
+
+    @pytest.mark.usefixtures('in_example_dir')
+    def it_runs_between_stopping_and_starting_everything_on_restart(self):
+        check_call(('pgctl', 'start', 'A'))
+        check_call(('pgctl', 'start', 'B'))
+
+        stdout, stderr, returncode = run(('pgctl', 'restart'))
+        assert returncode == 0
+        # everything is down at once, and the hook runs before anything starts again
+        assert stderr.index('[pgctl] Stopped: A\n') < stderr.index('hello, i am a post-stop script\n')
+        assert stderr.index('[pgctl] Stopped: B\n') < stderr.index('hello, i am a post-stop script\n')
+        assert stderr.index('hello, i am a post-stop script\n') < stderr.index('[pgctl] Starting: A, B\n')
+
+        # with B up throughout, the playground is never fully stopped
+        check_call(('pgctl', 'stop', 'A'))
+        stdout, stderr, returncode = run(('pgctl', 'restart', 'A'))
+        assert returncode == 0
+        assert stderr == '[pgctl] Restarting: A\n[pgctl] Started: A\n'
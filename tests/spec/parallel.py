@@ -40,7 +40,7 @@ def it_is_disallowed():
     first_stdout, first_stderr = first_stdout.decode('UTF-8'), first_stderr.decode('UTF-8')
     show_both(first_stdout, first_stderr)
     assert norm.pgctl(first_stderr) == '''\
-[pgctl] Stopping: sweet
+[pgctl] Restarting: sweet
 [pgctl] ERROR: service 'sweet' failed to stop after {TIME} seconds, its status is ready (pid {PID}) {TIME} seconds
 ==> playground/sweet/logs/current <==
 {TIMESTAMP} sweet
@@ -48,7 +48,7 @@ def it_is_disallowed():
 [pgctl]
 [pgctl] There might be useful information further up in the log; you can view it by running:
 [pgctl]     less +G playground/sweet/logs/current
-[pgctl] ERROR: Some services failed to stop: sweet
+[pgctl] ERROR: Some services failed to restart: sweet
 '''
     assert first_stdout == ''
     assert first.returncode == 1
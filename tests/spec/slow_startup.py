@@ -44,9 +44,8 @@ def assert_it_times_out_regardless_force(is_force):
     assert_command(
         ('pgctl', 'log'),
         '''\
-==> playground/slow-startup/logs/current <==
-{TIMESTAMP} waiting {TIME} seconds to become ready
-{TIMESTAMP} pgctl-poll-ready: service is stopping -- quitting the poll
+[slow-startup] {TIMESTAMP} waiting {TIME} seconds to become ready
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: service is stopping -- quitting the poll
 ''',
         '',
         0,
@@ -93,37 +92,36 @@ def it_restarts_on_unready():
     assert_command(
         ('pgctl', 'log'),
         '''\
-==> playground/slow-startup/logs/current <==
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed for more than {TIME} seconds -- we are restarting this service for you
-{TIMESTAMP} [pgctl] Stopping: slow-startup
-{TIMESTAMP} [pgctl] Stopped: slow-startup
-{TIMESTAMP} [pgctl] Starting: slow-startup
-{TIMESTAMP} waiting {TIME} seconds to become ready
-{TIMESTAMP} becoming ready now
-{TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
-{TIMESTAMP} [pgctl] Started: slow-startup
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: failed for more than {TIME} seconds -- we are restarting this service for you
+[slow-startup] {TIMESTAMP} [pgctl] Stopping: slow-startup
+[slow-startup] {TIMESTAMP} [pgctl] Stopped: slow-startup
+[slow-startup] {TIMESTAMP} [pgctl] Starting: slow-startup
+[slow-startup] {TIMESTAMP} waiting {TIME} seconds to become ready
+[slow-startup] {TIMESTAMP} becoming ready now
+[slow-startup] {TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
+[slow-startup] {TIMESTAMP} [pgctl] Started: slow-startup
 ''',
         '',
         0,
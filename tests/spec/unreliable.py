@@ -29,10 +29,9 @@ def it_fails_twice_but_doesnt_restart():
     assert_command(
         ('pgctl', 'log'),
         '''\
-==> playground/unreliable/logs/current <==
-{TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
-{TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[unreliable] {TIMESTAMP} pgctl-poll-ready: service's ready check succeeded
+[unreliable] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
+[unreliable] {TIMESTAMP} pgctl-poll-ready: failed (restarting in {TIME} seconds)
 ''',
         '',
         0,
@@ -18,8 +18,8 @@ class Normalized(str):
 class timestamp(Normalized):
     """normalize pgctl's output"""
     rules = (
-        # 2015-10-16 17:05:56.635827500
-        (Regex(r'(?m)^\d{4}(-\d\d){2} (\d\d:){2}\d\d\.\d{6,9}  '), '{TIMESTAMP} '),
+        # 2015-10-16 17:05:56.635827500, perhaps labelled by `pgctl log` with its service
+        (Regex(r'(?m)^(\[\S+\] +)?\d{4}(-\d\d){2} (\d\d:){2}\d\d\.\d{6,9}  '), r'\1{TIMESTAMP} '),
     )
 
 
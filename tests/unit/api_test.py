@@ -0,0 +1,96 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from pgctl.api import AsyncPlayground
+from pgctl.api import CommandFailed
+from pgctl.api import Playground
+from pgctl.api import ServiceStatus
+from pgctl.cli import PgctlApp
+from pgctl.cli import ServiceChange
+from pgctl.errors import NoSuchService
+from pgctl.errors import PgctlUserMessage
+
+
+DOWN = {'state': 'down', 'pid': None, 'exitcode': None, 'seconds': 3, 'process': None}
+READY = {'state': 'ready', 'pid': 1234, 'exitcode': None, 'seconds': 0, 'process': None}
+
+
+@pytest.fixture
+def project(tmpdir):
+    tmpdir.ensure_dir('playground', 'web')
+    tmpdir.ensure_dir('playground', 'db')
+    yield tmpdir
+
+
+@pytest.fixture
+def playground(project):
+    yield Playground(project.strpath, pghome=project.join('pghome').strpath)
+
+
+@pytest.fixture(autouse=True)
+def service_state():
+    with mock.patch.object(PgctlApp, '_service_state', autospec=True) as service_state:
+        service_state.side_effect = lambda app, service: dict(READY if service.name == 'web' else DOWN)
+        yield service_state
+
+
+def it_is_quiet_and_configurable(playground, project):
+    assert playground.config['quiet'] is True
+    assert playground.config['pghome'] == project.join('pghome').strpath
+    assert playground.config['pgdir'] == 'playground'
+
+
+def it_reports_status(playground):
+    assert playground.status() == {
+        'db': ServiceStatus(**DOWN),
+        'web': ServiceStatus(**READY),
+    }
+    assert tuple(playground.status('web')) == ('web',)
+
+
+def it_reports_each_service_change(playground, project):
+    def start(app):
+        app.changes['web'] = ServiceChange('start', 1.5, None)
+
+    with mock.patch.object(PgctlApp, 'start', autospec=True, side_effect=start):
+        result = playground.start('web', 'db')
+
+    assert result.ok
+    web = result.service('web')
+    assert web.status.pid == 1234
+    assert web.duration == 1.5
+    assert web.logfile == project.join('playground', 'web', 'logs', 'current').strpath
+    # db was already started
+    assert result.service('db').duration is None
+
+
+def it_raises_on_failure_with_the_results(playground):
+    def start(app):
+        app.changes['db'] = ServiceChange('start', 2.0, "service 'db' is not ready")
+        raise PgctlUserMessage('Some services failed to start: db')
+
+    with mock.patch.object(PgctlApp, 'start', autospec=True, side_effect=start):
+        with pytest.raises(CommandFailed) as error:
+            playground.start('web', 'db')
+        assert [service.name for service in error.value.result.failed] == ['db']
+
+        result = playground.start('web', 'db', check=False)
+        assert not result.ok
+        assert result.service('db').failure == "service 'db' is not ready"
+
+
+def it_raises_other_errors_as_is(playground):
+    with pytest.raises(NoSuchService):
+        playground.stop('nope')
+
+
+def it_has_an_async_variant(project):
+    playground = AsyncPlayground(project.strpath, pghome=project.join('pghome').strpath)
+    loop = asyncio.new_event_loop()
+    try:
+        status = loop.run_until_complete(playground.status('db'))
+    finally:
+        loop.close()
+    assert status == {'db': ServiceStatus(**DOWN)}
@@ -1,4 +1,9 @@
+import collections
+import contextlib
+import json
+import os
 import sys
+import time
 from unittest import mock
 
 import pytest
@@ -8,6 +13,11 @@ from pgctl.cli import _humanize_seconds
 from pgctl.cli import PgctlApp
 from pgctl.cli import TermStyle
 from pgctl.daemontools import SvStat
+from pgctl.errors import NotReady
+from pgctl.errors import PgctlUserMessage
+from pgctl.functions import frozendict
+from pgctl.functions import PipeUsage
+from pgctl.service import LogRotation
 from pgctl.service import Service
 
 
@@ -38,11 +48,7 @@ def fake_statuses(statuses):
     app = PgctlApp()
     app.services = []
     for name, status in statuses:
-        service = Service('/dev/null', '/dev/null', 100, True)
-        service.svstat = mock.Mock(spec=service.svstat)
-        service.svstat.return_value = status
-        service.name = name
-        app.services.append(service)
+        app.services.append(Service(os.path.join('/dev/null', name), '/dev/null', 100, True))
     return app
 
 
@@ -59,7 +65,10 @@ def fake_statuses(statuses):
     ),
 ])
 def test_status(statuses, expected):
-    with mock.patch.object(pgctl.cli, 'unbuf_print') as mock_print:
+    by_name = dict(statuses)
+    with mock.patch.object(pgctl.cli, 'unbuf_print') as mock_print, mock.patch.object(
+            Service, 'svstat', autospec=True, side_effect=lambda service: by_name[service.name],
+    ):
         app = fake_statuses(statuses)
         app.status()
 
@@ -69,6 +78,24 @@ def test_status(statuses, expected):
     assert printed == expected
 
 
+def test_status_json_samples_log_pipes(capsys):
+    statuses = (('derp', SvStat('up', 5678, None, 23, None)), ('herp', SvStat('down', None, None, 23, None)))
+    by_name = dict(statuses)
+    usage = {'derp': PipeUsage(65536, 65536), 'herp': None}
+    with mock.patch.object(
+            Service, 'svstat', autospec=True, side_effect=lambda service: by_name[service.name],
+    ), mock.patch.object(
+            Service, 'log_pipe_usage', autospec=True, side_effect=lambda service: usage[service.name],
+    ):
+        app = fake_statuses(statuses)
+        app.pgconf = dict(app.pgconf, json=True)
+        app.status()
+
+    status = json.loads(capsys.readouterr().out)
+    assert status['derp']['log_pipe'] == {'buffered': 65536, 'capacity': 65536}
+    assert status['herp']['log_pipe'] is None
+
+
 def test_stop_logs_state():
     """Because StopLogs executes a SIGKILL, the timeout can go unused in tests,
     which causes coverage to miss the function. So we test it directly here.
@@ -77,3 +104,416 @@ def test_stop_logs_state():
         timeout_stop = 5
         name = 'fake_service'
     assert pgctl.cli.StopLogs(FakeService).get_timeout() == 5
+
+
+def test_log_rotation_from_config():
+    app = PgctlApp(dict(pgctl.cli.PGCTL_DEFAULTS, log_archives='20', log_total_size='1G', log_compress='gzip'))
+    assert app.log_rotation == LogRotation(archives=20, total_size=1 << 30, compress='gzip')
+
+
+def test_bad_log_rotation_config():
+    app = PgctlApp(dict(pgctl.cli.PGCTL_DEFAULTS, log_archive_size='lots'))
+    with pytest.raises(PgctlUserMessage) as error:
+        app.log_rotation
+    assert str(error.value) == "Bad value for log_archive_size: 'lots'"
+
+
+@pytest.mark.parametrize(('config', 'shared'), [(False, False), ('false', False), (True, True), ('true', True)])
+def test_shared_logger(tmpdir, config, shared):
+    tmpdir.ensure_dir('playground', 'web')
+    with tmpdir.as_cwd():
+        app = PgctlApp(dict(pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), shared_logger=config))
+        web = app.service_by_name('web')
+        outsider = app.service_by_name(str(tmpdir.ensure_dir('elsewhere', 'web')))
+    assert outsider.shared_logger is None
+    if shared:
+        assert web.shared_logger.path == str(tmpdir.join('home')) + str(tmpdir.join('playground', 'logger'))
+    else:
+        assert web.shared_logger is None
+
+
+class FakeServices:
+    """Service's state-changing methods, mocked out: by default, each succeeds at once and is recorded in `events`."""
+
+    def __init__(self, context):
+        self.context = context
+        self.events = []
+
+    def record(self, event):
+        """A side effect that records `event`, for the service it's called on."""
+        return lambda service, *args, **kwargs: self.events.append((service.name, event))
+
+    def patch(self, **side_effects):
+        """Patch Service's methods with these side effects (by method name), and the rest with the defaults."""
+        defaults = {
+            'stop': self.record('stop'),
+            'start': self.record('start'),
+            'stop_logs': self.record('stop_logs'),
+            'force_cleanup': lambda service, is_stop=True: None,
+            'assert_stopped': lambda service, with_log_running=False: None,
+            'assert_ready': lambda service: None,
+            'svstat': lambda service: SvStat('ready', 1, None, 5, None),
+        }
+        for method, side_effect in dict(defaults, **side_effects).items():
+            self.context.enter_context(mock.patch.object(Service, method, autospec=True, side_effect=side_effect))
+        return self.events
+
+
+@pytest.fixture
+def fake_services():
+    with contextlib.ExitStack() as context:
+        yield FakeServices(context)
+
+
+def test_stop_stops_each_logger_as_soon_as_its_service_is_down(tmpdir, fake_services):
+    for name in ('fast', 'slow'):
+        tmpdir.ensure_dir('playground', name)
+    events = fake_services.events
+    checks = collections.Counter()
+
+    def assert_stopped(service, with_log_running=False):
+        checks[service.name] += 1
+        if service.name == 'slow' and checks['slow'] < 5:
+            raise NotReady('still up')
+        if not with_log_running and (service.name, 'stop_logs') not in events:
+            raise NotReady('its s6-log is still running')
+
+    locks = []
+    playground_locked = PgctlApp.playground_locked
+
+    fake_services.patch(assert_stopped=assert_stopped)
+    with contextlib.ExitStack() as context:
+        context.enter_context(tmpdir.as_cwd())
+        context.enter_context(
+            mock.patch.object(Service, 'state', new_callable=mock.PropertyMock, return_value={'state': 'down'}),
+        )
+        context.enter_context(mock.patch.object(
+            PgctlApp, 'playground_locked', autospec=True,
+            side_effect=lambda app: locks.append(app) or playground_locked(app),
+        ))
+        app = PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), poll='0', quiet=True, services=('fast', 'slow'),
+        ))
+        app.stop()
+
+    # fast's logger was stopped while slow was still stopping
+    assert events.index(('fast', 'stop_logs')) < events.index(('slow', 'stop_logs'))
+    assert events[events.index(('fast', 'stop_logs')) + 1] == ('slow', 'stop')
+    assert {name: change.change for name, change in app.changes.items()} == {'fast': 'stop', 'slow': 'stop'}
+    assert len(locks) == 1
+
+
+def test_restart_starts_each_service_as_soon_as_it_is_down(tmpdir, fake_services):
+    for name in ('fast', 'slow'):
+        tmpdir.ensure_dir('playground', name)
+    hook = tmpdir.join('playground', 'pre-start')
+    hook.write('#!/bin/sh\necho ran >> hook.log\n')
+    hook.chmod(0o755)
+    events = fake_services.events
+    checks = collections.Counter()
+
+    def assert_stopped(service, with_log_running=False):
+        assert with_log_running
+        checks[service.name] += 1
+        if service.name == 'slow' and checks['slow'] < 5:
+            raise NotReady('still up')
+
+    def assert_ready(service):
+        if (service.name, 'start') not in events:
+            raise NotReady('still down')
+
+    fake_services.patch(assert_stopped=assert_stopped, assert_ready=assert_ready)
+    with tmpdir.as_cwd():
+        app = PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), poll='0', quiet=True, services=('fast', 'slow'),
+        ))
+        app.restart()
+
+    # fast was started while slow was still stopping, and no logger was stopped
+    assert events.index(('fast', 'start')) < events.index(('slow', 'start'))
+    assert events[events.index(('fast', 'start')) + 1] == ('slow', 'stop')
+    assert ('fast', 'stop_logs') not in events
+    assert {name: change.change for name, change in app.changes.items()} == {'fast': 'start', 'slow': 'start'}
+    assert tmpdir.join('hook.log').read() == 'ran\n'
+
+
+@pytest.mark.parametrize(('other', 'hook_runs'), [('down', True), ('ready', False)])
+def test_restart_runs_the_post_stop_hook_only_between_stopping_and_starting(
+        tmpdir, capsys, fake_services, other, hook_runs,
+):
+    for name in ('up', 'down', 'other'):
+        tmpdir.ensure_dir('playground', name)
+    hook = tmpdir.join('playground', 'post-stop')
+    hook.write('#!/bin/sh\necho ran >> hook.log\n')
+    hook.chmod(0o755)
+    events = fake_services.events
+    states = {'up': 'ready', 'down': 'down', 'other': other}
+
+    def change(event, state):
+        def side_effect(service, *args, **kwargs):
+            events.append((service.name, event, tmpdir.join('hook.log').check()))
+            states[service.name] = state
+        return side_effect
+
+    def assert_state(state):
+        def side_effect(service, *args, **kwargs):
+            if states[service.name] != state:
+                raise NotReady('not ' + state)
+        return side_effect
+
+    fake_services.patch(
+        stop=change('stop', 'down'),
+        start=change('start', 'ready'),
+        assert_stopped=assert_state('down'),
+        assert_ready=assert_state('ready'),
+        svstat=lambda service: SvStat(states[service.name], None, None, None, None),
+    )
+    with tmpdir.as_cwd():
+        app = PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), poll='0', services=('up', 'down'),
+        ))
+        app.restart()
+
+    if hook_runs:
+        # everything was down at once, and the hook ran before anything started again
+        assert events == [('up', 'stop', False), ('up', 'start', True), ('down', 'start', True)]
+    else:
+        # the playground was never fully stopped: each service started again as soon as it was down
+        assert events == [('up', 'stop', False), ('down', 'start', False), ('up', 'start', False)]
+        assert not tmpdir.join('hook.log').check()
+    # only what was up is reported stopped
+    err = capsys.readouterr().err
+    assert '[pgctl] Stopped: up\n' in err
+    assert 'Stopped: down' not in err
+
+
+def test_restart_duration_covers_every_stage(tmpdir, fake_services):
+    tmpdir.ensure_dir('playground', 'slow')
+
+    def assert_stopped(service, with_log_running=False):
+        time.sleep(0.1)
+
+    fake_services.patch(assert_stopped=assert_stopped)
+    with tmpdir.as_cwd():
+        app = PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), poll='0', quiet=True, services=('slow',),
+        ))
+        app.restart()
+
+    change = app.changes['slow']
+    assert change.change == 'start'
+    # it was the stop that was slow
+    assert change.duration >= 0.1
+
+
+def test_index_memoizes_only_aliases(tmpdir):
+    for name in ('a', 'b', 'c'):
+        tmpdir.ensure_dir('playground', name)
+    config = dict(pgctl.cli.PGCTL_DEFAULTS, pghome=str(tmpdir.join('home')), aliases={'default': ['a', 'b']})
+    with tmpdir.as_cwd():
+        for services in (('default',), ('a', 'c'), ('c', 'b'), ('default', 'c')):
+            app = PgctlApp(dict(config, services=services))
+            app.services
+            app.index.save()
+        assert [service.name for service in app.services] == ['a', 'b', 'c']
+    index, = tmpdir.join('home').visit('.pgctl-index.json')
+    assert json.loads(index.read())['aliases'] == {'default': ['a', 'b']}
+
+
+class DescribeRollingRestart:
+
+    @pytest.fixture
+    def playground(self, tmpdir):
+        for name in ('a', 'b', 'c'):
+            tmpdir.ensure_dir('playground', name)
+        with tmpdir.as_cwd():
+            yield tmpdir
+
+    @pytest.fixture
+    def events(self, fake_services):
+        events = fake_services.events
+        broken = set()
+
+        def assert_ready(service):
+            if (service.name, 'start') not in events or service.name in broken:
+                raise NotReady('still down')
+
+        fake_services.patch(assert_ready=assert_ready)
+        fake_services.context.enter_context(
+            mock.patch.object(Service, 'state', new_callable=mock.PropertyMock, return_value={'state': 'down'}),
+        )
+        yield events, broken
+
+    def app(self, playground, rolling):
+        return PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS,
+            pghome=str(playground.join('home')), poll='0', timeout='0.05', quiet=True,
+            services=('a', 'b', 'c'), rolling=rolling,
+        ))
+
+    def it_restarts_one_at_a_time(self, playground, events):
+        events, _ = events
+        self.app(playground, '1').restart()
+        restarts = [event for event in events if event[1] == 'start']
+        assert restarts == [('a', 'start'), ('b', 'start'), ('c', 'start')]
+        # each service was stopped only once the one before it was ready
+        assert events.index(('b', 'stop')) > events.index(('a', 'start'))
+        assert events.index(('c', 'stop')) > events.index(('b', 'start'))
+
+    def it_restarts_a_few_at_a_time(self, playground, events):
+        events, _ = events
+        self.app(playground, '2').restart()
+        assert events[:2] == [('a', 'stop'), ('b', 'stop')]
+        assert events.index(('c', 'stop')) > events.index(('a', 'start'))
+
+    def it_stops_at_the_first_failure(self, playground, events, capsys):
+        events, broken = events
+        broken.add('b')
+        app = self.app(playground, '1')
+        app.pgconf = frozendict(app.pgconf, quiet=False, embedded_log_viewer=False)
+        with pytest.raises(PgctlUserMessage) as error:
+            app.restart()
+        assert str(error.value) == 'Some services failed to restart: b'
+        assert not [event for event in events if event[0] == 'c']
+        assert '[pgctl] Not restarting c, after a failure\n' in capsys.readouterr().err
+
+    @pytest.mark.parametrize('rolling', ('0', 'lots'))
+    def it_rejects_bad_values(self, playground, rolling):
+        with pytest.raises(PgctlUserMessage) as error:
+            self.app(playground, rolling).restart()
+        assert str(error.value).startswith(f'Bad value for rolling: {rolling!r}')
+
+
+class DescribeReload:
+
+    @pytest.fixture
+    def events(self, tmpdir, fake_services):
+        for name in ('hup', 'plain', 'down'):
+            tmpdir.ensure_dir('playground', name)
+        for name in ('hup', 'down'):
+            tmpdir.join('playground', name, 'service.yaml').write('reload-signal: HUP\n')
+        broken = set()
+
+        def svstat(service):
+            if service.name == 'down':
+                return SvStat(SvStat.UNSUPERVISED, None, None, None, None)
+            return SvStat('ready', 1, None, 5, None)
+
+        def assert_reloaded(service, since, notification=None):
+            if service.name in broken:
+                raise NotReady('still reloading')
+
+        events = fake_services.patch(reload=fake_services.record('reload'), svstat=svstat, assert_reloaded=assert_reloaded)
+        with tmpdir.as_cwd():
+            yield events, broken
+
+    def app(self, tmpdir, **overrides):
+        config = dict(
+            pgctl.cli.PGCTL_DEFAULTS,
+            pghome=str(tmpdir.join('home')), poll='0', timeout='0.05', quiet=True, services=('hup', 'plain', 'down'),
+        )
+        config.update(overrides)
+        return PgctlApp(config)
+
+    def it_signals_those_that_can_reload_and_restarts_the_rest(self, tmpdir, events):
+        events, _ = events
+        app = self.app(tmpdir)
+        app.reload()
+        # signalled just the once, however long it took
+        assert [event for event in events if event[0] == 'hup'] == [('hup', 'reload')]
+        assert [event for event in events if event[0] == 'plain'] == [('plain', 'stop'), ('plain', 'start')]
+        # there was nothing to stop
+        assert [event for event in events if event[0] == 'down'] == [('down', 'start')]
+        assert {name: change.change for name, change in app.changes.items()} == {
+            'hup': 'reload', 'plain': 'start', 'down': 'start',
+        }
+
+    def it_leaves_a_failed_reload_running(self, tmpdir, events):
+        events, broken = events
+        broken.add('hup')
+        with pytest.raises(PgctlUserMessage) as error:
+            self.app(tmpdir, services=('hup',)).reload()
+        assert str(error.value) == 'Some services failed to reload: hup'
+        assert events == [('hup', 'reload')]
+
+
+class DescribeReplace:
+
+    @pytest.fixture
+    def events(self, tmpdir, fake_services):
+        for name in ('web', 'down', 'plain'):
+            tmpdir.ensure_dir('playground', name)
+        for name in ('web', 'down'):
+            tmpdir.join('playground', name, 'service.yaml').write('restart-mode: replace\n')
+        events = fake_services.events
+        broken = set()
+
+        def svstat(service):
+            if service.name == 'down':
+                return SvStat(SvStat.UNSUPERVISED, None, None, None, None)
+            return SvStat('ready', 1, None, 5, None)
+
+        def start_replacement(service):
+            events.append((service.name, 'start_replacement'))
+            return 'replica'
+
+        def assert_replacement_ready(service, replica):
+            assert replica == 'replica'
+            if service.name in broken:
+                raise NotReady('still starting')
+
+        def assert_replaced(service):
+            if (service.name, 'stop') not in events:
+                raise NotReady('still up')
+
+        fake_services.patch(
+            start_replacement=start_replacement,
+            assert_replacement_ready=assert_replacement_ready,
+            assert_replaced=assert_replaced,
+            adopt_replacement=fake_services.record('adopt_replacement'),
+            abandon_replacement=fake_services.record('abandon_replacement'),
+            svstat=svstat,
+        )
+        with tmpdir.as_cwd():
+            yield events, broken
+
+    def app(self, tmpdir, services):
+        return PgctlApp(dict(
+            pgctl.cli.PGCTL_DEFAULTS,
+            pghome=str(tmpdir.join('home')), poll='0', timeout='0.05', quiet=True, services=services,
+        ))
+
+    def it_starts_the_replacement_before_stopping_the_original(self, tmpdir, events):
+        events, _ = events
+        app = self.app(tmpdir, ('web', 'down', 'plain'))
+        app.restart()
+        assert [event for event in events if event[0] == 'web'] == [
+            ('web', 'start_replacement'), ('web', 'stop'), ('web', 'adopt_replacement'),
+        ]
+        # there's nothing to replace (or stop) if it isn't running; and only some services ask to be replaced
+        assert [event for event in events if event[0] == 'down'] == [('down', 'start')]
+        assert [event for event in events if event[0] == 'plain'] == [('plain', 'stop'), ('plain', 'start')]
+        assert {name: change.change for name, change in app.changes.items()} == {
+            'web': 'start', 'down': 'start', 'plain': 'start',
+        }
+
+    def it_leaves_the_original_running_if_the_replacement_fails(self, tmpdir, events):
+        events, broken = events
+        broken.add('web')
+        app = self.app(tmpdir, ('web',))
+        with pytest.raises(PgctlUserMessage) as error:
+            app.restart()
+        assert str(error.value) == 'Some services failed to restart: web'
+        assert events == [('web', 'start_replacement'), ('web', 'abandon_replacement')]
+        assert app.changes['web'].failure == (
+            'its replacement was not ready in time, so we stopped it: the original is still running'
+        )
+
+
+@pytest.mark.parametrize(('argv', 'rolling'), [
+    (['restart'], None),
+    (['restart', 'web', '--rolling'], 1),
+    (['--rolling=3', 'restart', 'web'], 3),
+])
+def test_rolling_argument(argv, rolling):
+    assert getattr(pgctl.cli.parser().parse_args(argv), 'rolling', None) == rolling
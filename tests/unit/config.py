@@ -1,3 +1,4 @@
+import json
 import os
 from unittest import mock
 
@@ -262,3 +263,62 @@ class DescribeFromApp:
         with tmpdir.join('a', 'b', 'c').ensure_dir().as_cwd():
             conf = example1.config.from_app()
         assert conf == {'a': 1, 'b': 3, 'c': 4}
+
+
+class DescribeFromFilesCached:
+
+    @pytest.fixture(autouse=True)
+    def in_tmpdir(self, tmpdir):
+        with tmpdir.ensure_dir('a', 'b').as_cwd():
+            yield
+
+    @pytest.fixture
+    def cache_path(self, tmpdir):
+        # NOTE: creating pghome changes the mtime of the (searched) tmpdir
+        yield tmpdir.ensure_dir('pghome').join('config-cache.json').strpath
+
+    def it_matches_the_uncached_config(self, tmpdir, cache_path):
+        tmpdir.join('a', 'example1.yaml').write('pgdir: outer\nx: 1\n')
+        tmpdir.join('a', 'b', 'example1.json').write('{"pgdir": "inner"}')
+        expected = {'pgdir': 'inner', 'x': 1}
+        assert example1.config.from_files() == expected
+        assert example1.config.from_files_cached(cache_path) == expected
+        assert example1.config.from_files_cached(cache_path) == expected
+
+    def it_does_not_parse_when_nothing_changed(self, tmpdir, cache_path):
+        tmpdir.join('a', 'example1.yaml').write('pgdir: outer\n')
+        example1.config.from_files_cached(cache_path)
+        with mock.patch.object(C.Config, 'from_file', side_effect=AssertionError):
+            assert example1.config.from_files_cached(cache_path) == {'pgdir': 'outer'}
+
+    def it_notices_edited_files(self, tmpdir, cache_path):
+        conffile = tmpdir.join('a', 'example1.yaml')
+        conffile.write('pgdir: outer\n')
+        example1.config.from_files_cached(cache_path)
+        conffile.write('pgdir: edited\n')
+        os.utime(conffile.strpath, ns=(0, 0))
+        assert example1.config.from_files_cached(cache_path) == {'pgdir': 'edited'}
+
+    def it_notices_new_files(self, tmpdir, cache_path):
+        assert example1.config.from_files_cached(cache_path) == {}
+        tmpdir.join('a', 'b', 'example1.yaml').write('pgdir: new\n')
+        os.utime(tmpdir.join('a', 'b').strpath, ns=(0, 0))
+        assert example1.config.from_files_cached(cache_path) == {'pgdir': 'new'}
+
+    def it_keeps_the_most_recently_used(self, tmpdir, cache_path):
+        for name in ('x', 'y', 'z'):
+            tmpdir.ensure_dir(name)
+        with mock.patch.object(C, 'CONFIG_CACHE_SIZE', 2):
+            example1.config.from_files_cached(cache_path, str(tmpdir.join('x')))
+            example1.config.from_files_cached(cache_path, str(tmpdir.join('y')))
+            # a hit on x makes y the least recently used
+            example1.config.from_files_cached(cache_path, str(tmpdir.join('x')))
+            example1.config.from_files_cached(cache_path, str(tmpdir.join('z')))
+        with open(cache_path) as f:
+            assert list(json.load(f)) == [str(tmpdir.join('x')), str(tmpdir.join('z'))]
+
+    def it_still_explodes_on_ambiguity(self, tmpdir, cache_path):
+        tmpdir.join('a', 'example1.yaml').write('pgdir: one\n')
+        tmpdir.join('a', 'example1.json').write('{"pgdir": "two"}')
+        with ShouldRaise(C.AmbiguousConfig):
+            example1.config.from_files_cached(cache_path)
@@ -8,3 +8,36 @@ class DescribeGlob:
         tmpdir.ensure('d/file.4')
         with tmpdir.as_cwd():
             assert list(configsearch.glob('*/file.*')) == ['a/file.1', 'd/file.4']
+
+
+class DescribeDiscover:
+
+    def it_lists_files_and_directories_of_each_parent(self, tmpdir):
+        tmpdir.ensure('a/b/pgctl.yaml')
+        tmpdir.ensure('a/pgctl.json')
+        tmpdir.ensure('a/other.yaml')
+        tmpdir.ensure_dir('a/playground')
+        levels = configsearch.discover(tmpdir.join('a', 'b').strpath, 'pgctl.')
+
+        assert levels[0].path == tmpdir.join('a', 'b').strpath
+        assert levels[0].files == ('pgctl.yaml',)
+        assert levels[0].directories == frozenset()
+        assert levels[1].path == tmpdir.join('a').strpath
+        assert levels[1].files == ('pgctl.json',)
+        assert levels[1].directories == {'b', 'playground'}
+        assert [level.path for level in levels] == list(configsearch.search_parent_directories(levels[0].path))
+
+    def it_reuses_unchanged_levels(self, tmpdir):
+        tmpdir.ensure_dir('a/b')
+        path = tmpdir.join('a', 'b').strpath
+        levels = configsearch.discover(path, 'pgctl.')
+        fake = levels[1]._replace(files=('pgctl.fake',))
+        assert configsearch.discover(path, 'pgctl.', (levels[0], fake))[1] == fake
+
+        tmpdir.ensure('a/pgctl.yaml')
+        assert configsearch.discover(path, 'pgctl.', (levels[0], fake))[1].files == ('pgctl.yaml',)
+
+    def it_round_trips_through_json(self, tmpdir):
+        tmpdir.ensure_dir('a/b')
+        levels = configsearch.discover(tmpdir.strpath)
+        assert tuple(configsearch.Level.from_json(level.to_json()) for level in levels) == levels
@@ -0,0 +1,146 @@
+import os
+import re
+import stat
+import threading
+from unittest import mock
+
+import pytest
+
+from pgctl.cli import PGCTL_DEFAULTS
+from pgctl.cli import PgctlApp
+from pgctl.daemon import _connect
+from pgctl.daemon import call
+from pgctl.daemon import Daemon
+from pgctl.daemon import StatusCache
+from pgctl.daemon import Unavailable
+from pgctl.errors import PgctlUserMessage
+
+
+@pytest.fixture
+def config(tmpdir):
+    yield dict(
+        PGCTL_DEFAULTS,
+        pgdir=tmpdir.ensure_dir('playground').strpath,
+        pghome=tmpdir.join('pghome').strpath,
+        command='status',
+        json=True,
+    )
+
+
+@pytest.fixture
+def daemon(config):
+    daemon = Daemon(PgctlApp(config))
+    daemon.listen()
+    yield daemon
+    daemon.close()
+
+
+def serve_one(daemon):
+    thread = threading.Thread(target=daemon.handle_one)
+    thread.start()
+    return thread
+
+
+class DescribeDaemon:
+
+    def it_listens_in_pghome(self, daemon, tmpdir):
+        assert daemon.socket_path == tmpdir.join('pghome', tmpdir.strpath.lstrip('/'), 'playground', 'pgctld.sock')
+        assert os.path.exists(daemon.socket_path)
+
+    def it_runs_commands_with_our_stdio(self, daemon, config, capfd):
+        thread = serve_one(daemon)
+        assert call(daemon.socket_path, config) is None
+        thread.join()
+        assert capfd.readouterr().out == '{}\n'
+
+    def it_refuses_commands_it_cannot_run(self, daemon, config):
+        thread = serve_one(daemon)
+        with pytest.raises(Unavailable):
+            call(daemon.socket_path, dict(config, command='log'))
+        thread.join()
+
+    def it_can_be_reached_only_by_our_own_user(self, daemon):
+        assert stat.S_IMODE(os.stat(daemon.socket_path).st_mode) == 0o600
+
+    def it_refuses_other_users(self, daemon, config, capfd):
+        thread = serve_one(daemon)
+        with mock.patch('pgctl.daemon._peer_uid', return_value=os.getuid() + 1):
+            with pytest.raises(Unavailable) as error:
+                call(daemon.socket_path, config)
+            thread.join()
+        assert str(error.value) == 'pgctld serves only its own user'
+        # nothing was run
+        assert capfd.readouterr().out == ''
+
+    def it_drops_a_client_that_stalls(self, daemon, config, capfd):
+        stalled = _connect(daemon.socket_path)
+        with stalled, mock.patch('pgctl.daemon.REQUEST_TIMEOUT', 0.1):
+            serve_one(daemon).join(timeout=5)
+            assert stalled.recv(1) == b''  # hung up on, without a reply
+
+        # and on to the next
+        thread = serve_one(daemon)
+        assert call(daemon.socket_path, config) is None
+        thread.join()
+        assert capfd.readouterr().out == '{}\n'
+
+    def it_refuses_to_run_twice(self, daemon, config):
+        with pytest.raises(PgctlUserMessage) as error:
+            Daemon(PgctlApp(config)).listen()
+        assert 'pgctld is already running' in str(error.value)
+
+    def it_cleans_up(self, daemon):
+        daemon.close()
+        assert not os.path.exists(daemon.socket_path)
+
+
+def it_is_unavailable_without_a_daemon(tmpdir, config):
+    with pytest.raises(Unavailable):
+        call(tmpdir.join('nope.sock').strpath, config)
+
+
+class FakeService:
+
+    def __init__(self, path):
+        self.path = path
+        self.queries = 0
+
+    @property
+    def state(self):
+        self.queries += 1
+        return {'state': 'down', 'pid': None, 'exitcode': None, 'seconds': None, 'process': None}
+
+
+class DescribeStatusCache:
+
+    def it_does_not_cache_services_never_supervised(self, tmpdir):
+        service = FakeService(tmpdir.ensure_dir('svc').strpath)
+        cache = StatusCache()
+        cache.get(service)
+        cache.get(service)
+        assert service.queries == 2
+
+    def it_caches_until_s6_announces_an_event(self, tmpdir):
+        service = FakeService(tmpdir.ensure_dir('svc').strpath)
+        event_dir = tmpdir.ensure_dir('svc', 'event')
+        cache = StatusCache()
+
+        assert cache.get(service)['state'] == 'down'
+        assert cache.get(service)['state'] == 'down'
+        assert service.queries == 1
+
+        # s6-supervise writes only to fifos named `ftrig1` and 43 more characters
+        fifo, = event_dir.listdir()
+        assert re.fullmatch('ftrig1.{43}', fifo.basename)
+        # this is what s6-supervise does, for each state change
+        fd = os.open(fifo.strpath, os.O_WRONLY | os.O_NONBLOCK)
+        os.write(fd, b'd')
+        os.close(fd)
+
+        cache.get(service)
+        assert service.queries == 2
+        cache.get(service)
+        assert service.queries == 2
+
+        cache.close()
+        assert event_dir.listdir() == []
@@ -10,7 +10,11 @@ from testing.norm import norm_trailing_whitespace_json
 from pgctl.errors import LockHeld
 from pgctl.functions import bestrelpath
 from pgctl.functions import JSONEncoder
+from pgctl.functions import F_GETPIPE_SZ
 from pgctl.functions import logger_preexec
+from pgctl.functions import pipe_usage
+from pgctl.functions import PipeUsage
+from pgctl.functions import set_pipe_size
 from pgctl.functions import show_runaway_processes
 from pgctl.functions import supervisor_preexec
 from pgctl.functions import terminate_processes
@@ -149,3 +153,46 @@ class DescribePreexecFuncs:
             mock.call(self.LOG_PIPE_FD, 1),
             mock.call(self.LOG_PIPE_FD, 2),
         ]
+
+    @pytest.mark.parametrize('preexec', (logger_preexec, supervisor_preexec))
+    def it_sizes_the_pipe_if_asked(self, preexec):
+        with mock.patch.object(os, 'dup2', autospec=True), \
+                mock.patch('pgctl.functions.set_pipe_size', autospec=True) as mock_set_pipe_size:
+            preexec('/log/path')
+            assert mock_set_pipe_size.mock_calls == []
+            preexec('/log/path', 1 << 20)
+        assert mock_set_pipe_size.mock_calls == [mock.call(self.LOG_PIPE_FD, 1 << 20)]
+
+
+class DescribePipes:
+
+    def it_resizes_pipes(self):
+        import fcntl
+        read, write = os.pipe()
+        try:
+            set_pipe_size(write, 1 << 18)
+            assert fcntl.fcntl(read, F_GETPIPE_SZ) == 1 << 18
+            # nonsense: no change, and no complaint
+            set_pipe_size(write, 1 << 40)
+            assert fcntl.fcntl(read, F_GETPIPE_SZ) == 1 << 18
+        finally:
+            os.close(read)
+            os.close(write)
+
+    def it_samples_fifo_usage(self, tmpdir):
+        fifo = tmpdir.join('log_pipe').strpath
+        assert pipe_usage(fifo) is None
+        os.mkfifo(fifo)
+        writer = os.open(fifo, os.O_RDWR)
+        try:
+            os.write(writer, b'x' * 100)
+            usage = pipe_usage(fifo)
+            assert usage == PipeUsage(100, usage.capacity)
+            assert usage.capacity >= 4096
+            # sampling doesn't consume anything
+            assert pipe_usage(fifo).buffered == 100
+        finally:
+            os.close(writer)
+
+    def it_has_nothing_to_say_about_plain_files(self, tmpdir):
+        assert pipe_usage(tmpdir.ensure('log_pipe').strpath) is None
@@ -0,0 +1,74 @@
+"""Regression tests for cli startup time.
+
+`pgctl-poll-ready` restarts services by exec'ing the full `pgctl` cli, so startup cost matters even off the
+interactive path. Heavy modules should only be imported by the commands that need them.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+# What pgctl's own modules may add (in seconds) to the import of pgctl.cli, over the standard library it builds on.
+# They take under 10ms on a typical machine: a five-fold margin, so as not to flake on slow or busy ones.
+STARTUP_BUDGET = 0.05
+
+LAZY_MODULES = (
+    'asyncio',
+    'configparser',
+    'contextlib2',
+    'frozendict',
+    'getpass',
+    'logging',
+    'pgctl.log_viewer',
+    'pgctl.telemetry',
+    'py._path.local',
+    'socket',
+    'yaml',
+)
+
+
+def importtime(module, env=None):
+    """Return {module name: (self, cumulative) import time in seconds}, for a fresh import of `module`."""
+    process = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', 'import ' + module),
+        stderr=subprocess.PIPE,
+        env=env,
+        check=True,
+    )
+    result = {}
+    for line in process.stderr.decode('UTF-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line.split('|')
+        result[name.strip()] = (int(own.split(':')[1]) / 1e6, int(cumulative) / 1e6)
+    return result
+
+
+@pytest.fixture(scope='module')
+def compiled(tmp_path_factory):
+    """An environment in which the imports are already byte-compiled: compiling isn't part of startup."""
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=str(tmp_path_factory.mktemp('pycache')))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    importtime('pgctl.cli', env)
+    yield env
+
+
+@pytest.fixture(scope='module')
+def cli_imports():
+    yield importtime('pgctl.cli')
+
+
+@pytest.mark.parametrize('module', LAZY_MODULES)
+def test_cli_does_not_import_heavy_modules(module, cli_imports):
+    assert module not in cli_imports
+
+
+def pgctl_import_time(imports):
+    """The time spent importing pgctl's own modules, leaving out the standard library's."""
+    return sum(own for name, (own, _) in imports.items() if name == 'pgctl' or name.startswith('pgctl.'))
+
+
+def test_cli_import_is_within_budget(compiled):
+    # take the best of a few runs, to reduce noise
+    assert min(pgctl_import_time(importtime('pgctl.cli', compiled)) for _ in range(3)) < STARTUP_BUDGET
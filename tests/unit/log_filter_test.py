@@ -0,0 +1,105 @@
+import os
+import re
+import subprocess
+import sys
+
+from pgctl.log_filter import LogFilter
+from pgctl.log_filter import run
+from pgctl.log_filter import TokenBucket
+
+
+def lines(count, prefix=b'line'):
+    return [b'%s %i\n' % (prefix, i) for i in range(count)]
+
+
+class DescribeTokenBucket:
+
+    def it_allows_a_burst_of_a_seconds_worth(self):
+        bucket = TokenBucket(3, now=0)
+        assert [bucket.take(1) for _ in range(4)] == [True, True, True, False]
+
+    def it_refills_over_time(self):
+        bucket = TokenBucket(10, now=0)
+        assert bucket.take(10)
+        bucket.refill(.5)
+        assert bucket.take(5)
+        assert not bucket.take(1)
+        bucket.refill(100)
+        assert bucket.tokens == 10
+
+    def it_lets_a_big_line_through_a_full_bucket(self):
+        bucket = TokenBucket(10, now=0)
+        assert bucket.take(25)
+        assert not bucket.take(1)
+        bucket.refill(1)
+        assert not bucket.take(1)
+        bucket.refill(2)
+        assert bucket.take(1)
+
+
+class DescribeLogFilter:
+
+    def it_keeps_everything_without_a_policy(self):
+        log_filter = LogFilter(now=0)
+        assert log_filter.filter(lines(1000), now=0) == lines(1000)
+        assert log_filter.report(10) is None
+
+    def it_rate_limits_lines(self):
+        log_filter = LogFilter(now=0, lines_per_second=100)
+        assert len(log_filter.filter(lines(150), now=0)) == 100
+        assert len(log_filter.filter(lines(150), now=.5)) == 50
+        assert log_filter.report(10) == (
+            b'pgctl-log-filter: dropped 150 lines (1300 bytes) over the rate limit, in the last 10 seconds\n'
+        )
+        assert log_filter.report(10) is None
+
+    def it_rate_limits_bytes(self):
+        log_filter = LogFilter(now=0, bytes_per_second=100)
+        # each line is 7 or 8 bytes
+        assert log_filter.filter(lines(20), now=0) == lines(13)
+
+    def it_samples_matching_lines(self):
+        log_filter = LogFilter(now=0, sample=10, match=re.compile(b'DEBUG'))
+        kept = log_filter.filter(lines(25, b'DEBUG') + lines(2, b'ERROR'), now=0)
+        assert kept == [b'DEBUG 0\n', b'DEBUG 10\n', b'DEBUG 20\n', b'ERROR 0\n', b'ERROR 1\n']
+        assert log_filter.report(10) == b'pgctl-log-filter: sampled out 22 lines, in the last 10 seconds\n'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        self.time += .25
+        return self.time
+
+
+def it_filters_from_source_to_sink():
+    source_read, source_write = os.pipe()
+    sink_read, sink_write = os.pipe()
+    os.write(source_write, b''.join(lines(10)) + b'partial')
+    os.close(source_write)
+
+    run(LogFilter(now=0, lines_per_second=5), source_read, sink_write, report_interval=100, clock=FakeClock())
+    os.close(source_read)
+    os.close(sink_write)
+    with os.fdopen(sink_read, 'rb') as sink:
+        assert sink.read().decode() == '''\
+line 0
+line 1
+line 2
+line 3
+line 4
+partialpgctl-log-filter: dropped 5 lines (35 bytes) over the rate limit, in the last 2 seconds
+'''
+
+
+def it_runs_the_logger():
+    result = subprocess.run(
+        (sys.executable, '-m', 'pgctl.log_filter', '--sample', '2', '--', 'cat'),
+        input=b''.join(lines(4)),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    assert result.stdout.startswith(b'line 0\nline 2\npgctl-log-filter: sampled out 2 lines')
@@ -0,0 +1,198 @@
+import gzip
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import pytest
+from testing import norm
+from testing.assertions import wait_for
+
+from pgctl import logs
+from pgctl.log_mux import LogDir
+from pgctl.log_mux import LogMux
+from pgctl.log_mux import tai64n
+from pgctl.log_mux import timestamp
+from pgctl.service import LOG_PROCESSORS
+from pgctl.service import LogRotation
+
+
+def it_timestamps_as_s6_log_does():
+    stamp = timestamp(time.time())
+    assert logs.TIMESTAMP.match(stamp)
+    assert norm.timestamp(stamp.decode() + 'hi') == '{TIMESTAMP} hi'
+
+
+def it_names_archives_as_s6_log_does():
+    assert logs._archive_time('@{}.s'.format(tai64n(1445015156.5))).timestamp() == 1445015156
+
+
+def current(path, name='current'):
+    return [line.split(b'  ', 1)[1] for line in path.join(name).read_binary().splitlines()]
+
+
+class DescribeLogDir:
+
+    def it_writes_timestamped_lines(self, tmpdir):
+        log = LogDir(str(tmpdir), LogRotation())
+        log.write([b'one\n', b'partial'], time.time())
+        log.close()
+        assert current(tmpdir) == [b'one', b'partial']
+
+    def it_rotates_and_prunes(self, tmpdir):
+        log = LogDir(str(tmpdir), LogRotation(archives=2, archive_size=100))
+        for i in range(5):
+            log.write([b'x' * 80 + b'\n'], 1445015156 + i)
+        log.close()
+        rotated = logs.archives(str(tmpdir.join('current')))
+        assert [time.timestamp() for time, _ in rotated] == [1445015159, 1445015160]
+        assert tmpdir.join('current').size() == 0
+
+    def it_prunes_to_a_total_size(self, tmpdir):
+        log = LogDir(str(tmpdir), LogRotation(archive_size=100, total_size=250))
+        for i in range(5):
+            log.write([b'x' * 80 + b'\n'], 1445015156 + i)
+        log.close()
+        assert len(logs.archives(str(tmpdir.join('current')))) == 2
+
+    def it_compresses_archives(self, tmpdir):
+        log = LogDir(str(tmpdir), LogRotation(archive_size=10, compress='gzip'))
+        log.write([b'compress me\n'], time.time())
+        log.close()
+        (_, archive), = logs.archives(str(tmpdir.join('current')))
+        with open(archive, 'rb') as f:
+            assert gzip.decompress(f.read()).endswith(b'  compress me\n')
+        assert not tmpdir.listdir('*.previous') and not tmpdir.listdir('*.processed')
+
+    def it_rotates_again_while_a_processor_is_still_running(self, tmpdir):
+        gate = tmpdir.join('gate')
+        # a processor that waits to be let go, as a slow compressor would make us wait
+        slow = 'sh -c \'while ! [ -e {} ]; do sleep .01; done; exec cat\''.format(gate)
+        with mock.patch('pgctl.log_mux.LOG_PROCESSORS', dict(LOG_PROCESSORS, slow=slow)):
+            log = LogDir(str(tmpdir.ensure_dir('logs')), LogRotation(archive_size=10, compress='slow'))
+            log.write([b'first\n'], 1445015156)
+            log.write([b'second\n'], 1445015157)
+            log.finish_processing()
+            assert logs.archives(str(tmpdir.join('logs', 'current'))) == []
+
+            gate.ensure()
+            log.close()
+        rotated = [path for _, path in logs.archives(str(tmpdir.join('logs', 'current')))]
+        assert [current(tmpdir.join('logs'), os.path.basename(path)) for path in rotated] == [[b'first'], [b'second']]
+        assert len(tmpdir.join('logs').listdir()) == 3
+
+
+@pytest.fixture
+def logger(tmpdir):
+    tmpdir.ensure_dir('logger', 'sources')
+    yield tmpdir.join('logger')
+
+
+def add(logger, tmpdir, name, log_filter=()):
+    fifo = tmpdir.join(name + '.pipe')
+    if not fifo.exists():
+        os.mkfifo(str(fifo))
+    logger.join('sources', name + '.json').write(json.dumps({
+        'fifo': str(fifo),
+        'logs': str(tmpdir.join(name)),
+        'rotation': LogRotation()._asdict(),
+        'filter': list(log_filter),
+    }))
+    return os.open(str(fifo), os.O_RDWR)
+
+
+class DescribeLogMux:
+
+    def it_logs_each_source_into_its_own_logs(self, tmpdir, logger):
+        web = add(logger, tmpdir, 'web')
+        db = add(logger, tmpdir, 'db', ('--sample', '2'))
+        os.write(web, b'web 1\nweb 2\n')
+        os.write(db, b'db 1\ndb 2\ndb 3\n')
+
+        mux = LogMux(str(logger))
+        mux.rescan()
+        assert json.loads(logger.join('active').read()) == ['db', 'web']
+
+        logger.join('sources', 'db.json').remove()
+        mux.rescan()
+        assert json.loads(logger.join('active').read()) == ['web']
+        assert current(tmpdir.join('web')) == [b'web 1', b'web 2']
+        # we were done with db, so we reported what we dropped
+        assert current(tmpdir.join('db')) == [
+            b'db 1', b'db 3', b'pgctl-log-filter: sampled out 1 lines, in the last 0 seconds',
+        ]
+
+    def it_skips_sources_it_cannot_open(self, tmpdir, logger, capsys):
+        logger.join('sources', 'gone.json').write(json.dumps({
+            'fifo': str(tmpdir.join('nope')), 'logs': str(tmpdir.join('gone')), 'rotation': {}, 'filter': [],
+        }))
+        LogMux(str(logger)).rescan()
+        assert json.loads(logger.join('active').read()) == []
+        assert 'pgctl-log-mux: cannot log gone:' in capsys.readouterr().err
+
+
+class SignallingPoll:
+    """A poll that, each time it's called, first does the next of `actions`."""
+
+    def __init__(self, actions):
+        self._poll = select.poll()
+        self.actions = list(actions)
+
+    def register(self, *args):
+        self._poll.register(*args)
+
+    def unregister(self, fd):
+        self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        self.actions.pop(0)()
+        return self._poll.poll(timeout)
+
+
+def it_rescans_only_after_each_batch_of_events(tmpdir, logger):
+    web = add(logger, tmpdir, 'web')
+    db = add(logger, tmpdir, 'db')
+
+    def remove_db_while_it_has_something_to_log():
+        logger.join('sources', 'db.json').remove()
+        os.write(db, b'goodbye\n')
+        os.write(web, b'hello\n')
+        # the wakeup fd was registered first: this event comes before db's, in the same batch
+        os.kill(os.getpid(), signal.SIGHUP)
+
+    mux = LogMux(str(logger))
+    mux._poll = SignallingPoll((
+        remove_db_while_it_has_something_to_log,
+        lambda: os.kill(os.getpid(), signal.SIGTERM),
+    ))
+    try:
+        mux.run()
+    finally:
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGHUP, signal.SIGTERM):
+            signal.signal(signum, signal.SIG_DFL)
+    assert current(tmpdir.join('db')) == [b'goodbye']
+    assert current(tmpdir.join('web')) == [b'hello']
+
+
+def it_runs_until_terminated(tmpdir, logger):
+    web = add(logger, tmpdir, 'web')
+    mux = subprocess.Popen((sys.executable, '-m', 'pgctl.log_mux', str(logger)))
+    try:
+        wait_for(lambda: logger.join('active').exists())
+        os.write(web, b'hello\n')
+        wait_for(lambda: current(tmpdir.join('web')) == [b'hello'])
+
+        db = add(logger, tmpdir, 'db')
+        os.write(db, b'partial')
+        mux.send_signal(signal.SIGHUP)
+        wait_for(lambda: json.loads(logger.join('active').read()) == ['db', 'web'])
+    finally:
+        mux.terminate()
+        assert mux.wait() == 0
+    assert json.loads(logger.join('active').read()) == []
+    assert current(tmpdir.join('db')) == [b'partial']
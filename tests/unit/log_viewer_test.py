@@ -1,10 +1,12 @@
 import os
 import shutil
+import signal
 from unittest import mock
 
 import pytest
 from testing.assertions import wait_for
 
+from pgctl import log_viewer as log_viewer_module
 from pgctl.log_viewer import LogViewer
 from pgctl.log_viewer import Tailer
 from pgctl.log_viewer import TailEvent
@@ -33,8 +35,7 @@ def test_tailer(tmp_path):
     file_a.flush()
     file_b.write('B\n')
     file_b.flush()
-    wait_for(lambda: len(tailer._poll.poll()) == 2)
-    assert tailer.new_lines_available() is True
+    wait_for(lambda: tailer.new_lines_available() is True)
     assert sorted(tailer.get_logs()) == [
         TailEvent(file_a.name, [b'A', b'A']),
         TailEvent(file_b.name, [b'B']),
@@ -52,6 +53,78 @@ def test_tailer(tmp_path):
     tailer.cleanup()
 
 
+@pytest.fixture(params=(True, False), ids=('inotify', 'polling'))
+def inotify(request):
+    if request.param:
+        yield
+    else:
+        with mock.patch.object(log_viewer_module, 'Inotify', side_effect=OSError):
+            yield
+
+
+@pytest.mark.usefixtures('inotify')
+def test_tailer_starts_with_the_last_lines(tmp_path):
+    path = tmp_path / 'current'
+    # (the partial line counts as one of the last ten)
+    path.write_text(''.join(f'{i}\n' for i in range(20)) + 'partial')
+    tailer = Tailer((str(path),))
+    assert tailer.new_lines_available() is True
+    assert tailer.get_logs() == [TailEvent(str(path), [str(i).encode() for i in range(11, 20)])]
+
+    with path.open('a') as f:
+        f.write(' line\n')
+    wait_for(lambda: tailer.new_lines_available() is True)
+    assert tailer.get_logs() == [TailEvent(str(path), [b'partial line'])]
+    tailer.cleanup()
+
+
+@pytest.mark.parametrize('count, limit, expected', (
+    (0, None, 100000),
+    (3, None, 99994),
+    (30000, None, 40000),
+    (60000, None, 0),
+    # not enough lines within the limit: start after the first newline
+    (60000, 1000, 99002),
+))
+def test_last_lines_offset_reads_backwards_in_blocks(tmp_path, count, limit, expected):
+    path = tmp_path / 'current'
+    path.write_bytes(b'x\n' * 50000)
+    with path.open('rb') as f:
+        assert log_viewer_module._last_lines_offset(f, count, limit) == expected
+
+
+@pytest.mark.usefixtures('inotify')
+def test_tailer_follows_rotation(tmp_path):
+    path = tmp_path / 'current'
+    path.write_text('')
+    tailer = Tailer((str(path),))
+
+    # this is what s6-log does: the last lines of the old file, then a new one
+    with path.open('a') as f:
+        f.write('old\n')
+    path.rename(tmp_path / '@400000005f5e5b2a1234abcd.s')
+    path.write_text('new\n')
+
+    wait_for(lambda: tailer.new_lines_available() is True)
+    assert tailer.get_logs() == [TailEvent(str(path), [b'old', b'new'])]
+
+    path.write_text('c\n')
+    wait_for(lambda: tailer.new_lines_available() is True)
+    assert tailer.get_logs() == [TailEvent(str(path), [b'c'])]
+    tailer.cleanup()
+
+
+@pytest.mark.usefixtures('inotify')
+def test_tailer_waits_for_missing_files(tmp_path):
+    path = tmp_path / 'current'
+    tailer = Tailer((str(path),))
+    assert tailer.get_logs() == []
+    path.write_text('hello\n')
+    wait_for(lambda: tailer.new_lines_available() is True)
+    assert tailer.get_logs() == [TailEvent(str(path), [b'hello'])]
+    tailer.cleanup()
+
+
 @pytest.fixture
 def mock_terminal_width():
     fake_size = os.terminal_size((40, 40))
@@ -71,6 +144,7 @@ def test_log_viewer_terminal_width(size, expected_width, mock_terminal_width):
     mock_terminal_width.return_value = size
     log_viewer = LogViewer(10, {})
     assert log_viewer._terminal_width() == expected_width
+    log_viewer.cleanup()
 
 
 @pytest.mark.usefixtures('mock_terminal_width')
@@ -124,3 +198,58 @@ def test_log_viewer(tmp_path):
     assert log_viewer.redraw_needed() is False
 
     log_viewer.cleanup()
+
+
+@pytest.mark.usefixtures('mock_terminal_width')
+def test_log_viewer_limits_its_frame_rate(tmp_path):
+    test_file = (tmp_path / 'test').open('a+')
+    log_viewer = LogViewer(10, {'test': test_file.name}, max_fps=1)
+    log_viewer.draw_logs('My cool logs:')
+
+    test_file.write('my cool log\n')
+    test_file.flush()
+    with mock.patch.object(log_viewer_module.time, 'monotonic', return_value=log_viewer._frame_time + .5):
+        assert log_viewer.redraw_needed() is False
+    with mock.patch.object(log_viewer_module.time, 'monotonic', return_value=log_viewer._frame_time + 1):
+        assert log_viewer.redraw_needed() is True
+
+    log_viewer.cleanup()
+
+
+@pytest.mark.usefixtures('mock_terminal_width')
+def test_log_viewer_redraws_only_changed_rows(tmp_path):
+    test_file = (tmp_path / 'test').open('a+')
+    log_viewer = LogViewer(5, {'test': test_file.name}, max_fps=0)
+    log_viewer.draw_logs('My cool logs:')
+    assert log_viewer.update_logs('My cool logs:') == ''
+
+    test_file.write('my cool log\n')
+    test_file.flush()
+    wait_for(lambda: log_viewer.redraw_needed() is True)
+    # the title and 4 box rows are above the cursor; the first line in the box is 4 rows up
+    assert log_viewer.update_logs('My cool logs:') == (
+        '\x1b[?7l\x1b[?25l'
+        '\x1b[4F\x1b[1m║\x1b[0m[test] my cool log                   \x1b[39G\x1b[1m║\x1b[0K\x1b[0m\x1b[4E'
+        '\x1b[?7h\x1b[?25h'
+    )
+
+    assert log_viewer.update_logs('Other logs:') == '\x1b[?7l\x1b[?25l\x1b[6FOther logs:\x1b[0K\x1b[6E\x1b[?7h\x1b[?25h'
+    log_viewer.cleanup()
+
+
+@pytest.mark.usefixtures('mock_terminal_width')
+def test_log_viewer_redraws_everything_on_resize(mock_terminal_width):
+    previous_handler = signal.getsignal(signal.SIGWINCH)
+    log_viewer = LogViewer(5, {}, max_fps=0)
+    log_viewer.draw_logs('My cool logs:')
+    assert log_viewer.redraw_needed() is False
+
+    mock_terminal_width.return_value = os.terminal_size((30, 40))
+    # the terminal's size is only checked when it tells us it's changed
+    assert log_viewer.redraw_needed() is False
+    os.kill(os.getpid(), signal.SIGWINCH)
+    assert log_viewer.redraw_needed() is True
+    assert log_viewer.update_logs('My cool logs:').startswith('\x1b[6F\x1b[0J\x1b[?7lMy cool logs:\n')
+
+    log_viewer.cleanup()
+    assert signal.getsignal(signal.SIGWINCH) == previous_handler
@@ -0,0 +1,305 @@
+import datetime
+import io
+import mmap
+import re
+import shutil
+from unittest import mock
+
+import pytest
+
+from pgctl import logs
+from pgctl.cli import parser
+from pgctl.cli import PGCTL_DEFAULTS
+from pgctl.cli import PgctlApp
+from pgctl.errors import PgctlUserMessage
+
+
+def stamp(second):
+    return '2015-10-16 17:05:{:02}.635827500'.format(second).encode('ascii')
+
+
+def write_log(path, *lines):
+    path.write_binary(b''.join(line + b'\n' for line in lines), ensure=True)
+    return path.strpath
+
+
+class DescribeTimestamped:
+
+    def it_finds_s6_log_timestamps(self):
+        assert logs.timestamped('svc', (stamp(1) + b'  hi', b'@400000005620ee4e25e0ba4c hi')) == [
+            logs.LogLine(stamp(1), 'svc', stamp(1) + b'  hi'),
+            logs.LogLine(b'@400000005620ee4e25e0ba4c', 'svc', b'@400000005620ee4e25e0ba4c hi'),
+        ]
+
+    def it_dates_unstamped_lines_by_the_line_before(self):
+        lines = logs.timestamped('svc', (b'no time', stamp(1) + b'  one', b'  continued'), previous=stamp(0))
+        assert [line.timestamp for line in lines] == [stamp(0), stamp(1), stamp(1)]
+
+
+def it_merges_logs_in_timestamp_order():
+    a = logs.timestamped('a', (stamp(1) + b'  a1', stamp(3) + b'  a3', stamp(3) + b'  a3 again'))
+    b = logs.timestamped('b', (stamp(2) + b'  b2', stamp(3) + b'  b3'))
+    assert [line.line[-2:] for line in logs.merged((a, b))] == [b'a1', b'b2', b'a3', b'in', b'b3']
+
+
+def it_shows_the_last_lines_of_each_log_merged(tmpdir):
+    name_to_path = {
+        'ohhi': write_log(tmpdir.join('ohhi', 'current'), *(stamp(i) + b'  ohhi %i' % i for i in range(0, 10, 2))),
+        'sweet': write_log(tmpdir.join('sweet', 'current'), *(stamp(i) + b'  sweet %i' % i for i in range(1, 10, 2))),
+        'empty': write_log(tmpdir.join('empty', 'current')),
+    }
+    out = io.BytesIO()
+    logs.show(name_to_path, 2, out)
+    assert out.getvalue().decode('UTF-8') == '''\
+[ohhi]  2015-10-16 17:05:06.635827500  ohhi 6
+[sweet] 2015-10-16 17:05:07.635827500  sweet 7
+[ohhi]  2015-10-16 17:05:08.635827500  ohhi 8
+[sweet] 2015-10-16 17:05:09.635827500  sweet 9
+'''
+
+
+def it_shows_nothing_for_missing_logs(tmpdir):
+    out = io.BytesIO()
+    logs.show({'svc': tmpdir.join('current').strpath}, 30, out)
+    assert out.getvalue() == b''
+
+
+class Done(Exception):
+    pass
+
+
+class StopAfter(io.BytesIO):
+    """Output for follow(), which never returns: interrupt it after some number of writes."""
+
+    def __init__(self, writes, on_write=lambda: None):
+        super().__init__()
+        self.writes = writes
+        self.on_write = on_write
+
+    def flush(self):
+        self.writes -= 1
+        if self.writes == 0:
+            raise Done()
+        self.on_write()
+
+
+def it_follows_logs(tmpdir):
+    ohhi = tmpdir.join('ohhi', 'current')
+    name_to_path = {
+        'ohhi': write_log(ohhi, stamp(0) + b'  old', stamp(2) + b'  ohhi 2'),
+        'sweet': write_log(tmpdir.join('sweet', 'current'), stamp(1) + b'  sweet 1'),
+    }
+
+    def log_more():
+        with ohhi.open('ab') as f:
+            f.write(stamp(3) + b'  ohhi 3\n')
+
+    out = StopAfter(2, log_more)
+    with pytest.raises(Done):
+        logs.follow(name_to_path, 1, out)
+    assert out.getvalue().decode('UTF-8') == '''\
+[sweet] 2015-10-16 17:05:01.635827500  sweet 1
+[ohhi]  2015-10-16 17:05:02.635827500  ohhi 2
+[ohhi]  2015-10-16 17:05:03.635827500  ohhi 3
+'''
+
+
+class DescribeLogCommand:
+
+    @pytest.fixture
+    def app(self, tmpdir):
+        tmpdir.ensure_dir('playground', 'svc')
+        with tmpdir.as_cwd():
+            yield PgctlApp(dict(PGCTL_DEFAULTS, services=('svc',)))
+
+    def it_parses_tail_like_options(self):
+        args = parser().parse_args(('log', '-n', '5', '-F'))
+        assert (args.log_lines, args.log_follow) == (5, False)
+        assert parser().parse_args(('log', '--follow')).log_follow is True
+        assert not hasattr(parser().parse_args(('log',)), 'log_follow')
+
+    def it_follows_only_on_a_terminal_by_default(self, app, tmpdir):
+        with mock.patch.object(logs, 'show') as show, mock.patch.object(logs, 'follow') as follow:
+            with mock.patch('sys.stdout') as stdout:
+                stdout.isatty.return_value = False
+                app.log()
+                stdout.isatty.return_value = True
+                app.log()
+        logfile = tmpdir.join('playground', 'svc', 'logs', 'current').strpath
+        show.assert_called_once_with({'svc': logfile}, count=30, out=stdout.buffer)
+        follow.assert_called_once_with({'svc': logfile}, count=30, out=stdout.buffer)
+
+    def it_can_be_told_whether_to_follow(self, app):
+        app.pgconf = dict(app.pgconf, log_follow=True, log_lines=5)
+        with mock.patch.object(logs, 'follow') as follow, mock.patch('sys.stdout') as stdout:
+            stdout.isatty.return_value = False
+            app.log()
+        follow.assert_called_once_with(mock.ANY, count=5, out=stdout.buffer)
+
+    def it_searches_given_a_time_or_pattern(self, app):
+        app.pgconf = dict(app.pgconf, log_since='2015-10-16 17:05', log_grep='err(or)?')
+        with mock.patch.object(logs, 'search') as search, mock.patch('sys.stdout') as stdout:
+            app.log()
+        search.assert_called_once_with(
+            mock.ANY, since=b'2015-10-16 17:05:00.000000', until=None, grep=re.compile(b'err(or)?'), out=stdout.buffer,
+        )
+
+    def it_rejects_a_bad_pattern(self, app):
+        app.pgconf = dict(app.pgconf, log_grep='(')
+        with pytest.raises(PgctlUserMessage) as error:
+            app.log()
+        assert str(error.value).startswith('Invalid --grep pattern: ')
+
+
+class DescribeParseTime:
+    NOW = datetime.datetime(2015, 10, 16, 17, 5, 56)
+
+    @pytest.mark.parametrize('text, expected', (
+        ('2015-10-15T09:30', b'2015-10-15 09:30:00.000000'),
+        ('2015-10-15', b'2015-10-15 00:00:00.000000'),
+        ('09:30:15.5', b'2015-10-16 09:30:15.500000'),
+        ('90s', b'2015-10-16 17:04:26.000000'),
+        ('5m', b'2015-10-16 17:00:56.000000'),
+        ('1.5h', b'2015-10-16 15:35:56.000000'),
+        ('1d', b'2015-10-15 17:05:56.000000'),
+    ))
+    def it_understands_times_and_durations_ago(self, text, expected):
+        assert logs.parse_time(text, now=self.NOW) == expected
+
+    def it_rejects_nonsense(self):
+        with pytest.raises(PgctlUserMessage) as error:
+            logs.parse_time('yesterday')
+        assert str(error.value).startswith("Unrecognized time: 'yesterday'")
+
+
+def archive_name(time):
+    unix = int(time.timestamp())
+    return '@{:016x}{:08x}.s'.format(logs.TAI64_EPOCH + unix, 0)
+
+
+def it_picks_archives_by_their_rotation_times(tmpdir):
+    rotations = [datetime.datetime(2015, 10, 16, hour) for hour in (10, 12, 14)]
+    for time in rotations:
+        tmpdir.ensure(archive_name(time))
+    tmpdir.ensure('state')
+    current = tmpdir.ensure('current').strpath
+    ten, noon, two = (tmpdir.join(archive_name(time)).strpath for time in rotations)
+
+    def between(since, until):
+        return logs.logs_between(current, since and logs.parse_time(since), until and logs.parse_time(until))
+
+    assert between(None, None) == [ten, noon, two, current]
+    assert between('2015-10-16T12:30', None) == [two, current]
+    assert between(None, '2015-10-16T11:00') == [ten, noon]
+    assert between('2015-10-16T12:30', '2015-10-16T13:00') == [two]
+    assert between('2015-10-16T15:00', None) == [current]
+    assert logs.logs_between(tmpdir.join('nope', 'current').strpath, None, None) == []
+
+
+@pytest.mark.parametrize('time, expected', (
+    (b'2015-10-16 17:05:00', 0),
+    (b'2015-10-16 17:05:01', 0),
+    (b'2015-10-16 17:05:01.7', 1),
+    (b'2015-10-16 17:05:30', 29),
+    (b'2015-10-16 17:06', 100),
+))
+def it_binary_searches_for_a_time(tmpdir, time, expected):
+    path = write_log(tmpdir.join('current'), *(stamp(i) + b'  line %i' % i for i in range(1, 60)))
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log:
+        offset = logs.seek_time(log, time)
+        if expected == 100:
+            assert offset == len(log)
+        else:
+            assert log[offset:].startswith(stamp(expected + 1))
+
+
+def it_searches_archives_and_services(tmpdir):
+    sweet = tmpdir.join('sweet')
+    rotated = datetime.datetime(2015, 10, 16, 17, 5, 19)
+    write_log(sweet.join(archive_name(rotated)), *(stamp(i) + b'  sweet %i' % i for i in range(0, 20, 2)))
+    name_to_path = {
+        'sweet': write_log(sweet.join('current'), *(stamp(i) + b'  sweet %i' % i for i in range(20, 40, 2))),
+        'ohhi': write_log(tmpdir.join('ohhi', 'current'), *(stamp(i) + b'  ohhi %i' % i for i in range(1, 40, 2))),
+    }
+    out = io.BytesIO()
+    with mock.patch.object(logs, 'SEARCH_BLOCK', 100):
+        logs.search(name_to_path, b'2015-10-16 17:05:15', b'2015-10-16 17:05:23', re.compile(rb'[126]$'), out)
+    assert out.getvalue().decode('UTF-8') == """\
+[sweet] 2015-10-16 17:05:16.635827500  sweet 16
+[ohhi]  2015-10-16 17:05:21.635827500  ohhi 21
+[sweet] 2015-10-16 17:05:22.635827500  sweet 22
+"""
+
+
+def it_splits_lines_only_at_newlines(tmpdir):
+    name_to_path = {
+        'sweet': write_log(tmpdir.join('sweet', 'current'), stamp(1) + b'  progress: 50%\r100%', stamp(2) + b'  \x1c\x85done'),
+    }
+    out = io.BytesIO()
+    logs.search(name_to_path, None, None, None, out)
+    assert out.getvalue() == (
+        b'[sweet] 2015-10-16 17:05:01.635827500  progress: 50%\r100%\n'
+        b'[sweet] 2015-10-16 17:05:02.635827500  \x1c\x85done\n'
+    )
+
+
+class DescribeLastLines:
+
+    @pytest.mark.parametrize('content, count, expected', (
+        (b'', 3, []),
+        (b'one\n', 3, [b'one']),
+        (b'one\ntwo\nthree\nfour\n', 2, [b'three', b'four']),
+        (b'one\ntwo\npartial', 2, [b'two', b'partial']),
+        (b'one\n\n\n', 2, [b'', b'']),
+        (b'one\ntwo\n', 0, []),
+    ))
+    def it_reads_backwards_from_the_end(self, tmpdir, content, count, expected):
+        path = tmpdir.join('current')
+        path.write_binary(content)
+        assert logs.last_lines(path.strpath, count) == expected
+
+    def it_reads_on_into_the_newest_archive(self, tmpdir):
+        write_log(tmpdir.join(archive_name(datetime.datetime(2015, 10, 16, 10))), b'oldest')
+        write_log(tmpdir.join(archive_name(datetime.datetime(2015, 10, 16, 12))), b'one', b'two', b'three')
+        current = write_log(tmpdir.join('current'), b'four')
+        assert logs.last_lines(current, 3) == [b'two', b'three', b'four']
+        assert logs.last_lines(current, 1) == [b'four']
+
+    def it_is_empty_without_logs(self, tmpdir):
+        assert logs.last_lines(tmpdir.join('nope', 'current').strpath, 3) == []
+
+
+def it_shows_tails_like_tail_does(tmpdir):
+    with tmpdir.as_cwd():
+        write_log(tmpdir.join('ohhi', 'current'))
+        write_log(tmpdir.join('sweet', 'current'), b'sweet', b'sweet_error')
+        out = io.BytesIO()
+        logs.show_tails(('ohhi/current', 'sweet/current'), 30, out)
+    assert out.getvalue().decode('UTF-8') == '''\
+==> ohhi/current <==
+
+==> sweet/current <==
+sweet
+sweet_error
+'''
+
+
+@pytest.mark.parametrize('compress', (
+    'gzip',
+    pytest.param('zstd', marks=pytest.mark.skipif(not shutil.which('zstd'), reason='zstd is not installed')),
+))
+def it_reads_compressed_archives(tmpdir, compress):
+    import subprocess
+    from pgctl.service import LOG_PROCESSORS
+    rotated = datetime.datetime(2015, 10, 16, 17, 5, 3)
+    archive = tmpdir.join(archive_name(rotated))
+    # this is what s6-log does with the processor: our archive is its output
+    archive.write_binary(subprocess.check_output(
+        LOG_PROCESSORS[compress], shell=True, input=b''.join(stamp(i) + b'  old %i\n' % i for i in range(3)),
+    ))
+    current = write_log(tmpdir.join('current'), stamp(3) + b'  new 3')
+
+    assert logs.last_lines(current, 2) == [stamp(2) + b'  old 2', stamp(3) + b'  new 3']
+    out = io.BytesIO()
+    logs.search({'svc': current}, b'2015-10-16 17:05:01', None, None, out)
+    assert out.getvalue().count(b'\n') == 3
@@ -0,0 +1,95 @@
+import contextlib
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from pgctl.playground_index import PlaygroundIndex
+
+
+@pytest.fixture
+def pgdir(tmpdir):
+    pgdir = tmpdir.ensure_dir('playground')
+    pgdir.ensure_dir('b')
+    pgdir.ensure_dir('a')
+    pgdir.ensure('pre-start')
+    yield pgdir
+
+
+@pytest.fixture
+def index_path(tmpdir):
+    yield tmpdir.join('pghome', 'index.json')
+
+
+@contextlib.contextmanager
+def loaded(pgdir, index_path):
+    """A fresh index, as a command sees it, and saved as at the end of that command."""
+    index = PlaygroundIndex(pgdir, index_path)
+    yield index
+    index.save()
+
+
+def it_lists_service_directories(pgdir, index_path):
+    assert PlaygroundIndex(pgdir, index_path).service_names == ('a', 'b')
+    assert not index_path.check()
+    with loaded(pgdir, index_path) as index:
+        assert index.service_names == ('a', 'b')
+    assert index_path.check(file=True)
+
+
+def it_rescans_when_the_playground_changes(pgdir, index_path):
+    with loaded(pgdir, index_path) as index:
+        assert index.service_names == ('a', 'b')
+    pgdir.ensure_dir('c')
+    os.utime(pgdir.strpath, ns=(0, 0))
+    assert PlaygroundIndex(pgdir, index_path).service_names == ('a', 'b', 'c')
+
+
+def it_reads_only_the_index_when_nothing_changed(pgdir, index_path):
+    PlaygroundIndex(pgdir, index_path).save()
+    index_path.write(index_path.read().replace('"b"', '"not-really-b"'))
+    assert PlaygroundIndex(pgdir, index_path).service_names == ('a', 'not-really-b')
+
+
+def it_caches_service_settings(pgdir, index_path):
+    pgdir.join('a', 'timeout-stop').write('5')
+    with loaded(pgdir, index_path) as index:
+        assert index.settings('a').timeout_stop == 5.0
+    assert '"timeout_stop": 5.0' in index_path.read()
+
+    pgdir.join('a', 'timeout-stop').write('10')
+    assert PlaygroundIndex(pgdir, index_path).settings('a').timeout_stop == 10.0
+
+
+def it_saves_once_however_many_settings_it_parses(pgdir, index_path):
+    for name in 'cdefg':
+        pgdir.ensure_dir(name)
+    index = PlaygroundIndex(pgdir, index_path)
+    with mock.patch('pgctl.playground_index.write_json') as write_json:
+        for name in index.service_names:
+            index.settings(name)
+        index.save()
+        index.save()
+    assert write_json.call_count == 1
+    assert sorted(write_json.call_args[0][1]['settings']) == list('abcdefg')
+
+
+def it_memoizes_alias_expansion(pgdir, index_path):
+    calls = []
+
+    def expand(name):
+        calls.append(name)
+        return [name, 'x']
+
+    def expand_alias(aliases, name):
+        with loaded(pgdir, index_path) as index:
+            return index.expand_alias(aliases, name, expand)
+
+    assert expand_alias('{}', 'a') == ('a', 'x')
+    assert expand_alias('{}', 'a') == ('a', 'x')
+    assert expand_alias('{}', 'b') == ('b', 'x')
+    # a change to the aliases forgets every expansion
+    assert expand_alias('{"a": ["b"]}', 'a') == ('a', 'x')
+    assert calls == ['a', 'b', 'a']
+    assert list(json.loads(index_path.read())['aliases']) == ['a']
@@ -68,3 +68,20 @@ def test_main_coverage_hack():
     ), pytest.raises(CoverageHackException):
         mock_exec.side_effect = CoverageHackException
         poll_ready.main()
+
+
+def it_listens_for_down_in_the_supervisors_event_dir(tmpdir):
+    """A replacement runs in the service directory, but is supervised (and stopped) from its replica."""
+    tmpdir.join('notification-fd').write('5\n')
+    event_dir = tmpdir.ensure_dir('replica', 'event')
+
+    class Execed(Exception):
+        pass
+
+    with mock.patch.object(poll_ready, 'exec_', autospec=True, side_effect=Execed), mock.patch.object(
+            os, 'fork', return_value=1,
+    ), mock.patch.dict(os.environ, {'PGCTL_EVENT_DIR': str(event_dir)}), pytest.raises(Execed):
+        os.environ.pop('PGCTL_DEBUG', None)
+        poll_ready.main()
+    fifo, = event_dir.listdir()
+    assert fifo.basename.startswith('ftrig1poll_ready_')
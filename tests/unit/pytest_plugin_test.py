@@ -0,0 +1,97 @@
+import pytest
+
+from pgctl.api import ServiceStatus
+from pgctl.pytest_plugin import copy_playground
+from pgctl.pytest_plugin import PlaygroundSession
+
+
+def status(state):
+    return ServiceStatus(state, None, None, 0, None)
+
+
+class FakePlayground:
+
+    def __init__(self, **states):
+        self.states = states
+        self.calls = []
+
+    def status(self, *services):
+        return {name: status(self.states[name]) for name in services or sorted(self.states)}
+
+    def _change(self, command, services, state):
+        self.calls.append((command,) + services)
+        for name in services:
+            self.states[name] = state
+
+    def start(self, *services):
+        self._change('start', services, 'ready')
+
+    def restart(self, *services):
+        self._change('restart', services, 'ready')
+
+    def stop(self, *services, check=True):
+        self._change('stop', services, 'down')
+
+
+class DescribePlaygroundSession:
+
+    def it_starts_only_what_is_not_running(self):
+        playground = FakePlayground(web='ready', db='down')
+        session = PlaygroundSession(playground)
+        running = session.acquire(('web', 'db'))
+        assert running.names == ('web', 'db')
+        assert playground.calls == [('start', 'db')]
+
+        session.close()
+        # web was running before we came along
+        assert playground.calls[-1] == ('stop', 'db')
+
+    def it_restarts_only_what_crashed(self):
+        playground = FakePlayground(web='down', db='down')
+        running = PlaygroundSession(playground).acquire(('web', 'db'))
+        # the first test gets the services just as they were started
+        assert running.check() == ()
+
+        playground.states['db'] = 'down'
+        assert running.check() == ('db',)
+        assert playground.calls[-1] == ('restart', 'db')
+        assert running.check() == ()
+        assert running.restarts == 1
+
+    def it_stops_services_once_nothing_uses_them(self):
+        playground = FakePlayground(web='down', db='down')
+        session = PlaygroundSession(playground)
+        both = session.acquire(('web', 'db'))
+        web = session.acquire(('web',))
+
+        session.release(both)
+        assert playground.calls[-1] == ('stop', 'db')
+        session.release(web)
+        assert playground.calls[-1] == ('stop', 'web')
+
+        session.close()
+        assert playground.calls.count(('stop', 'web')) == 1
+
+
+def it_copies_a_playground_without_pgctl_state(tmpdir):
+    tmpdir.ensure('playground', 'web', 'run')
+    tmpdir.ensure('playground', 'web', 'logs', 'current')
+    tmpdir.join('playground', 'web', 'supervise').mksymlinkto('/somewhere')
+    tmpdir.join('playground', 'web', '.pgctl.lock').ensure()
+
+    copy_playground(tmpdir.join('playground').strpath, tmpdir.join('copy').strpath)
+    assert sorted(path.basename for path in tmpdir.join('copy', 'web').listdir()) == ['run']
+
+
+@pytest.mark.parametrize('enabled', (True, False))
+def it_is_loaded_only_when_asked_for(pytester, enabled):
+    if enabled:
+        pytester.makeconftest("pytest_plugins = ['pgctl.pytest_plugin']")
+    pytester.makepyfile(test_plugin=f"""
+        def test_plugin(request):
+            assert ('_pgctl_health_check' in request.fixturenames) is {enabled}
+    """)
+    pytester.runpytest().assert_outcomes(passed=1)
+
+    fixtures = pytester.runpytest('--fixtures').stdout.str()
+    assert ('pgctl_playground' in fixtures) is enabled
@@ -0,0 +1,113 @@
+import os
+from unittest import mock
+
+import pytest
+
+from pgctl import scaffold
+from pgctl.errors import InTheWay
+
+
+class DescribeEnsureFile:
+
+    def it_writes_only_when_content_or_mode_differ(self, tmpdir):
+        path = tmpdir.join('run').strpath
+        assert scaffold.ensure_file(path, b'hello\n', mode=0o755) is True
+        inode = os.stat(path).st_ino
+
+        assert scaffold.ensure_file(path, b'hello\n', mode=0o755) is False
+        assert os.stat(path).st_ino == inode
+
+        assert scaffold.ensure_file(path, b'hello\n', mode=0o644) is True
+        assert oct(os.stat(path).st_mode & 0o777) == oct(0o644)
+
+        assert scaffold.ensure_file(path, b'bye\n', mode=0o644) is True
+        assert tmpdir.join('run').read() == 'bye\n'
+        assert not tmpdir.listdir('*.pgctl-tmp.*')
+
+
+class DescribeWriteJson:
+
+    def it_makes_the_directory_and_leaves_no_temporary_behind(self, tmpdir):
+        path = tmpdir.join('scratch', 'record.json').strpath
+        scaffold.write_json(path, {'a': [1, 2]})
+        assert tmpdir.join('scratch', 'record.json').read() == '{"a": [1, 2]}'
+        assert tmpdir.join('scratch').listdir() == [tmpdir.join('scratch', 'record.json')]
+
+    def it_writes_nothing_it_cannot_serialize(self, tmpdir):
+        path = tmpdir.join('record.json')
+        path.write('[]')
+        with pytest.raises(TypeError):
+            scaffold.write_json(path.strpath, {'a': object()})
+        assert path.read() == '[]'
+
+
+class DescribeEnsureSymlink:
+
+    def it_creates_and_repoints_links(self, tmpdir):
+        link = tmpdir.join('supervise')
+        assert scaffold.ensure_symlink('/a', link) is True
+        assert scaffold.ensure_symlink('/a', link) is False
+        assert scaffold.ensure_symlink('/b', link) is True
+        assert link.readlink() == '/b'
+
+    def it_replaces_regular_files(self, tmpdir):
+        link = tmpdir.ensure('supervise')
+        assert scaffold.ensure_symlink('/a', link) is True
+        assert link.readlink() == '/a'
+
+    def it_replaces_empty_directories(self, tmpdir):
+        link = tmpdir.ensure_dir('supervise')
+        assert scaffold.ensure_symlink('/a', link) is True
+        assert link.readlink() == '/a'
+
+    def it_reports_a_directory_in_the_way(self, tmpdir):
+        link = tmpdir.ensure_dir('logs')
+        link.ensure('current')
+        with pytest.raises(InTheWay) as error:
+            scaffold.ensure_symlink('/a', link)
+        assert str(error.value) == (
+            'pgctl needs a symlink at %s, but there is a directory there: please move it aside' % link
+        )
+        assert link.join('current').check()
+        assert not tmpdir.listdir('*.pgctl-tmp.*')
+
+    def it_cleans_up_when_it_cannot_link(self, tmpdir):
+        link = tmpdir.join('supervise')
+        with mock.patch.object(os, 'replace', side_effect=PermissionError):
+            with pytest.raises(PermissionError):
+                scaffold.ensure_symlink('/a', link)
+        assert not tmpdir.listdir('*.pgctl-tmp.*')
+
+
+class DescribeFingerprint:
+
+    def it_matches_until_the_watched_dir_changes(self, tmpdir):
+        watched = tmpdir.ensure_dir('service')
+        fingerprint = scaffold.Fingerprint(tmpdir.join('scratch', 'fp.json'), 'spec', (watched,))
+        assert fingerprint.matches() is False
+
+        fingerprint.record()
+        assert fingerprint.matches() is True
+
+        watched.ensure('ready')
+        os.utime(watched.strpath, ns=(0, 0))
+        assert fingerprint.matches() is False
+
+    def it_mismatches_on_spec_change(self, tmpdir):
+        watched = tmpdir.ensure_dir('service')
+        scaffold.Fingerprint(tmpdir.join('fp.json'), ['spec', 1], (watched,)).record()
+        assert scaffold.Fingerprint(tmpdir.join('fp.json'), ['spec', 1], (watched,)).matches() is True
+        assert scaffold.Fingerprint(tmpdir.join('fp.json'), ['spec', 2], (watched,)).matches() is False
+
+    def it_notices_a_managed_file_rewritten_in_place(self, tmpdir):
+        watched = tmpdir.ensure_dir('service')
+        run = watched.join('run')
+        run.write('exec s6-log\n')
+        fingerprint = scaffold.Fingerprint(tmpdir.join('fp.json'), 'spec', (watched, run))
+        fingerprint.record()
+
+        mtime = run.stat().mtime_ns
+        run.write('exec s6-log -b\n')
+        # as if the filesystem's mtimes were too coarse to notice
+        os.utime(run.strpath, ns=(mtime, mtime))
+        assert fingerprint.matches() is False
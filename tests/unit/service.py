@@ -1,8 +1,343 @@
-from py._path.local import LocalPath as Path
+import os
+import sys
+import time
+import timeit
+from unittest import mock
 
+import pytest
+
+from pgctl.daemontools import SvStat
+from pgctl.errors import NotReady
+from pgctl.service import LogRotation
 from pgctl.service import Service
+from pgctl.service import SharedLogger
 
 
 def test_str_and_repr():
-    service = Service(Path('/tmp/magic-service'), Path('/tmp/magic-service-scratch'), None, True)
+    service = Service('/tmp/magic-service', '/tmp/magic-service-scratch', None, True)
     assert str(service) == 'magic-service'
+    assert repr(service) == "Service('/tmp/magic-service')"
+
+
+def test_paths_are_strings():
+    service = Service('/tmp/magic-service', '/tmp/magic-service-scratch', None, True)
+    assert service.path == '/tmp/magic-service'
+    assert service.logger_path == '/tmp/magic-service/.log'
+    assert service.logfile_path == '/tmp/magic-service/logs/current'
+
+
+def test_equality_is_by_path():
+    service = Service('/tmp/magic-service', '/tmp/magic-service-scratch', None, True)
+    assert service == Service('/tmp/magic-service', '/elsewhere', 3, False)
+    assert service != Service('/tmp/other-service', '/tmp/magic-service-scratch', None, True)
+    assert len({service, Service('/tmp/magic-service', '/elsewhere', 3, False)}) == 1
+
+
+def test_many_services_are_cheap():
+    """A microbenchmark: a large playground shouldn't cost much before we've even touched the disk."""
+    def construct_and_query():
+        for i in range(1000):
+            service = Service(f'/tmp/playground/service{i}', f'/tmp/pghome/tmp/playground/service{i}', None, True)
+            service.name, service.logfile_path, service.lock_path, service.logger_path, hash(service)
+
+    # typically ~2ms; with py.path, this was ~20ms
+    assert min(timeit.repeat(construct_and_query, number=1, repeat=5)) < 0.05
+
+
+class DescribeStateDir:
+
+    def it_keeps_state_in_the_service_dir_by_default(self, tmpdir):
+        service = Service(tmpdir.ensure_dir('svc'), tmpdir.join('scratch'), None, True)
+        assert service.state_path == service.path
+        assert service.lock_path == tmpdir.join('svc', '.pgctl.lock').strpath
+        assert service.logfile_path == tmpdir.join('svc', 'logs', 'current').strpath
+
+    def it_symlinks_logs_and_locks_into_the_state_dir(self, tmpdir):
+        service = Service(
+            tmpdir.ensure_dir('svc'), tmpdir.join('scratch'), None, True, state_dir=tmpdir.join('state'),
+        )
+        service.ensure_logs()
+        assert service.ensure_lock() == tmpdir.join('state', '.pgctl.lock').strpath
+
+        assert tmpdir.join('state', 'logs', 'current').check(file=True)
+        assert tmpdir.join('svc', 'logs').readlink() == tmpdir.join('state', 'logs').strpath
+        assert tmpdir.join('svc', '.pgctl.lock').readlink() == tmpdir.join('state', '.pgctl.lock').strpath
+        assert tmpdir.join('svc', '.log', 'run').read().endswith(
+            'exec s6-log -b n5 s10485760 T {}\n'.format(tmpdir.join('state', 'logs')),
+        )
+
+    def it_migrates_existing_logs(self, tmpdir):
+        tmpdir.ensure('svc', 'logs', 'current').write('old log line\n')
+        service = Service(
+            tmpdir.join('svc'), tmpdir.join('scratch'), None, True, state_dir=tmpdir.join('state'),
+        )
+        service.ensure_logs()
+        assert tmpdir.join('svc', 'logs').check(link=True)
+        assert tmpdir.join('state', 'logs', 'current').read() == 'old log line\n'
+
+
+class DescribeSharedLogger:
+
+    @pytest.fixture
+    def logger(self, tmpdir):
+        return SharedLogger(tmpdir.ensure_dir('logger'))
+
+    def it_stops_when_idle(self, logger):
+        up = [True, True, False]
+        with mock.patch('pgctl.service.svc') as svc, mock.patch('pgctl.service.svok', side_effect=lambda path: up.pop(0)):
+            logger.stop_if_idle(1)
+        svc.assert_called_once_with(('-dx', logger.path))
+
+    def it_kills_a_logger_that_will_not_stop(self, logger):
+        killed = []
+
+        def svc(args):
+            if args[0] == '-kx':
+                killed.append(True)
+
+        with mock.patch('pgctl.service.svc', side_effect=svc), mock.patch(
+                'pgctl.service.svok', side_effect=lambda path: not killed,
+        ):
+            logger.stop_if_idle(.05)
+        assert killed
+
+    def it_gives_up_on_a_logger_that_will_not_die(self, logger):
+        with mock.patch('pgctl.service.svc'), mock.patch('pgctl.service.svok', return_value=True):
+            with pytest.raises(NotReady) as error:
+                logger.stop_if_idle(.05)
+        assert str(error.value) == f'the shared logger did not stop, even once killed: see {logger.path}/errors'
+
+    def it_leaves_a_logger_that_has_services(self, logger, tmpdir):
+        tmpdir.ensure('logger', 'sources', 'web.json')
+        with mock.patch('pgctl.service.svc') as svc:
+            logger.stop_if_idle(1)
+        assert not svc.called
+
+
+class DescribeNotificationFd:
+
+    def it_writes_the_manifests_for_s6(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write('notification-fd: 5\n')
+        service = Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True)
+        assert service.settings.uses_notification
+        service.ensure_directory_structure()
+        assert tmpdir.join('svc', 'notification-fd').read() == '5\n'
+
+    def it_notices_a_manifest_edited_in_place(self, tmpdir):
+        manifest = tmpdir.ensure_dir('svc').join('service.yaml')
+        manifest.write('timeout-ready: 5\n')
+        Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True).ensure_directory_structure()
+        assert not tmpdir.join('svc', 'notification-fd').exists()
+
+        manifest.write('notification-fd: 4\n')
+        Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True).ensure_directory_structure()
+        assert tmpdir.join('svc', 'notification-fd').read() == '4\n'
+
+    def it_rewrites_the_file_when_the_manifest_changes(self, tmpdir):
+        service_dir = tmpdir.ensure_dir('svc')
+        service_dir.join('service.yaml').write('notification-fd: 5\n')
+        service_dir.join('notification-fd').write('3')
+        service = Service(service_dir, tmpdir.join('scratch'), None, True)
+        assert service.settings.notification_fd == 5
+        service.ensure_directory_structure()
+        assert service_dir.join('notification-fd').read() == '5\n'
+
+    def it_leaves_a_file_without_a_manifest_entry_alone(self, tmpdir):
+        service_dir = tmpdir.ensure_dir('svc')
+        service_dir.join('ready').write('exit 0\n')
+        service_dir.join('notification-fd').write('4')
+        Service(service_dir, tmpdir.join('scratch'), None, True).ensure_directory_structure()
+        assert service_dir.join('notification-fd').read() == '4'
+
+    def it_writes_one_for_a_ready_script(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('ready').write('exit 0\n')
+        Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True).ensure_directory_structure()
+        assert tmpdir.join('svc', 'notification-fd').read() == '3\n'
+
+
+class DescribeLogRotation:
+
+    def it_defaults_to_the_playground_rotation(self, tmpdir):
+        service = Service(
+            tmpdir.ensure_dir('svc'), tmpdir.join('scratch'), None, True,
+            default_log_rotation=LogRotation(archives=10, total_size=1 << 30),
+        )
+        assert service.log_run_script.endswith(
+            'exec s6-log -b n10 s10485760 S1073741824 T {}\n'.format(tmpdir.join('svc', 'logs')),
+        )
+
+    def it_can_be_overridden_by_the_manifest(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write('log-archive-size: 1M\nlog-compress: gzip\n')
+        service = Service(
+            tmpdir.join('svc'), tmpdir.join('scratch'), None, True,
+            default_log_rotation=LogRotation(compress='zstd'),
+        )
+        assert service.log_rotation == LogRotation(archive_size=1 << 20, compress='gzip')
+        assert "s6-log -b n5 s1048576 '!gzip -c' T " in service.log_run_script
+
+    def it_can_turn_off_compression(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write('log-compress: none\n')
+        service = Service(
+            tmpdir.join('svc'), tmpdir.join('scratch'), None, True,
+            default_log_rotation=LogRotation(compress='zstd'),
+        )
+        assert 'exec s6-log -b n5 s10485760 T ' in service.log_run_script
+
+
+class DescribeLogFilter:
+
+    def it_needs_no_filter_by_default(self, tmpdir):
+        service = Service(tmpdir.ensure_dir('svc'), tmpdir.join('scratch'), None, True)
+        assert service.log_filter == []
+        assert 'pgctl-log-filter' not in service.log_run_script
+
+    def it_filters_by_the_manifest_policy(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write(
+            'log-rate-lines: 100\nlog-rate-bytes: 1M\nlog-sample: 10\nlog-sample-match: "^DEBUG "\n',
+        )
+        service = Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True)
+        assert service.log_run_script.endswith(
+            "exec pgctl-log-filter --lines 100 --bytes 1048576 --sample 10 --match '^DEBUG ' -- "
+            's6-log -b n5 s10485760 T {}\n'.format(tmpdir.join('svc', 'logs')),
+        )
+
+    def it_ignores_a_match_without_sampling(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write('log-rate-lines: 100\nlog-sample-match: DEBUG\n')
+        service = Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True)
+        assert service.log_filter == ['--lines', '100']
+
+
+class DescribeReload:
+
+    @pytest.fixture
+    def service(self, tmpdir):
+        tmpdir.ensure_dir('svc').join('service.yaml').write('reload-signal: USR1\nreload-ready: true\n')
+        service = Service(tmpdir.join('svc'), tmpdir.join('scratch'), None, True)
+        with mock.patch.object(Service, 'svstat', return_value=SvStat('ready', 123, None, 5, None)):
+            yield service
+
+    def it_signals_through_the_supervisor(self, service):
+        with mock.patch('pgctl.service.svc') as svc:
+            service.reload()
+        svc.assert_called_once_with(('-1', service.path))
+
+    def it_waits_for_the_service_to_notify_that_it_reloaded(self, service):
+        notification = service.listen_for_reload()
+        path = service.supervise_env('lock', False)['PGCTL_RELOAD_NOTIFICATION']
+        with pytest.raises(NotReady) as error:
+            service.assert_reloaded(time.time() - 1, notification)
+        assert str(error.value) == 'it has not yet notified that it reloaded'
+
+        # as the service does, once reloaded: a line, as to its notification-fd
+        with open(path, 'w') as fifo:
+            fifo.write('reloaded\n')
+        service.assert_reloaded(time.time() - 1, notification)
+
+        service.stop_listening_for_reload(notification)
+        assert not os.path.exists(path)
+
+    def it_does_not_hear_an_earlier_reload(self, service):
+        service.stop_listening_for_reload(service.listen_for_reload())
+        with open(service.reload_notification_path, 'w') as stale:
+            stale.write('reloaded\n')
+        notification = service.listen_for_reload()
+        with pytest.raises(NotReady):
+            service.assert_reloaded(time.time() - 1, notification)
+        service.stop_listening_for_reload(notification)
+
+    def it_only_delays_a_service_that_cannot_acknowledge(self, service, tmpdir):
+        tmpdir.join('svc', 'service.yaml').write('reload-signal: USR1\npoll-ready: 0.5\n')
+        service._settings = None
+        assert service.listen_for_reload() is None
+        with pytest.raises(NotReady) as error:
+            service.assert_reloaded(time.time() - 0.25)
+        assert str(error.value) == 'it was only just signalled to reload'
+        service.assert_reloaded(time.time() - 0.5)
+
+    def it_waits_for_the_ready_script(self, service, tmpdir):
+        ready = tmpdir.join('svc', 'ready')
+        ready.write('#!/bin/sh\ntest -e reloaded\n')
+        ready.chmod(0o755)
+        service._settings = None
+        with pytest.raises(NotReady):
+            service.assert_reloaded(time.time() - 1)
+        tmpdir.join('svc', 'reloaded').ensure()
+        service.assert_reloaded(time.time() - 1)
+
+    def it_waits_for_a_service_that_is_slow_to_reload(self, service, tmpdir):
+        # the old configuration is still being served, and was loaded before the signal
+        loaded_at = tmpdir.join('svc', 'loaded-at')
+        loaded_at.write(repr(time.time() - 5))
+        ready = tmpdir.join('svc', 'ready')
+        ready.write(
+            '#!%s\nimport os, sys\n'
+            'sys.exit(float(open("loaded-at").read()) < float(os.environ["PGCTL_RELOAD_TIME"]))\n' % sys.executable,
+        )
+        ready.chmod(0o755)
+        service._settings = None
+        since = time.time() - 1
+        with pytest.raises(NotReady) as error:
+            service.assert_reloaded(since)
+        assert str(error.value) == 'its ready script did not succeed, after reloading'
+        loaded_at.write(repr(time.time()))
+        service.assert_reloaded(since)
+
+
+class DescribeReplacement:
+
+    @pytest.fixture
+    def popen(self):
+        with mock.patch('pgctl.service.Popen') as popen:
+            yield popen
+
+    @pytest.fixture
+    def service(self, tmpdir, popen):
+        service_dir = tmpdir.ensure_dir('svc')
+        service_dir.join('run').write('#!/bin/sh\nexec sleep infinity\n')
+        service_dir.join('notification-fd').write('3\n')
+        service = Service(service_dir, tmpdir.join('scratch'), None, True)
+        service.ensure_exists()
+        return service
+
+    def it_starts_from_a_replica(self, service, tmpdir, popen):
+        replica = service.start_replacement()
+        assert replica == str(tmpdir.join('scratch', 'replica.0'))
+        (argv,), kwargs = popen.call_args
+        assert argv == ('s6-supervise', replica)
+        assert kwargs['env']['PGCTL_SERVICE'] == service.path
+        # so its pgctl-poll-ready hears when the replacement, rather than the original, goes down
+        assert kwargs['env']['PGCTL_EVENT_DIR'] == replica + '/event'
+        assert tmpdir.join('scratch', 'replica.0', 'run').read().endswith(
+            'cd {} && exec ./run "$@"\n'.format(service.path),
+        )
+        assert tmpdir.join('scratch', 'replica.0', 'notification-fd').read() == '3\n'
+        assert not tmpdir.join('scratch', 'replica.0', 'finish').exists()
+
+    def it_takes_the_place_of_the_original(self, service, tmpdir):
+        supervise = tmpdir.join('scratch', 'supervise')
+        assert service.replica_path is None
+
+        first = service.start_replacement()
+        service.adopt_replacement(first)
+        assert supervise.readlink() == first + '/supervise'
+        assert service.replica_path == first
+        # the service directory's own symlink is untouched
+        assert tmpdir.join('svc', 'supervise').readlink() == str(supervise)
+
+        second = service.start_replacement()
+        assert second == str(tmpdir.join('scratch', 'replica.1'))
+        service.adopt_replacement(second)
+        assert service.replica_path == second
+        assert not tmpdir.join('scratch', 'replica.0').exists()
+
+        service._forget_replica()
+        assert service.replica_path is None and supervise.isdir()
+        assert not tmpdir.join('scratch', 'replica.1').exists()
+
+    def it_abandons_a_failed_replacement(self, service, tmpdir):
+        replica = service.start_replacement()
+        with mock.patch('pgctl.service.svc') as svc:
+            service.abandon_replacement(replica)
+        svc.assert_called_once_with(('-kx', replica))
+        assert not tmpdir.join('scratch', 'replica.0').exists()
+        assert service.replica_path is None
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+from testfixtures import ShouldRaise
+
+from pgctl import settings
+from pgctl.settings import InvalidManifest
+from pgctl.settings import ServiceSettings
+
+
+@pytest.fixture
+def service_dir(tmpdir):
+    yield tmpdir.ensure_dir('service')
+
+
+@pytest.fixture
+def scratch_dir(tmpdir):
+    yield tmpdir.join('scratch')
+
+
+class DescribeParse:
+
+    def it_defaults_to_nothing(self, service_dir):
+        assert settings.parse(service_dir.strpath) == ServiceSettings(has_ready_script=False)
+
+    def it_reads_legacy_files(self, service_dir):
+        service_dir.join('timeout-ready').write('30\n')
+        service_dir.join('notification-fd').write('5\n')
+        service_dir.ensure('ready')
+        result = settings.parse(service_dir.strpath)
+        assert result.timeout_ready == 30.0
+        assert result.notification_fd == 5
+        assert result.timeout_stop is None
+        assert result.uses_notification is True
+
+    def it_reads_the_manifest(self, service_dir):
+        service_dir.join('service.yaml').write('timeout-stop: 10\npoll-down: .5\n')
+        result = settings.parse(service_dir.strpath)
+        assert result.timeout_stop == 10.0
+        assert result.poll_down == 0.5
+        assert result.uses_notification is False
+
+    def it_prefers_legacy_files_over_the_manifest(self, service_dir):
+        service_dir.join('service.yaml').write('timeout-stop: 10\n')
+        service_dir.join('timeout-stop').write('3')
+        assert settings.parse(service_dir.strpath).timeout_stop == 3.0
+
+    def it_reads_log_rotation(self, service_dir):
+        service_dir.join('service.yaml').write('log-archives: 20\nlog-archive-size: 1M\nlog-total-size: 64m\nlog-compress: zstd\n')
+        result = settings.parse(service_dir.strpath)
+        assert (result.log_archives, result.log_archive_size, result.log_total_size, result.log_compress) == (
+            20, 1 << 20, 64 << 20, 'zstd',
+        )
+
+    def it_reads_the_log_policy(self, service_dir):
+        service_dir.join('service.yaml').write(
+            'log-rate-lines: 100\nlog-rate-bytes: 64k\nlog-sample: 10\nlog-sample-match: DEBUG\n',
+        )
+        result = settings.parse(service_dir.strpath)
+        assert (result.log_rate_lines, result.log_rate_bytes, result.log_sample, result.log_sample_match) == (
+            100, 64 << 10, 10, 'DEBUG',
+        )
+
+    def it_reads_how_to_reload(self, service_dir):
+        service_dir.join('service.yaml').write('reload-signal: hup\nreload-ready: yes\n')
+        result = settings.parse(service_dir.strpath)
+        assert (result.reload_signal, result.reload_ready) == ('HUP', True)
+
+        service_dir.join('reload-signal').write('SIGUSR2\n')
+        assert settings.parse(service_dir.strpath).reload_signal == 'USR2'
+
+    @pytest.mark.parametrize('manifest', (
+        '- 1\n',
+        'timeout-whenever: 3\n',
+        'timeout-stop: soon\n',
+        'log-archive-size: 10X\n',
+        'log-archives: -1\n',
+        'log-compress: rar\n',
+        'log-sample-match: "[unclosed"\n',
+        'reload-signal: KILL\n',
+        'reload-ready: maybe\n',
+    ))
+    def it_rejects_bad_manifests(self, service_dir, manifest):
+        service_dir.join('service.yaml').write(manifest)
+        with ShouldRaise(InvalidManifest):
+            settings.parse(service_dir.strpath)
+
+
+class DescribeLoad:
+
+    def it_caches_in_the_scratch_dir(self, service_dir, scratch_dir):
+        service_dir.join('timeout-ready').write('30')
+        assert settings.load(service_dir, scratch_dir).timeout_ready == 30.0
+        assert scratch_dir.join('settings.json').check(file=True)
+
+        # a valid cache means we don't read the file again
+        scratch_dir.join('settings.json').write(
+            scratch_dir.join('settings.json').read().replace('30.0', '31.0'),
+        )
+        assert settings.load(service_dir, scratch_dir).timeout_ready == 31.0
+
+    def it_notices_edits_in_place(self, service_dir, scratch_dir):
+        timeout = service_dir.join('timeout-ready')
+        timeout.write('30')
+        assert settings.load(service_dir, scratch_dir).timeout_ready == 30.0
+
+        timeout.write('300')
+        assert settings.load(service_dir, scratch_dir).timeout_ready == 300.0
+
+    def it_notices_new_files(self, service_dir, scratch_dir):
+        assert settings.load(service_dir, scratch_dir).timeout_stop is None
+        service_dir.join('timeout-stop').write('7')
+        os.utime(service_dir.strpath, ns=(0, 0))
+        assert settings.load(service_dir, scratch_dir).timeout_stop == 7.0